@@ -1,26 +1,42 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, UploadFile, File, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Query, UploadFile, File, Depends, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne, DeleteOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, TypeAdapter
 from typing import List, Optional, Dict, Any, Union
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from decimal import Decimal
 import json
 import base64
 import io
 import csv
+import bisect
+import difflib
+import hashlib
+import html
+import codecs
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 import calendar
 import bcrypt
 import secrets
+import typer
+import re
+import numpy as np
+import pandas as pd
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,7 +47,7 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI(title="QBClone Accounting API", version="1.0")
+app = FastAPI(title="QBClone Accounting API", version="1.0", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -444,6 +460,9 @@ class TransactionCreate(BaseModel):
     deposit_to_account_id: Optional[str] = None
     memo: Optional[str] = None
 
+class TransactionBatchItem(TransactionCreate):
+    idempotency_key: Optional[str] = None  # Rows with a previously used key are reported as duplicates
+
 class JournalEntry(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     transaction_id: str
@@ -454,6 +473,59 @@ class JournalEntry(BaseModel):
     date: datetime
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Period close models
+class AccountBalanceSnapshot(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    period: str  # YYYY-MM
+    account_id: str
+    period_start: datetime
+    period_end: datetime  # Exclusive: first instant of the following month
+    period_debit: float = 0.0
+    period_credit: float = 0.0
+    debit_total: float = 0.0  # Cumulative through period_end
+    credit_total: float = 0.0  # Cumulative through period_end
+    closing_balance: float = 0.0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PeriodClose(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    period: str  # YYYY-MM
+    period_start: datetime
+    period_end: datetime
+    status: str = "Closed"  # Closed, Reopened
+    closed_by: Optional[str] = None
+    closed_at: datetime = Field(default_factory=datetime.utcnow)
+    reopened_at: Optional[datetime] = None
+    accounts_snapshotted: int = 0
+    income: float = 0.0
+    expenses: float = 0.0
+    transaction_count: int = 0
+
+class PeriodCloseCreate(BaseModel):
+    period: str
+    closed_by: Optional[str] = None
+
+class PeriodReopenRequest(BaseModel):
+    user_id: str
+    reason: str
+
+# Open item models
+class OpenItem(BaseModel):
+    id: str  # Same id as the source transaction
+    transaction_type: TransactionType
+    transaction_number: Optional[str] = None
+    customer_id: Optional[str] = None
+    vendor_id: Optional[str] = None
+    date: datetime
+    due_date: Optional[datetime] = None
+    reference_number: Optional[str] = None
+    payment_method: Optional[PaymentMethod] = None
+    memo: Optional[str] = None
+    total: float = 0.0
+    balance: float = 0.0  # Amount still due, or still to deposit for payments
+    status: str = "Open"
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class MemorizedTransaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -503,6 +575,10 @@ class BankTransaction(BaseModel):
     reconciled: bool = False
     reconciliation_id: Optional[str] = None
     bank_transaction_id: Optional[str] = None  # From bank feed
+    fingerprint: Optional[str] = None  # Import dedupe key, unique per account
+    content_hash: Optional[str] = None  # Hash of date, amount and description, with or without a FITID
+    matched_journal_entry_id: Optional[str] = None  # Ledger line this bank line was matched to
+    matched_transaction_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class BankTransactionCreate(BaseModel):
@@ -544,13 +620,46 @@ class BankImportTransaction(BaseModel):
     check_number: Optional[str] = None
     category: Optional[str] = None
     balance: Optional[float] = None
+    fitid: Optional[str] = None  # Bank's unique id for the transaction (OFX/QFX)
+
+class BankStatementInfo(BaseModel):
+    """Account and balance details from an OFX/QFX statement header"""
+    bank_id: Optional[str] = None
+    account_number: Optional[str] = None
+    account_type: Optional[str] = None
+    currency: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    ledger_balance: Optional[float] = None
+    ledger_balance_date: Optional[datetime] = None
+    available_balance: Optional[float] = None
+    available_balance_date: Optional[datetime] = None
+
+class BankImportSession(BaseModel):
+    """A parsed upload whose rows are staged in bank_import_rows until confirmed"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    account_id: str
+    filename: str
+    file_format: str  # csv, ofx
+    total_transactions: int = 0
+    errors: List[str] = []
+    statements: List[BankStatementInfo] = []
+    status: str = "Staged"  # Staged, Confirming, Confirmed
+    claimed_at: Optional[datetime] = None  # When the current confirmation took the session
+    imported_transactions: Optional[int] = None
+    duplicate_transactions: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    confirmed_at: Optional[datetime] = None
 
 class BankImportResult(BaseModel):
+    session_id: Optional[str] = None
     total_transactions: int
     imported_transactions: int
     duplicate_transactions: int
     errors: List[str] = []
     preview_transactions: List[BankImportTransaction] = []
+    statements: List[BankStatementInfo] = []
 
 class AuditEntry(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -966,6 +1075,126 @@ def generate_session_token() -> str:
     """Generate a secure session token"""
     return secrets.token_urlsafe(32)
 
+# List pagination utilities
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+class PageParams:
+    """Keyset pagination query parameters shared by list endpoints"""
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+        order: Optional[str] = Query(None, pattern="^(asc|desc)$"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return instead of whole records")
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.order = order
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+def projection(fields) -> Dict[str, int]:
+    """Mongo projection returning only these fields, never _id"""
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+def encode_cursor(doc: Dict[str, Any], sort_field: str) -> str:
+    """Opaque cursor pointing just past doc in (sort_field, id) order"""
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([value, doc["id"]]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if isinstance(value, dict) and "$date" in value:
+        value = datetime.fromisoformat(value["$date"])
+    return value, doc_id
+
+async def find_page(
+    collection,
+    query: Dict[str, Any],
+    page: PageParams,
+    response: Response,
+    sort_field: str = "created_at",
+    default_order: str = "desc",
+    fields: Optional[List[str]] = None,
+    model: Optional[type] = None
+) -> List[Dict[str, Any]]:
+    """Fetch one page ordered by (sort_field, id).
+    
+    The next page resumes from the last row's sort key rather than skipping
+    rows, so every page costs the same index seek. When more rows remain the
+    cursor for the next page is returned in the X-Next-Cursor header.
+    Requested fields are checked against model before anything is queried.
+    """
+    if page.fields and model:
+        unknown = [field for field in page.fields if field not in model.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    direction = -1 if (page.order or default_order) == "desc" else 1
+    if page.cursor:
+        value, doc_id = decode_cursor(page.cursor)
+        op = "$lt" if direction == -1 else "$gt"
+        # Comparison operators never match across types, so rows with a null
+        # or missing key (which sort first) are matched explicitly
+        keyset = {"$or": [{sort_field: value, "id": {op: doc_id}}]}
+        if value is None:
+            if direction == 1:
+                keyset["$or"].append({sort_field: {"$ne": None}})
+        else:
+            keyset["$or"].append({sort_field: {op: value}})
+            if direction == -1:
+                keyset["$or"].append({sort_field: None})
+        query = {"$and": [query, keyset]} if query else keyset
+    
+    # The cursor needs the sort key and id even when the caller did not ask for them
+    fields = fields or page.fields
+    fields = projection(fields + [sort_field, "id"]) if fields else {"_id": 0}
+    docs = await collection.find(query, fields).sort(
+        [(sort_field, direction), ("id", direction)]
+    ).limit(page.limit + 1).to_list(page.limit + 1)
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1], sort_field)
+    return docs
+
+_list_adapters: Dict[type, TypeAdapter] = {}
+
+def model_list_response(
+    model: type,
+    docs: List[Dict[str, Any]],
+    response: Optional[Response] = None,
+    fields: Optional[List[str]] = None
+) -> ORJSONResponse:
+    """Render documents as a list of model, validating each row exactly once.
+    
+    Building model instances and returning them makes FastAPI dump and
+    re-validate every row against response_model before encoding. Returning
+    the response directly skips that second pass; response_model still
+    documents the shape. Headers set on the injected response are carried over.
+    
+    With fields (a projected query whose names find_page has validated), rows
+    are partial records: only those fields are returned, with the model's
+    defaults filling any gaps.
+    """
+    if fields:
+        # Generated defaults (ids, timestamps) would be invented values, so those stay null
+        defaults = {
+            field: None if info.is_required() or info.default_factory else info.default
+            for field, info in ((field, model.model_fields[field]) for field in fields)
+        }
+        content = [{field: doc.get(field, defaults[field]) for field in fields} for doc in docs]
+    else:
+        adapter = _list_adapters.get(model)
+        if adapter is None:
+            adapter = _list_adapters[model] = TypeAdapter(List[model])
+        content = adapter.dump_python(adapter.validate_python(docs))
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"} if response else None
+    return ORJSONResponse(content, headers=headers)
+
 # Company endpoints
 @api_router.post("/company", response_model=Company)
 async def create_company(company: CompanyCreate):
@@ -1001,8 +1230,11 @@ async def create_account(account: AccountCreate):
     account_dict = account.dict()
     account_obj = Account(**account_dict)
     
-    # Insert opening balance journal entry if provided
+    # The opening entry is posted like any other, so the stored balance starts
+    # at zero and takes the entry's signed debit - credit through the ledger.
+    journal_entry = None
     if account_obj.opening_balance != 0:
+        await ensure_period_open(account_obj.opening_balance_date or datetime.utcnow())
         journal_entry = JournalEntry(
             transaction_id=account_obj.id,
             account_id=account_obj.id,
@@ -1011,21 +1243,33 @@ async def create_account(account: AccountCreate):
             description=f"Opening balance for {account_obj.name}",
             date=account_obj.opening_balance_date or datetime.utcnow()
         )
-        await db.journal_entries.insert_one(journal_entry.dict())
-        account_obj.balance = account_obj.opening_balance
     
-    await db.accounts.insert_one(account_obj.dict())
+    account_obj.balance = 0.0
+    async def insert_account(session):
+        await db.accounts.insert_one(account_obj.dict(), session=session)
+        if journal_entry:
+            await post_journal_entries([journal_entry], session=session)
+    
+    await run_ledger_transaction(insert_account)
+    
+    if journal_entry:
+        account_obj.balance = journal_entry.debit - journal_entry.credit
     return account_obj
 
 @api_router.get("/accounts", response_model=List[Account])
-async def get_accounts():
-    accounts = await db.accounts.find({"active": True}).to_list(1000)
-    result = []
-    for account in accounts:
-        if "_id" in account:
-            del account["_id"]
-        result.append(Account(**account))
-    return result
+async def get_accounts(
+    response: Response,
+    account_type: Optional[AccountType] = None,
+    detail_type: Optional[str] = None,
+    page: PageParams = Depends()
+):
+    query = {"active": True}
+    if account_type:
+        query["account_type"] = account_type
+    if detail_type:
+        query["detail_type"] = detail_type
+    accounts = await find_page(db.accounts, query, page, response, default_order="asc", model=Account)
+    return model_list_response(Account, accounts, response, fields=page.fields)
 
 @api_router.get("/accounts/{account_id}", response_model=Account)
 async def get_account(account_id: str):
@@ -1044,6 +1288,7 @@ async def update_account(account_id: str, account_update: AccountCreate):
     update_data["updated_at"] = datetime.utcnow()
     
     await db.accounts.update_one({"id": account_id}, {"$set": update_data})
+    notify_ledger_change()
     updated_account = await db.accounts.find_one({"id": account_id})
     return Account(**updated_account)
 
@@ -1054,6 +1299,7 @@ async def delete_account(account_id: str):
         raise HTTPException(status_code=404, detail="Account not found")
     
     await db.accounts.update_one({"id": account_id}, {"$set": {"active": False}})
+    notify_ledger_change()
     return {"message": "Account deactivated successfully"}
 
 # Customer endpoints
@@ -1065,14 +1311,9 @@ async def create_customer(customer: CustomerCreate):
     return customer_obj
 
 @api_router.get("/customers", response_model=List[Customer])
-async def get_customers():
-    customers = await db.customers.find({"active": True}).to_list(1000)
-    result = []
-    for customer in customers:
-        if "_id" in customer:
-            del customer["_id"]
-        result.append(Customer(**customer))
-    return result
+async def get_customers(response: Response, page: PageParams = Depends()):
+    customers = await find_page(db.customers, {"active": True}, page, response, default_order="asc", model=Customer)
+    return model_list_response(Customer, customers, response, fields=page.fields)
 
 @api_router.get("/customers/{customer_id}", response_model=Customer)
 async def get_customer(customer_id: str):
@@ -1101,14 +1342,9 @@ async def create_vendor(vendor: VendorCreate):
     return vendor_obj
 
 @api_router.get("/vendors", response_model=List[Vendor])
-async def get_vendors():
-    vendors = await db.vendors.find({"active": True}).to_list(1000)
-    result = []
-    for vendor in vendors:
-        if "_id" in vendor:
-            del vendor["_id"]
-        result.append(Vendor(**vendor))
-    return result
+async def get_vendors(response: Response, page: PageParams = Depends()):
+    vendors = await find_page(db.vendors, {"active": True}, page, response, default_order="asc", model=Vendor)
+    return model_list_response(Vendor, vendors, response, fields=page.fields)
 
 @api_router.get("/vendors/{vendor_id}", response_model=Vendor)
 async def get_vendor(vendor_id: str):
@@ -1137,9 +1373,9 @@ async def create_employee(employee: EmployeeCreate):
     return employee_obj
 
 @api_router.get("/employees", response_model=List[Employee])
-async def get_employees():
-    employees = await db.employees.find({"status": {"$ne": "Terminated"}}).to_list(1000)
-    return [Employee(**employee) for employee in employees]
+async def get_employees(response: Response, page: PageParams = Depends()):
+    employees = await find_page(db.employees, {"status": {"$ne": "Terminated"}}, page, response, default_order="asc", model=Employee)
+    return model_list_response(Employee, employees, response, fields=page.fields)
 
 @api_router.get("/employees/{employee_id}", response_model=Employee)
 async def get_employee(employee_id: str):
@@ -1168,9 +1404,9 @@ async def create_item(item: ItemCreate):
     return item_obj
 
 @api_router.get("/items", response_model=List[Item])
-async def get_items():
-    items = await db.items.find({"active": True}).to_list(1000)
-    return [Item(**item) for item in items]
+async def get_items(response: Response, page: PageParams = Depends()):
+    items = await find_page(db.items, {"active": True}, page, response, default_order="asc", model=Item)
+    return model_list_response(Item, items, response, fields=page.fields)
 
 @api_router.get("/items/{item_id}", response_model=Item)
 async def get_item(item_id: str):
@@ -1200,8 +1436,8 @@ async def create_class(class_obj: ClassCreate):
 
 @api_router.get("/classes", response_model=List[Class])
 async def get_classes():
-    classes = await db.classes.find({"active": True}).to_list(1000)
-    return [Class(**class_item) for class_item in classes]
+    classes = await db.classes.find({"active": True}, {"_id": 0}).to_list(1000)
+    return model_list_response(Class, classes)
 
 # Location endpoints
 @api_router.post("/locations", response_model=Location)
@@ -1213,8 +1449,8 @@ async def create_location(location: LocationCreate):
 
 @api_router.get("/locations", response_model=List[Location])
 async def get_locations():
-    locations = await db.locations.find({"active": True}).to_list(1000)
-    return [Location(**location) for location in locations]
+    locations = await db.locations.find({"active": True}, {"_id": 0}).to_list(1000)
+    return model_list_response(Location, locations)
 
 # Terms endpoints
 @api_router.post("/terms", response_model=Terms)
@@ -1226,8 +1462,8 @@ async def create_terms(terms: TermsCreate):
 
 @api_router.get("/terms", response_model=List[Terms])
 async def get_terms():
-    terms = await db.terms.find({"active": True}).to_list(1000)
-    return [Terms(**term) for term in terms]
+    terms = await db.terms.find({"active": True}, {"_id": 0}).to_list(1000)
+    return model_list_response(Terms, terms)
 
 # Price Level endpoints
 @api_router.post("/price-levels", response_model=PriceLevel)
@@ -1239,45 +1475,105 @@ async def create_price_level(price_level: PriceLevelCreate):
 
 @api_router.get("/price-levels", response_model=List[PriceLevel])
 async def get_price_levels():
-    price_levels = await db.price_levels.find({"active": True}).to_list(1000)
-    return [PriceLevel(**price_level) for price_level in price_levels]
+    price_levels = await db.price_levels.find({"active": True}, {"_id": 0}).to_list(1000)
+    return model_list_response(PriceLevel, price_levels)
 
 # Transaction endpoints
 @api_router.post("/transactions", response_model=Transaction)
 async def create_transaction(transaction: TransactionCreate):
-    transaction_dict = transaction.dict()
-    
-    # Calculate totals
-    subtotal = sum(item.amount for item in transaction.line_items)
-    tax_amount = subtotal * transaction.tax_rate / 100
-    total = subtotal + tax_amount
+    await ensure_period_open(transaction.date)
+    transaction_obj = build_transaction(transaction)
+    async def post_transaction(session):
+        await db.transactions.insert_one(transaction_obj.dict(), session=session)
+        
+        # Create journal entries for double-entry bookkeeping
+        await create_journal_entries(transaction_obj, session=session)
+        await apply_open_items([transaction_obj.dict()], session=session)
+        await apply_cube_deltas(build_cube_deltas([transaction_obj.dict()]), session=session)
     
-    transaction_dict.update({
-        "subtotal": subtotal,
-        "tax_amount": tax_amount,
-        "total": total,
-        "balance": total,  # Initial balance equals total
-        "transaction_number": f"{transaction.transaction_type.value[:3].upper()}-{str(uuid.uuid4())[:8]}"
-    })
+    await run_ledger_transaction(post_transaction)
     
-    transaction_obj = Transaction(**transaction_dict)
-    await db.transactions.insert_one(transaction_obj.dict())
+    return transaction_obj
+
+@api_router.post("/transactions/batch")
+async def create_transactions_batch(request: Request):
+    """Import many transactions from an NDJSON stream or a JSON array body.
+    
+    Rows are validated up front and posted in chunks: control accounts are
+    resolved once, transactions and journal entries are bulk-inserted, and a
+    row whose idempotency key (its own, or the Idempotency-Key header plus the
+    row index) was already used is reported as a duplicate of the original.
+    """
+    batch_key = request.headers.get("Idempotency-Key")
+    control_accounts = await resolve_control_accounts()
+    latest_closed = await get_latest_closed_period()
+    
+    results = []
+    claimed_keys = {}
+    chunk = []
+    async for index, row, error in iter_batch_rows(request):
+        if error:
+            results.append({"index": index, "status": "error", "errors": [error]})
+            continue
+        
+        try:
+            item = TransactionBatchItem(**row)
+        except ValidationError as e:
+            results.append({"index": index, "status": "error", "errors": [
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            ]})
+            continue
+        
+        if latest_closed and naive_utc(item.date) < latest_closed["period_end"]:
+            results.append({"index": index, "status": "error", "errors": [
+                f"Cannot post to a closed period (closed through {latest_closed['period']})"
+            ]})
+            continue
+        
+        key = item.idempotency_key or (f"{batch_key}:{index}" if batch_key else None)
+        chunk.append((index, key, item))
+        if len(chunk) >= TRANSACTION_BATCH_CHUNK_SIZE:
+            results.extend(await post_transaction_batch_chunk(chunk, control_accounts, claimed_keys))
+            chunk = []
     
-    # Create journal entries for double-entry bookkeeping
-    await create_journal_entries(transaction_obj)
+    if chunk:
+        results.extend(await post_transaction_batch_chunk(chunk, control_accounts, claimed_keys))
     
-    return transaction_obj
+    results.sort(key=lambda result: result["index"])
+    return {
+        "total_rows": len(results),
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+        "errors": sum(1 for r in results if r["status"] == "error"),
+        "results": results
+    }
 
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions():
-    transactions = await db.transactions.find().to_list(1000)
-    result = []
-    for transaction in transactions:
-        # Remove MongoDB ObjectId field
-        if "_id" in transaction:
-            del transaction["_id"]
-        result.append(Transaction(**transaction))
-    return result
+async def get_transactions(
+    response: Response,
+    transaction_type: Optional[TransactionType] = None,
+    status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    vendor_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page: PageParams = Depends()
+):
+    query = {}
+    if transaction_type:
+        query["transaction_type"] = transaction_type
+    if status:
+        query["status"] = status
+    if customer_id:
+        query["customer_id"] = customer_id
+    if vendor_id:
+        query["vendor_id"] = vendor_id
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        query["date"] = date_range
+    
+    transactions = await find_page(db.transactions, query, page, response, sort_field="date", model=Transaction)
+    return model_list_response(Transaction, transactions, response, fields=page.fields)
 
 @api_router.get("/transactions/{transaction_id}", response_model=Transaction)
 async def get_transaction(transaction_id: str):
@@ -1292,6 +1588,9 @@ async def update_transaction(transaction_id: str, transaction_update: Transactio
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
+    await ensure_period_open(transaction["date"])
+    await ensure_period_open(transaction_update.date)
+    
     update_data = transaction_update.dict()
     update_data["updated_at"] = datetime.utcnow()
     
@@ -1306,10 +1605,153 @@ async def update_transaction(transaction_id: str, transaction_update: Transactio
         "total": total
     })
     
-    await db.transactions.update_one({"id": transaction_id}, {"$set": update_data})
+    async def post_update(session):
+        await db.transactions.update_one({"id": transaction_id}, {"$set": update_data}, session=session)
+        await sync_open_items([transaction_id], session=session)
+        
+        # Swap the old line items out of the cube and the new ones in
+        cube_deltas = build_cube_deltas([transaction], sign=-1)
+        build_cube_deltas([{**transaction, **update_data}], into=cube_deltas)
+        await apply_cube_deltas(cube_deltas, session=session)
+    
+    await run_ledger_transaction(post_update)
+    
     updated_transaction = await db.transactions.find_one({"id": transaction_id})
     return Transaction(**updated_transaction)
 
+# Global search: text indexes rank whole-word matches, anchored prefix scans catch
+# what is still being typed (names, numbers, SKUs)
+SEARCH_SOURCES = {
+    "customer": {
+        "collection": "customers",
+        "text_weights": {"name": 10, "company": 5, "email": 3},
+        "prefix_fields": ["name", "email"],
+        "projection": ["name", "company", "email"],
+        "filter": {"active": {"$ne": False}}
+    },
+    "vendor": {
+        "collection": "vendors",
+        "text_weights": {"name": 10, "company": 5, "email": 3},
+        "prefix_fields": ["name", "email"],
+        "projection": ["name", "company", "email"],
+        "filter": {"active": {"$ne": False}}
+    },
+    "account": {
+        "collection": "accounts",
+        "text_weights": {"name": 10, "account_number": 8},
+        "prefix_fields": ["account_number", "name"],
+        "projection": ["name", "account_number", "account_type", "detail_type"],
+        "filter": {"active": {"$ne": False}}
+    },
+    "transaction": {
+        "collection": "transactions",
+        "text_weights": {"transaction_number": 10, "reference_number": 8, "memo": 2},
+        "prefix_fields": ["transaction_number", "reference_number"],
+        "projection": ["transaction_type", "transaction_number", "reference_number", "memo", "total", "date"]
+    },
+    "item": {
+        "collection": "items",
+        "text_weights": {"name": 10, "item_number": 8, "description": 2},
+        "prefix_fields": ["item_number", "name"],
+        "projection": ["name", "item_number", "description", "item_type", "sales_price"],
+        "filter": {"active": {"$ne": False}}
+    }
+}
+
+SEARCH_EXACT_SCORE = 50.0
+SEARCH_PREFIX_SCORE = 20.0
+
+def search_prefix_patterns(q: str) -> List[Any]:
+    """Anchored, case-sensitive patterns for the casings people type, so each can use an index"""
+    variants = dict.fromkeys([q, q.upper(), q.lower(), q.capitalize(), q.title()])
+    return [re.compile("^" + re.escape(variant)) for variant in variants]
+
+def search_result(result_type: str, doc: dict, score: float) -> Dict[str, Any]:
+    """Shape a matched document into a typed search hit"""
+    if result_type in ("customer", "vendor"):
+        title = doc.get("name")
+        subtitle = doc.get("company") or doc.get("email") or result_type.capitalize()
+    elif result_type == "account":
+        title = doc.get("name")
+        if doc.get("account_number"):
+            title = f"{doc['account_number']} {title}"
+        subtitle = f"{doc.get('account_type')} - {doc.get('detail_type')}"
+    elif result_type == "transaction":
+        number = doc.get("transaction_number") or doc.get("reference_number")
+        title = f"{doc.get('transaction_type')} #{number}" if number else doc.get("transaction_type")
+        date = doc.get("date")
+        subtitle = f"${doc.get('total') or 0:,.2f}"
+        if isinstance(date, datetime):
+            subtitle += f" - {date.strftime('%m/%d/%Y')}"
+        if doc.get("memo"):
+            subtitle += f" - {doc['memo']}"
+    else:
+        title = doc.get("name")
+        subtitle = doc.get("description") or f"{doc.get('item_type')} - ${doc.get('sales_price') or 0:,.2f}"
+    
+    hit = {"type": result_type, "id": doc["id"], "title": title, "subtitle": subtitle, "score": round(score, 3)}
+    if result_type == "transaction":
+        hit["transaction_type"] = doc.get("transaction_type")
+    return hit
+
+async def search_source(result_type: str, q: str, limit: int) -> List[Dict[str, Any]]:
+    """Best matches of one entity type: prefix hits on identifiers plus text-index hits"""
+    source = SEARCH_SOURCES[result_type]
+    collection = db[source["collection"]]
+    projection = {field: 1 for field in ["id"] + source["projection"]}
+    projection["_id"] = 0
+    
+    # Deactivated master records stay out of search as they do everywhere else
+    base_filter = source.get("filter", {})
+    
+    scores, docs = {}, {}
+    patterns = search_prefix_patterns(q)
+    needle = q.lower()
+    for field in source["prefix_fields"]:
+        async for doc in collection.find({field: {"$in": patterns}, **base_filter}, projection).limit(limit):
+            value = str(doc.get(field) or "").lower()
+            score = SEARCH_EXACT_SCORE if value == needle else SEARCH_PREFIX_SCORE
+            if score > scores.get(doc["id"], 0):
+                scores[doc["id"]], docs[doc["id"]] = score, doc
+    
+    text_projection = {**projection, "score": {"$meta": "textScore"}}
+    cursor = collection.find({"$text": {"$search": q}, **base_filter}, text_projection)
+    try:
+        async for doc in cursor.sort([("score", {"$meta": "textScore"})]).limit(limit):
+            score = doc.pop("score", 0)
+            if doc["id"] in scores:
+                # A document found both ways ranks above one found either way alone
+                score += scores[doc["id"]]
+            if score > scores.get(doc["id"], 0):
+                scores[doc["id"]], docs[doc["id"]] = score, doc
+    except OperationFailure as e:
+        logger.warning(f"Text search unavailable on {source['collection']}, using prefix matches only: {e}")
+    
+    return [search_result(result_type, docs[doc_id], score) for doc_id, score in scores.items()]
+
+@api_router.get("/search")
+async def global_search(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    types: Optional[str] = Query(None, description="Comma-separated subset of customer, vendor, account, transaction, item")
+):
+    """Ranked, typed matches across customers, vendors, accounts, transactions and items"""
+    q = q.strip()
+    if len(q) < 2:
+        raise HTTPException(status_code=400, detail="Search query must be at least 2 characters")
+    
+    result_types = list(SEARCH_SOURCES)
+    if types:
+        result_types = [t.strip() for t in types.split(",") if t.strip()]
+        unknown = [t for t in result_types if t not in SEARCH_SOURCES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown search types: {', '.join(unknown)}")
+    
+    per_type = await asyncio.gather(*(search_source(t, q, limit) for t in result_types))
+    results = [hit for hits in per_type for hit in hits]
+    results.sort(key=lambda hit: (-hit["score"], hit["title"] or ""))
+    return {"query": q, "results": results[:limit]}
+
 # Memorized Transaction endpoints
 @api_router.post("/memorized-transactions", response_model=MemorizedTransaction)
 async def create_memorized_transaction(memorized_transaction: MemorizedTransactionCreate):
@@ -1320,8 +1762,8 @@ async def create_memorized_transaction(memorized_transaction: MemorizedTransacti
 
 @api_router.get("/memorized-transactions", response_model=List[MemorizedTransaction])
 async def get_memorized_transactions():
-    memorized_transactions = await db.memorized_transactions.find({"active": True}).to_list(1000)
-    return [MemorizedTransaction(**mt) for mt in memorized_transactions]
+    memorized_transactions = await db.memorized_transactions.find({"active": True}, {"_id": 0}).to_list(1000)
+    return model_list_response(MemorizedTransaction, memorized_transactions)
 
 # ToDo endpoints
 @api_router.post("/todos", response_model=ToDo)
@@ -1333,8 +1775,8 @@ async def create_todo(todo: ToDoCreate):
 
 @api_router.get("/todos", response_model=List[ToDo])
 async def get_todos():
-    todos = await db.todos.find().to_list(1000)
-    return [ToDo(**todo) for todo in todos]
+    todos = await db.todos.find({}, {"_id": 0}).to_list(1000)
+    return model_list_response(ToDo, todos)
 
 @api_router.put("/todos/{todo_id}", response_model=ToDo)
 async def update_todo(todo_id: str, todo_update: ToDoCreate):
@@ -1355,8 +1797,8 @@ async def delete_todo(todo_id: str):
 # Audit Trail endpoints
 @api_router.get("/audit-trail", response_model=List[AuditEntry])
 async def get_audit_trail():
-    audit_entries = await db.audit_entries.find().sort("timestamp", -1).to_list(1000)
-    return [AuditEntry(**entry) for entry in audit_entries]
+    audit_entries = await db.audit_entries.find({}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
+    return model_list_response(AuditEntry, audit_entries)
 
 # User endpoints - Basic implementation moved to advanced section below
 
@@ -1370,29 +1812,142 @@ async def create_role(role: RoleCreate):
 
 @api_router.get("/roles", response_model=List[Role])
 async def get_roles():
-    roles = await db.roles.find().to_list(1000)
-    return [Role(**role) for role in roles]
+    roles = await db.roles.find({}, {"_id": 0}).to_list(1000)
+    return model_list_response(Role, roles)
 
 # Journal entry endpoints
 @api_router.post("/journal-entries", response_model=JournalEntry)
 async def create_journal_entry(entry: JournalEntry):
     """Create a single journal entry"""
-    await db.journal_entries.insert_one(entry.dict())
-    
-    # Update account balance
-    await update_account_balance(entry.account_id)
-    
+    await ensure_period_open(entry.date)
+    await post_journal_entries([entry])
+    notify_ledger_change()
     return entry
 
 @api_router.get("/journal-entries", response_model=List[JournalEntry])
-async def get_journal_entries():
-    entries = await db.journal_entries.find().to_list(1000)
-    result = []
-    for entry in entries:
-        if "_id" in entry:
-            del entry["_id"]
-        result.append(JournalEntry(**entry))
-    return result
+async def get_journal_entries(
+    response: Response,
+    account_id: Optional[str] = None,
+    transaction_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page: PageParams = Depends()
+):
+    query = {}
+    if account_id:
+        query["account_id"] = account_id
+    if transaction_id:
+        query["transaction_id"] = transaction_id
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        query["date"] = date_range
+    
+    entries = await find_page(db.journal_entries, query, page, response, sort_field="date", model=JournalEntry)
+    return model_list_response(JournalEntry, entries, response, fields=page.fields)
+
+# General ledger export
+EXPORT_BATCH_SIZE = 2000
+
+TRANSACTION_EXPORT_FIELDS = [
+    "id", "transaction_number", "transaction_type", "date", "due_date", "customer_id", "vendor_id",
+    "employee_id", "reference_number", "po_number", "subtotal", "tax_rate", "tax_amount", "total",
+    "balance", "payment_method", "deposit_to_account_id", "deposit_id", "memo", "status",
+    "line_items", "created_at", "updated_at"
+]
+
+JOURNAL_ENTRY_EXPORT_FIELDS = [
+    "id", "transaction_id", "account_id", "debit", "credit", "description", "date", "created_at"
+]
+
+def export_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def export_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=export_json_default)
+    return value
+
+async def stream_export_rows(cursor, fields: List[str], export_format: str):
+    """Encode cursor documents as NDJSON lines or CSV rows, one batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(fields)
+    
+    rows = 0
+    async for doc in cursor:
+        if export_format == "csv":
+            writer.writerow([export_csv_value(doc.get(field)) for field in fields])
+        else:
+            buffer.write(json.dumps({field: doc.get(field) for field in fields}, default=export_json_default))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(collection, query: Dict[str, Any], fields: List[str], export_format: str, name: str) -> StreamingResponse:
+    """Stream every matching document in (date, id) order without loading the result set"""
+    cursor = collection.find(query, {"_id": 0}).sort([("date", 1), ("id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    extension = "csv" if export_format == "csv" else "ndjson"
+    return StreamingResponse(
+        stream_export_rows(cursor, fields, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={name}.{extension}"}
+    )
+
+@api_router.get("/export/transactions")
+async def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """Stream all transactions in a date range as NDJSON or CSV"""
+    query = {}
+    if transaction_type:
+        query["transaction_type"] = transaction_type
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        query["date"] = date_range
+    return export_response(db.transactions, query, TRANSACTION_EXPORT_FIELDS, format, "transactions")
+
+@api_router.get("/export/journal-entries")
+async def export_journal_entries(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    account_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """Stream the general ledger in a date range as NDJSON or CSV"""
+    query = {}
+    if account_id:
+        query["account_id"] = account_id
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        query["date"] = date_range
+    return export_response(db.journal_entries, query, JOURNAL_ENTRY_EXPORT_FIELDS, format, "journal_entries")
+
+@api_router.get("/ledger/verify-balances")
+async def verify_ledger_balances():
+    """Report accounts whose stored balance has drifted from the journal"""
+    return await verify_account_balances(rebuild=False)
+
+@api_router.post("/ledger/rebuild-balances")
+async def rebuild_ledger_balances():
+    """Recompute all stored account balances from the journal"""
+    return await verify_account_balances(rebuild=True)
 
 # Manual Journal Entry for adjustments
 class ManualJournalEntry(BaseModel):
@@ -1417,6 +1972,8 @@ async def create_manual_journal_entry(manual_entry: ManualJournalEntry):
     if len(manual_entry.entries) < 2:
         raise HTTPException(status_code=400, detail="Journal entry must have at least 2 entries")
     
+    await ensure_period_open(manual_entry.date)
+    
     # Create transaction ID for grouping the entries
     transaction_id = str(uuid.uuid4())
     
@@ -1434,12 +1991,6 @@ async def create_manual_journal_entry(manual_entry: ManualJournalEntry):
             description=entry_data.get("description", manual_entry.memo or "Manual journal entry"),
             date=manual_entry.date
         )
-        
-        await db.journal_entries.insert_one(journal_entry.dict())
-        
-        # Update account balance
-        await update_account_balance(entry_data["account_id"])
-        
         created_entries.append(journal_entry)
     
     # Create a transaction record for audit purposes
@@ -1453,7 +2004,11 @@ async def create_manual_journal_entry(manual_entry: ManualJournalEntry):
         transaction_number=f"JE-{str(uuid.uuid4())[:8]}"
     )
     
-    await db.transactions.insert_one(adjustment_transaction.dict())
+    async def post_adjustment(session):
+        await post_journal_entries(created_entries, session=session)
+        await db.transactions.insert_one(adjustment_transaction.dict(), session=session)
+    
+    await run_ledger_transaction(post_adjustment)
     
     return {
         "message": "Manual journal entry created successfully",
@@ -1492,6 +2047,8 @@ async def transfer_funds(transfer: TransferRequest):
     if transfer.amount <= 0:
         raise HTTPException(status_code=400, detail="Transfer amount must be positive")
     
+    await ensure_period_open(transfer.transfer_date)
+    
     # Create transfer transaction record
     transfer_id = str(uuid.uuid4())
     transfer_transaction = Transaction(
@@ -1504,8 +2061,6 @@ async def transfer_funds(transfer: TransferRequest):
         transaction_number=f"TRF-{str(uuid.uuid4())[:8]}"
     )
     
-    await db.transactions.insert_one(transfer_transaction.dict())
-    
     # Create journal entries for the transfer
     from_entry = JournalEntry(
         transaction_id=transfer_id,
@@ -1525,12 +2080,11 @@ async def transfer_funds(transfer: TransferRequest):
         date=transfer.transfer_date
     )
     
-    await db.journal_entries.insert_one(from_entry.dict())
-    await db.journal_entries.insert_one(to_entry.dict())
+    async def post_transfer(session):
+        await db.transactions.insert_one(transfer_transaction.dict(), session=session)
+        await post_journal_entries([from_entry, to_entry], session=session)
     
-    # Update account balances
-    await update_account_balance(transfer.from_account_id)
-    await update_account_balance(transfer.to_account_id)
+    await run_ledger_transaction(post_transfer)
     
     return {
         "message": "Transfer completed successfully", 
@@ -1554,6 +2108,7 @@ async def receive_payment(
     memo: Optional[str] = None
 ):
     """Apply payment to customer invoices"""
+    await ensure_period_open(payment_date)
     payment_id = str(uuid.uuid4())
     
     # Create payment transaction
@@ -1568,55 +2123,67 @@ async def receive_payment(
         transaction_number=f"PMT-{str(uuid.uuid4())[:8]}"
     )
     
-    await db.transactions.insert_one(payment_transaction.dict())
-    
-    # Apply payment to invoices
-    remaining_payment = payment_amount
-    for application in invoice_applications:
-        invoice_id = application.get("invoice_id")
-        applied_amount = min(application.get("amount", 0), remaining_payment)
-        
-        if applied_amount > 0:
-            # Update invoice status and remaining balance
-            invoice = await db.transactions.find_one({"id": invoice_id})
-            if invoice:
-                new_balance = invoice.get("balance", invoice["total"]) - applied_amount
-                await db.transactions.update_one(
-                    {"id": invoice_id}, 
-                    {"$set": {"balance": new_balance, "status": "Paid" if new_balance <= 0 else "Partial"}}
-                )
-                remaining_payment -= applied_amount
-    
     # Create journal entries for payment
     # Debit Bank/Undeposited Funds, Credit Accounts Receivable
     deposit_account = await db.accounts.find_one({"id": deposit_to_account_id})
     ar_account = await db.accounts.find_one({"detail_type": "Accounts Receivable"})
+    entries = []
     
     if deposit_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=payment_id,
             account_id=deposit_to_account_id,
             debit=payment_amount,
             credit=0,
             description=f"Payment received - {payment_transaction.transaction_number}",
             date=payment_date
-        ).dict())
+        ))
     
     if ar_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=payment_id,
             account_id=ar_account["id"],
             debit=0,
             credit=payment_amount,
             description=f"Payment received - {payment_transaction.transaction_number}",
             date=payment_date
-        ).dict())
+        ))
     
-    # Update customer balance
-    customer = await db.customers.find_one({"id": customer_id})
-    if customer:
-        new_balance = customer.get("balance", 0) - payment_amount
-        await db.customers.update_one({"id": customer_id}, {"$set": {"balance": new_balance}})
+    async def post_payment(session):
+        await db.transactions.insert_one(payment_transaction.dict(), session=session)
+        
+        # Apply payment to invoices
+        remaining_payment = payment_amount
+        applied_invoice_ids = []
+        for application in invoice_applications:
+            invoice_id = application.get("invoice_id")
+            applied_amount = min(application.get("amount", 0), remaining_payment)
+            
+            if applied_amount > 0:
+                # Update invoice status and remaining balance
+                invoice = await db.transactions.find_one({"id": invoice_id}, session=session)
+                if invoice:
+                    new_balance = invoice.get("balance", invoice["total"]) - applied_amount
+                    await db.transactions.update_one(
+                        {"id": invoice_id}, 
+                        {"$set": {"balance": new_balance, "status": "Paid" if new_balance <= 0 else "Partial"}},
+                        session=session
+                    )
+                    applied_invoice_ids.append(invoice_id)
+                    remaining_payment -= applied_amount
+        
+        await post_journal_entries(entries, session=session)
+        await sync_open_items(applied_invoice_ids, session=session)
+        await apply_open_items([payment_transaction.dict()], session=session)
+        
+        # Update customer balance
+        await db.customers.update_one(
+            {"id": customer_id},
+            {"$inc": {"balance": -payment_amount}},
+            session=session
+        )
+    
+    await run_ledger_transaction(post_payment)
     
     return {"message": "Payment received successfully", "payment_id": payment_id}
 
@@ -1629,6 +2196,7 @@ async def pay_bills(
     memo: Optional[str] = None
 ):
     """Pay multiple vendor bills"""
+    await ensure_period_open(payment_date)
     payment_id = str(uuid.uuid4())
     total_payment_amount = sum(bp.get("amount", 0) for bp in bill_payments)
     
@@ -1643,54 +2211,65 @@ async def pay_bills(
         transaction_number=f"BPM-{str(uuid.uuid4())[:8]}"
     )
     
-    await db.transactions.insert_one(payment_transaction.dict())
-    
-    # Process each bill payment
-    for bill_payment in bill_payments:
-        bill_id = bill_payment.get("bill_id")
-        payment_amount = bill_payment.get("amount", 0)
-        
-        # Update bill status
-        bill = await db.transactions.find_one({"id": bill_id})
-        if bill:
-            new_balance = bill.get("balance", bill["total"]) - payment_amount
-            await db.transactions.update_one(
-                {"id": bill_id}, 
-                {"$set": {"balance": new_balance, "status": "Paid" if new_balance <= 0 else "Partial"}}
-            )
-            
-            # Update vendor balance
-            vendor_id = bill.get("vendor_id")
-            if vendor_id:
-                vendor = await db.vendors.find_one({"id": vendor_id})
-                if vendor:
-                    new_vendor_balance = vendor.get("balance", 0) - payment_amount
-                    await db.vendors.update_one({"id": vendor_id}, {"$set": {"balance": new_vendor_balance}})
-    
     # Create journal entries
     # Credit Bank Account, Debit Accounts Payable
     payment_account = await db.accounts.find_one({"id": payment_account_id})
     ap_account = await db.accounts.find_one({"detail_type": "Accounts Payable"})
+    entries = []
     
     if payment_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=payment_id,
             account_id=payment_account_id,
             debit=0,
             credit=total_payment_amount,
             description=f"Bill payment - {payment_transaction.transaction_number}",
             date=payment_date
-        ).dict())
+        ))
     
     if ap_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=payment_id,
             account_id=ap_account["id"],
             debit=total_payment_amount,
             credit=0,
             description=f"Bill payment - {payment_transaction.transaction_number}",
             date=payment_date
-        ).dict())
+        ))
+    
+    async def post_bill_payment(session):
+        await db.transactions.insert_one(payment_transaction.dict(), session=session)
+        
+        # Process each bill payment
+        paid_bill_ids = []
+        for bill_payment in bill_payments:
+            bill_id = bill_payment.get("bill_id")
+            payment_amount = bill_payment.get("amount", 0)
+            
+            # Update bill status
+            bill = await db.transactions.find_one({"id": bill_id}, session=session)
+            if bill:
+                new_balance = bill.get("balance", bill["total"]) - payment_amount
+                await db.transactions.update_one(
+                    {"id": bill_id}, 
+                    {"$set": {"balance": new_balance, "status": "Paid" if new_balance <= 0 else "Partial"}},
+                    session=session
+                )
+                paid_bill_ids.append(bill_id)
+                
+                # Update vendor balance
+                vendor_id = bill.get("vendor_id")
+                if vendor_id:
+                    await db.vendors.update_one(
+                        {"id": vendor_id},
+                        {"$inc": {"balance": -payment_amount}},
+                        session=session
+                    )
+        
+        await post_journal_entries(entries, session=session)
+        await sync_open_items(paid_bill_ids, session=session)
+    
+    await run_ledger_transaction(post_bill_payment)
     
     return {"message": "Bills paid successfully", "payment_id": payment_id}
 
@@ -1702,6 +2281,7 @@ async def make_deposit(
     memo: Optional[str] = None
 ):
     """Make bank deposit from undeposited funds"""
+    await ensure_period_open(deposit_date)
     deposit_id = str(uuid.uuid4())
     total_deposit = sum(item.get("amount", 0) for item in payment_items)
     
@@ -1715,128 +2295,95 @@ async def make_deposit(
         transaction_number=f"DEP-{str(uuid.uuid4())[:8]}"
     )
     
-    await db.transactions.insert_one(deposit_transaction.dict())
-    
     # Create journal entries
     # Debit Bank Account, Credit Undeposited Funds
     bank_account = await db.accounts.find_one({"id": deposit_to_account_id})
     undeposited_account = await db.accounts.find_one({"detail_type": "Undeposited Funds"})
+    entries = []
     
     if bank_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=deposit_id,
             account_id=deposit_to_account_id,
             debit=total_deposit,
             credit=0,
             description=f"Bank deposit - {deposit_transaction.transaction_number}",
             date=deposit_date
-        ).dict())
+        ))
     
     if undeposited_account:
-        await db.journal_entries.insert_one(JournalEntry(
+        entries.append(JournalEntry(
             transaction_id=deposit_id,
             account_id=undeposited_account["id"],
             debit=0,
             credit=total_deposit,
             description=f"Bank deposit - {deposit_transaction.transaction_number}",
             date=deposit_date
-        ).dict())
+        ))
     
     # Mark deposited items as deposited
-    for item in payment_items:
-        payment_id = item.get("payment_id")
-        if payment_id:
-            await db.transactions.update_one(
-                {"id": payment_id},
-                {"$set": {"status": "Deposited", "deposit_id": deposit_id}}
+    deposited_payment_ids = [item["payment_id"] for item in payment_items if item.get("payment_id")]
+    
+    async def post_deposit(session):
+        await db.transactions.insert_one(deposit_transaction.dict(), session=session)
+        await post_journal_entries(entries, session=session)
+        if deposited_payment_ids:
+            await db.transactions.update_many(
+                {"id": {"$in": deposited_payment_ids}},
+                {"$set": {"status": "Deposited", "deposit_id": deposit_id}},
+                session=session
             )
+            await sync_open_items(deposited_payment_ids, session=session)
+    
+    await run_ledger_transaction(post_deposit)
     
     return {"message": "Deposit completed successfully", "deposit_id": deposit_id}
 
-@api_router.get("/customers/{customer_id}/open-invoices")
+@api_router.get("/customers/{customer_id}/open-invoices", response_model=List[OpenItem])
 async def get_customer_open_invoices(customer_id: str):
     """Get all open invoices for a customer"""
-    invoices = await db.transactions.find({
-        "customer_id": customer_id,
-        "transaction_type": "Invoice",
-        "status": {"$in": ["Open", "Partial"]}
-    }).to_list(1000)
-    
-    # Convert to proper Transaction objects and calculate remaining balance
-    result = []
-    for invoice in invoices:
-        # Remove MongoDB ObjectId field
-        if "_id" in invoice:
-            del invoice["_id"]
-        
-        # Calculate remaining balance
-        if "balance" not in invoice:
-            invoice["balance"] = invoice["total"]
-        
-        # Convert to Transaction object to ensure proper serialization
-        transaction_obj = Transaction(**invoice)
-        result.append(transaction_obj.dict())
-    
-    return result
+    invoices = await db.open_items.find(
+        {"customer_id": customer_id, "transaction_type": "Invoice"}, {"_id": 0}
+    ).sort([("due_date", 1), ("date", 1)]).to_list(None)
+    return model_list_response(OpenItem, invoices)
 
-@api_router.get("/vendors/{vendor_id}/open-bills")
+@api_router.get("/vendors/{vendor_id}/open-bills", response_model=List[OpenItem])
 async def get_vendor_open_bills(vendor_id: str):
     """Get all open bills for a vendor"""
-    bills = await db.transactions.find({
-        "vendor_id": vendor_id,
-        "transaction_type": "Bill",
-        "status": {"$in": ["Open", "Partial"]}
-    }).to_list(1000)
-    
-    # Convert to proper Transaction objects and calculate remaining balance
-    result = []
-    for bill in bills:
-        # Remove MongoDB ObjectId field
-        if "_id" in bill:
-            del bill["_id"]
-        
-        # Calculate remaining balance
-        if "balance" not in bill:
-            bill["balance"] = bill["total"]
-        
-        # Convert to Transaction object to ensure proper serialization
-        transaction_obj = Transaction(**bill)
-        result.append(transaction_obj.dict())
-    
-    return result
+    bills = await db.open_items.find(
+        {"vendor_id": vendor_id, "transaction_type": "Bill"}, {"_id": 0}
+    ).sort([("due_date", 1), ("date", 1)]).to_list(None)
+    return model_list_response(OpenItem, bills)
 
-@api_router.get("/payments/undeposited")
+@api_router.get("/payments/undeposited", response_model=List[OpenItem])
 async def get_undeposited_payments():
     """Get all payments in undeposited funds"""
-    payments = await db.transactions.find({
-        "transaction_type": "Payment",
-        "status": {"$ne": "Deposited"}
-    }).to_list(1000)
-    
-    # Convert to proper Transaction objects for serialization
-    result = []
-    for payment in payments:
-        # Remove MongoDB ObjectId field
-        if "_id" in payment:
-            del payment["_id"]
-        
-        # Convert to Transaction object to ensure proper serialization
-        transaction_obj = Transaction(**payment)
-        result.append(transaction_obj.dict())
-    
-    return result
+    payments = await db.open_items.find(
+        {"transaction_type": "Payment"}, {"_id": 0}
+    ).sort([("date", 1)]).to_list(None)
+    return model_list_response(OpenItem, payments)
+
+@api_router.post("/ledger/rebuild-open-items")
+async def rebuild_open_items_endpoint():
+    """Rebuild the open_items collection from transactions"""
+    return await rebuild_open_items()
 
 # Reports endpoints
 @api_router.get("/reports/trial-balance")
-async def get_trial_balance():
-    accounts = await db.accounts.find({"active": True}).to_list(1000)
+async def get_trial_balance(
+    as_of: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """Trial balance as of a date, or for the activity within a period"""
+    accounts = await get_report_accounts(start_date, end_date or as_of)
     
     trial_balance = []
     total_debits = 0
     total_credits = 0
     
     for account in accounts:
-        balance = await calculate_account_balance(account["id"])
+        balance = account["balance"]
         account_data = {
             "account_name": account["name"],
             "account_type": account["account_type"],
@@ -1848,6 +2395,10 @@ async def get_trial_balance():
         total_credits += account_data["credit"]
     
     return {
+        "report_period": {
+            "start_date": start_date,
+            "end_date": end_date or as_of
+        },
         "trial_balance": trial_balance,
         "total_debits": total_debits,
         "total_credits": total_credits,
@@ -1855,8 +2406,9 @@ async def get_trial_balance():
     }
 
 @api_router.get("/reports/balance-sheet")
-async def get_balance_sheet():
-    accounts = await db.accounts.find({"active": True}).to_list(1000)
+async def get_balance_sheet(as_of: Optional[str] = None):
+    """Balance sheet as of a date (all-time when omitted)"""
+    accounts = await get_report_accounts(end_date=as_of)
     
     assets = []
     liabilities = []
@@ -1867,7 +2419,7 @@ async def get_balance_sheet():
     total_equity = 0
     
     for account in accounts:
-        balance = await calculate_account_balance(account["id"])
+        balance = account["balance"]
         account_data = {
             "name": account["name"],
             "balance": balance
@@ -1884,6 +2436,7 @@ async def get_balance_sheet():
             total_equity += balance
     
     return {
+        "as_of": as_of,
         "assets": assets,
         "liabilities": liabilities,
         "equity": equity,
@@ -1894,8 +2447,13 @@ async def get_balance_sheet():
     }
 
 @api_router.get("/reports/income-statement")
-async def get_income_statement():
-    accounts = await db.accounts.find({"active": True}).to_list(1000)
+async def get_income_statement(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    as_of: Optional[str] = None
+):
+    """Income statement for a period; as_of is accepted as the period end"""
+    accounts = await get_report_accounts(start_date, end_date or as_of)
     
     income = []
     expenses = []
@@ -1904,7 +2462,7 @@ async def get_income_statement():
     total_expenses = 0
     
     for account in accounts:
-        balance = await calculate_account_balance(account["id"])
+        balance = account["balance"]
         account_data = {
             "name": account["name"],
             "balance": balance
@@ -1920,6 +2478,10 @@ async def get_income_statement():
     net_income = total_income - total_expenses
     
     return {
+        "report_period": {
+            "start_date": start_date,
+            "end_date": end_date or as_of
+        },
         "income": income,
         "expenses": expenses,
         "total_income": total_income,
@@ -1928,70 +2490,46 @@ async def get_income_statement():
     }
 
 @api_router.get("/reports/ar-aging")
-async def get_ar_aging():
-    # Get all customers and their invoice balances
-    customers = await db.customers.find({"active": True}).to_list(1000)
-    invoices = await db.transactions.find({"transaction_type": "Invoice", "status": "Open"}).to_list(1000)
-    
-    ar_aging = []
-    today = datetime.utcnow()
-    
-    for customer in customers:
-        customer_invoices = [inv for inv in invoices if inv.get("customer_id") == customer["id"]]
-        
-        current = sum(inv["total"] for inv in customer_invoices if (today - inv["date"]).days <= 30)
-        days_31_60 = sum(inv["total"] for inv in customer_invoices if 31 <= (today - inv["date"]).days <= 60)
-        days_61_90 = sum(inv["total"] for inv in customer_invoices if 61 <= (today - inv["date"]).days <= 90)
-        over_90 = sum(inv["total"] for inv in customer_invoices if (today - inv["date"]).days > 90)
-        
-        total_balance = current + days_31_60 + days_61_90 + over_90
-        
-        if total_balance > 0:
-            ar_aging.append({
-                "customer_name": customer["name"],
-                "current": current,
-                "days_31_60": days_31_60,
-                "days_61_90": days_61_90,
-                "over_90": over_90,
-                "total": total_balance
-            })
-    
-    return {"ar_aging": ar_aging}
+async def get_ar_aging(
+    as_of: Optional[str] = None,
+    buckets: str = Query("30,60,90", description="Comma-separated bucket boundaries in days"),
+    aging_basis: str = Query("date", pattern="^(date|due_date)$")
+):
+    """Age open invoice balances per customer"""
+    as_of_dt, boundaries = parse_aging_params(as_of, buckets)
+    ar_aging = await build_aging_report("Invoice", "customer_id", "customers", as_of_dt, boundaries, aging_basis)
+    return {
+        "as_of": as_of_dt,
+        "buckets": aging_bucket_keys(boundaries),
+        "ar_aging": [
+            {"customer_id": row.pop("party_id"), "customer_name": row.pop("party_name"), **row}
+            for row in ar_aging
+        ]
+    }
 
 @api_router.get("/reports/ap-aging")
-async def get_ap_aging():
-    # Get all vendors and their bill balances
-    vendors = await db.vendors.find({"active": True}).to_list(1000)
-    bills = await db.transactions.find({"transaction_type": "Bill", "status": "Open"}).to_list(1000)
-    
-    ap_aging = []
-    today = datetime.utcnow()
-    
-    for vendor in vendors:
-        vendor_bills = [bill for bill in bills if bill.get("vendor_id") == vendor["id"]]
-        
-        current = sum(bill["total"] for bill in vendor_bills if (today - bill["date"]).days <= 30)
-        days_31_60 = sum(bill["total"] for bill in vendor_bills if 31 <= (today - bill["date"]).days <= 60)
-        days_61_90 = sum(bill["total"] for bill in vendor_bills if 61 <= (today - bill["date"]).days <= 90)
-        over_90 = sum(bill["total"] for bill in vendor_bills if (today - bill["date"]).days > 90)
-        
-        total_balance = current + days_31_60 + days_61_90 + over_90
-        
-        if total_balance > 0:
-            ap_aging.append({
-                "vendor_name": vendor["name"],
-                "current": current,
-                "days_31_60": days_31_60,
-                "days_61_90": days_61_90,
-                "over_90": over_90,
-                "total": total_balance
-            })
-    
-    return {"ap_aging": ap_aging}
+async def get_ap_aging(
+    as_of: Optional[str] = None,
+    buckets: str = Query("30,60,90", description="Comma-separated bucket boundaries in days"),
+    aging_basis: str = Query("date", pattern="^(date|due_date)$")
+):
+    """Age open bill balances per vendor"""
+    as_of_dt, boundaries = parse_aging_params(as_of, buckets)
+    ap_aging = await build_aging_report("Bill", "vendor_id", "vendors", as_of_dt, boundaries, aging_basis)
+    return {
+        "as_of": as_of_dt,
+        "buckets": aging_bucket_keys(boundaries),
+        "ap_aging": [
+            {"vendor_id": row.pop("party_id"), "vendor_name": row.pop("party_name"), **row}
+            for row in ap_aging
+        ]
+    }
 
 # Enhanced Reports - Phase 3
 
 # Customer/Vendor Aging Details with Drill-down
+AGING_DETAIL_FIELDS = ["id", "transaction_number", "date", "due_date", "total", "balance"]
+
 @api_router.get("/reports/customer-aging-details/{customer_id}")
 async def get_customer_aging_details(customer_id: str):
     """Get detailed aging information for a specific customer with drill-down capability"""
@@ -2004,7 +2542,7 @@ async def get_customer_aging_details(customer_id: str):
         "customer_id": customer_id,
         "transaction_type": "Invoice",
         "status": "Open"
-    }).to_list(1000)
+    }, projection(AGING_DETAIL_FIELDS)).to_list(1000)
     
     today = datetime.utcnow()
     aging_details = {
@@ -2070,7 +2608,7 @@ async def get_vendor_aging_details(vendor_id: str):
         "vendor_id": vendor_id,
         "transaction_type": "Bill",
         "status": "Open"
-    }).to_list(1000)
+    }, projection(AGING_DETAIL_FIELDS)).to_list(1000)
     
     today = datetime.utcnow()
     aging_details = {
@@ -2126,7 +2664,7 @@ async def get_vendor_aging_details(vendor_id: str):
 
 # Cash Flow Projections
 @api_router.get("/reports/cash-flow-projections")
-async def get_cash_flow_projections(months: int = 12):
+async def get_cash_flow_projections(months: int = Query(12, ge=1, le=120)):
     """Generate cash flow projections based on receivables, payables, and historical data"""
     today = datetime.utcnow()
     
@@ -2134,46 +2672,36 @@ async def get_cash_flow_projections(months: int = 12):
     cash_accounts = await db.accounts.find({
         "detail_type": {"$in": ["Checking", "Savings"]},
         "active": True
-    }).to_list(100)
-    
-    current_cash = 0
-    for account in cash_accounts:
-        current_cash += await calculate_account_balance(account["id"])
-    
-    # Get receivables (invoices) 
-    invoices = await db.transactions.find({
-        "transaction_type": "Invoice",
-        "status": "Open"
-    }).to_list(1000)
-    
-    # Get payables (bills)
-    bills = await db.transactions.find({
-        "transaction_type": "Bill", 
-        "status": "Open"
-    }).to_list(1000)
+    }, projection(["id"])).to_list(100)
+    
+    cash_totals = await get_account_totals({"account_id": {"$in": [account["id"] for account in cash_accounts]}})
+    current_cash = sum(totals["debit"] - totals["credit"] for totals in cash_totals.values())
+    
+    # Open receivables and payables bucketed by due month in one vectorized pass
+    month_starts = [add_months(today.replace(day=1, hour=0, minute=0, second=0, microsecond=0), offset) for offset in range(months)]
+    open_frame = pd.DataFrame(
+        await db.open_items.find(
+            {"transaction_type": {"$in": ["Invoice", "Bill"]}},
+            projection(["transaction_type", "due_date", "balance"])
+        ).to_list(None),
+        columns=["transaction_type", "due_date", "balance"]
+    )
+    is_invoice = (open_frame["transaction_type"] == "Invoice").to_numpy()
+    due_inflows = bucket_by_period(open_frame["due_date"], open_frame["balance"].where(is_invoice, 0), month_starts, add_months(month_starts[-1], 1))
+    due_outflows = bucket_by_period(open_frame["due_date"], open_frame["balance"].where(~is_invoice, 0), month_starts, add_months(month_starts[-1], 1))
+    open_totals = {
+        "Invoice": float(open_frame["balance"][is_invoice].sum()),
+        "Bill": float(open_frame["balance"][~is_invoice].sum())
+    }
     
     # Generate monthly projections
     projections = []
     running_balance = current_cash
     
-    for month_offset in range(months):
-        month_start = today.replace(day=1) + timedelta(days=32*month_offset)
-        month_start = month_start.replace(day=1)
-        month_end = month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
-        
-        # Calculate expected cash inflows (receivables due this month)
-        expected_inflows = 0
-        for invoice in invoices:
-            due_date = invoice.get("due_date")
-            if due_date and month_start <= due_date <= month_end:
-                expected_inflows += invoice.get("balance", invoice["total"])
-        
-        # Calculate expected cash outflows (payables due this month)
-        expected_outflows = 0
-        for bill in bills:
-            due_date = bill.get("due_date")
-            if due_date and month_start <= due_date <= month_end:
-                expected_outflows += bill.get("balance", bill["total"])
+    for month_offset, month_start in enumerate(month_starts):
+        # Expected cash inflows (receivables due this month) and outflows (payables)
+        expected_inflows = float(due_inflows[month_offset])
+        expected_outflows = float(due_outflows[month_offset])
         
         # Calculate historical average for this month (simplified)
         historical_avg_inflow = expected_inflows * 0.8  # 80% collection rate assumption
@@ -2196,279 +2724,959 @@ async def get_cash_flow_projections(months: int = 12):
     
     return {
         "current_cash_position": current_cash,
-        "total_receivables": sum(inv.get("balance", inv["total"]) for inv in invoices),
-        "total_payables": sum(bill.get("balance", bill["total"]) for bill in bills),
+        "total_receivables": open_totals["Invoice"],
+        "total_payables": open_totals["Bill"],
         "projections": projections
     }
 
-# Profit & Loss by Class/Location
-@api_router.get("/reports/profit-loss-by-class")
-async def get_profit_loss_by_class(
-    start_date: str = None,
-    end_date: str = None
-):
-    """Generate P&L report segmented by class"""
-    # Set default date range if not provided
+# Profit & Loss by Class/Location and other dimensions
+# Dimension name -> (field holding its id, collection with its names, label when unset)
+PL_DIMENSIONS = {
+    "class": ("line_items.class_id", "classes", "Unclassified"),
+    "location": ("line_items.location_id", "locations", "Unspecified"),
+    "item": ("line_items.item_id", "items", "No Item"),
+    "customer": ("customer_id", "customers", "No Customer"),
+    "vendor": ("vendor_id", "vendors", "No Vendor"),
+}
+
+# Transaction types whose line items post to income and expense accounts
+PL_LINE_TRANSACTION_TYPES = ["Invoice", "Sales Receipt", "Bill", "Check"]
+
+def parse_pl_dimensions(dimensions: str) -> List[str]:
+    names = [name.strip() for name in dimensions.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PL_DIMENSIONS]
+    if not names or unknown or len(set(names)) != len(names):
+        raise HTTPException(
+            status_code=400,
+            detail=f"dimensions must be a comma-separated subset of: {', '.join(PL_DIMENSIONS)}"
+        )
+    return names
+
+async def build_dimensional_pl(
+    dimensions: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> Dict[str, Any]:
+    """Income and expense per account for each combination of dimension values.
+    
+    Line items are unwound and summed in one aggregation; account and
+    dimension names are then resolved with one query per lookup collection.
+    """
     if not start_date:
-        start_date = datetime.utcnow().replace(day=1).isoformat()
+        start_date = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
     if not end_date:
         end_date = datetime.utcnow().isoformat()
     
-    start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-    end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-    
-    # Get all classes
-    classes = await db.classes.find({"active": True}).to_list(100)
-    
-    # Get transactions within date range
-    transactions = await db.transactions.find({
-        "date": {"$gte": start_dt, "$lte": end_dt}
-    }).to_list(1000)
-    
-    # Initialize P&L structure
-    pl_by_class = {}
+    pl_accounts = {
+        account["id"]: account
+        for account in await db.accounts.find(
+            {"account_type": {"$in": ["Income", "Expense"]}},
+            projection(["id", "name", "account_type"])
+        ).to_list(None)
+    }
     
-    # Add "Unclassified" for transactions without class assignment
-    all_classes = [{"id": None, "name": "Unclassified"}] + classes
+    group_id = {name: f"${PL_DIMENSIONS[name][0]}" for name in dimensions}
+    group_id["account_id"] = "$line_items.account_id"
+    rows = await db.transactions.aggregate([
+        {"$match": {
+            "transaction_type": {"$in": PL_LINE_TRANSACTION_TYPES},
+            "status": {"$ne": "Voided"},
+            "date": report_date_range(start_date, end_date)
+        }},
+        {"$unwind": "$line_items"},
+        {"$match": {"line_items.account_id": {"$in": list(pl_accounts)}}},
+        {"$group": {"_id": group_id, "amount": {"$sum": "$line_items.amount"}, "line_count": {"$sum": 1}}}
+    ]).to_list(None)
+    
+    dimension_names = {}
+    for name in dimensions:
+        ids = list({row["_id"].get(name) for row in rows if row["_id"].get(name)})
+        collection = PL_DIMENSIONS[name][1]
+        dimension_names[name] = {
+            doc["id"]: doc["name"]
+            for doc in await db[collection].find({"id": {"$in": ids}}, projection(["id", "name"])).to_list(None)
+        }
     
-    for class_item in all_classes:
-        class_id = class_item["id"]
-        class_name = class_item["name"]
+    segments = {}
+    for row in rows:
+        key = tuple(row["_id"].get(name) for name in dimensions)
+        segment = segments.get(key)
+        if segment is None:
+            segment = {}
+            for name, value in zip(dimensions, key):
+                segment[f"{name}_id"] = value
+                segment[f"{name}_name"] = dimension_names[name].get(value, PL_DIMENSIONS[name][2])
+            segment.update({"income": [], "expenses": [], "total_income": 0, "total_expenses": 0, "net_income": 0})
+            segments[key] = segment
         
-        pl_by_class[class_name] = {
-            "class_id": class_id,
-            "class_name": class_name,
-            "income": [],
-            "expenses": [],
-            "total_income": 0,
-            "total_expenses": 0,
-            "net_income": 0
+        account = pl_accounts[row["_id"]["account_id"]]
+        line = {
+            "account_id": account["id"],
+            "account_name": account["name"],
+            "amount": row["amount"],
+            "line_count": row["line_count"]
         }
+        if account["account_type"] == "Income":
+            segment["income"].append(line)
+            segment["total_income"] += row["amount"]
+        else:
+            segment["expenses"].append(line)
+            segment["total_expenses"] += row["amount"]
     
-    # Process transactions
-    for transaction in transactions:
-        for line_item in transaction.get("line_items", []):
-            class_id = line_item.get("class_id")
-            class_name = next((c["name"] for c in all_classes if c["id"] == class_id), "Unclassified")
-            
-            if line_item.get("account_id"):
-                account = await db.accounts.find_one({"id": line_item["account_id"]})
-                if account:
-                    amount = line_item.get("amount", 0)
-                    
-                    if account["account_type"] == "Income":
-                        pl_by_class[class_name]["income"].append({
-                            "account_name": account["name"],
-                            "amount": amount,
-                            "transaction_id": transaction["id"],
-                            "transaction_type": transaction["transaction_type"],
-                            "date": transaction["date"]
-                        })
-                        pl_by_class[class_name]["total_income"] += amount
-                    
-                    elif account["account_type"] == "Expense":
-                        pl_by_class[class_name]["expenses"].append({
-                            "account_name": account["name"],
-                            "amount": amount,
-                            "transaction_id": transaction["id"],
-                            "transaction_type": transaction["transaction_type"],
-                            "date": transaction["date"]
-                        })
-                        pl_by_class[class_name]["total_expenses"] += amount
-    
-    # Calculate net income for each class
-    for class_name in pl_by_class:
-        pl_by_class[class_name]["net_income"] = (
-            pl_by_class[class_name]["total_income"] - 
-            pl_by_class[class_name]["total_expenses"]
-        )
-    
-    # Calculate totals
-    total_income = sum(data["total_income"] for data in pl_by_class.values())
-    total_expenses = sum(data["total_expenses"] for data in pl_by_class.values())
-    total_net_income = total_income - total_expenses
+    for segment in segments.values():
+        segment["net_income"] = segment["total_income"] - segment["total_expenses"]
+        segment["income"].sort(key=lambda line: line["account_name"])
+        segment["expenses"].sort(key=lambda line: line["account_name"])
     
+    total_income = sum(segment["total_income"] for segment in segments.values())
+    total_expenses = sum(segment["total_expenses"] for segment in segments.values())
     return {
         "report_period": {
             "start_date": start_date,
             "end_date": end_date
         },
-        "classes": pl_by_class,
+        "dimensions": dimensions,
+        "segments": sorted(segments.values(), key=lambda seg: [str(seg[f"{name}_name"]) for name in dimensions]),
         "totals": {
             "total_income": total_income,
             "total_expenses": total_expenses,
-            "net_income": total_net_income
+            "net_income": total_income - total_expenses
         }
     }
 
-@api_router.get("/reports/profit-loss-by-location")
-async def get_profit_loss_by_location(
-    start_date: str = None,
-    end_date: str = None
-):
-    """Generate P&L report segmented by location"""
-    # Set default date range if not provided
-    if not start_date:
-        start_date = datetime.utcnow().replace(day=1).isoformat()
-    if not end_date:
-        end_date = datetime.utcnow().isoformat()
-    
-    start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-    end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-    
-    # Get all locations
-    locations = await db.locations.find({"active": True}).to_list(100)
-    
-    # Get transactions within date range
-    transactions = await db.transactions.find({
-        "date": {"$gte": start_dt, "$lte": end_dt}
-    }).to_list(1000)
-    
-    # Initialize P&L structure
-    pl_by_location = {}
-    
-    # Add "Unspecified" for transactions without location assignment
-    all_locations = [{"id": None, "name": "Unspecified"}] + locations
-    
-    for location_item in all_locations:
-        location_id = location_item["id"]
-        location_name = location_item["name"]
-        
-        pl_by_location[location_name] = {
-            "location_id": location_id,
-            "location_name": location_name,
+async def build_single_dimension_pl(
+    dimension: str,
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> tuple:
+    """P&L keyed by dimension name, listing every active member even without activity.
+    
+    Segments are matched to members by id; segments that end up under the
+    same name (an unknown id shown with the unset label, or two members
+    sharing a name) are added together.
+    """
+    report = await build_dimensional_pl([dimension], start_date, end_date)
+    _, collection, unset_label = PL_DIMENSIONS[dimension]
+    
+    members = [{"id": None, "name": unset_label}]
+    members += await db[collection].find({"active": True}, projection(["id", "name"])).to_list(None)
+    by_id = {
+        member["id"]: {
+            f"{dimension}_id": member["id"],
+            f"{dimension}_name": member["name"],
             "income": [],
             "expenses": [],
             "total_income": 0,
             "total_expenses": 0,
             "net_income": 0
         }
+        for member in members
+    }
+    for segment in report["segments"]:
+        by_id[segment[f"{dimension}_id"]] = segment
+    
+    by_name = {}
+    for segment in by_id.values():
+        name = segment[f"{dimension}_name"]
+        if name in by_name:
+            merge_pl_segment(by_name[name], segment)
+        else:
+            by_name[name] = dict(segment)
+    return report, by_name
+
+def merge_pl_segment(into: Dict[str, Any], segment: Dict[str, Any]):
+    """Add a segment's account lines and totals into another shown under the same name"""
+    for side in ("income", "expenses"):
+        lines = {line["account_id"]: line for line in into[side]}
+        for line in segment[side]:
+            existing = lines.get(line["account_id"])
+            if existing:
+                line = {
+                    **existing,
+                    "amount": existing["amount"] + line["amount"],
+                    "line_count": existing["line_count"] + line["line_count"]
+                }
+            lines[line["account_id"]] = line
+        into[side] = sorted(lines.values(), key=lambda line: line["account_name"])
+    for total in ("total_income", "total_expenses", "net_income"):
+        into[total] += segment[total]
+
+@api_router.get("/reports/profit-loss-by-class")
+async def get_profit_loss_by_class(
+    start_date: str = None,
+    end_date: str = None
+):
+    """Generate P&L report segmented by class"""
+    report, pl_by_class = await build_single_dimension_pl("class", start_date, end_date)
+    return {
+        "report_period": report["report_period"],
+        "classes": pl_by_class,
+        "totals": report["totals"]
+    }
+
+@api_router.get("/reports/profit-loss-by-location")
+async def get_profit_loss_by_location(
+    start_date: str = None,
+    end_date: str = None
+):
+    """Generate P&L report segmented by location"""
+    report, pl_by_location = await build_single_dimension_pl("location", start_date, end_date)
+    return {
+        "report_period": report["report_period"],
+        "locations": pl_by_location,
+        "totals": report["totals"]
+    }
+
+@api_router.get("/reports/profit-loss-by-dimension")
+async def get_profit_loss_by_dimension(
+    dimensions: str = Query("class", description="Comma-separated: class, location, item, customer, vendor"),
+    start_date: str = None,
+    end_date: str = None
+):
+    """Generate P&L report segmented by any combination of dimensions"""
+    return await build_dimensional_pl(parse_pl_dimensions(dimensions), start_date, end_date)
+
+# Pivot dimension name -> (cube field, collection with its names, label when unset)
+PIVOT_DIMENSIONS = {
+    "account": ("account_id", "accounts", "No Account"),
+    **{name: (f"{name}_id", collection, label) for name, (_, collection, label) in PL_DIMENSIONS.items()},
+    "month": ("month", None, None),
+}
+PIVOT_MEASURES = ["debit", "credit", "net", "qty", "line_count"]
+
+@api_router.get("/reports/pivot")
+async def get_report_pivot(
+    dimensions: str = Query("account,month", description="Comma-separated: account, class, location, item, customer, vendor, month"),
+    measures: str = Query("debit,credit,net", description="Comma-separated: debit, credit, net, qty, line_count"),
+    start_month: Optional[str] = Query(None, description="First month to include, YYYY-MM"),
+    end_month: Optional[str] = Query(None, description="Last month to include, YYYY-MM"),
+    account_type: Optional[AccountType] = None
+):
+    """Pivot line-item postings over any dimensions, answered from the ledger cube.
     
-    # Process transactions
-    for transaction in transactions:
-        for line_item in transaction.get("line_items", []):
-            location_id = line_item.get("location_id")
-            location_name = next((l["name"] for l in all_locations if l["id"] == location_id), "Unspecified")
-            
-            if line_item.get("account_id"):
-                account = await db.accounts.find_one({"id": line_item["account_id"]})
-                if account:
-                    amount = line_item.get("amount", 0)
-                    
-                    if account["account_type"] == "Income":
-                        pl_by_location[location_name]["income"].append({
-                            "account_name": account["name"],
-                            "amount": amount,
-                            "transaction_id": transaction["id"],
-                            "transaction_type": transaction["transaction_type"],
-                            "date": transaction["date"]
-                        })
-                        pl_by_location[location_name]["total_income"] += amount
-                    
-                    elif account["account_type"] == "Expense":
-                        pl_by_location[location_name]["expenses"].append({
-                            "account_name": account["name"],
-                            "amount": amount,
-                            "transaction_id": transaction["id"],
-                            "transaction_type": transaction["transaction_type"],
-                            "date": transaction["date"]
-                        })
-                        pl_by_location[location_name]["total_expenses"] += amount
-    
-    # Calculate net income for each location
-    for location_name in pl_by_location:
-        pl_by_location[location_name]["net_income"] = (
-            pl_by_location[location_name]["total_income"] - 
-            pl_by_location[location_name]["total_expenses"]
-        )
+    net is debit - credit, matching the journal's balance convention.
+    """
+    dimension_names = [name.strip() for name in dimensions.split(",") if name.strip()]
+    measure_names = [name.strip() for name in measures.split(",") if name.strip()]
+    if not dimension_names or any(name not in PIVOT_DIMENSIONS for name in dimension_names) or len(set(dimension_names)) != len(dimension_names):
+        raise HTTPException(status_code=400, detail=f"dimensions must be a comma-separated subset of: {', '.join(PIVOT_DIMENSIONS)}")
+    if not measure_names or any(name not in PIVOT_MEASURES for name in measure_names):
+        raise HTTPException(status_code=400, detail=f"measures must be a comma-separated subset of: {', '.join(PIVOT_MEASURES)}")
     
-    # Calculate totals
-    total_income = sum(data["total_income"] for data in pl_by_location.values())
-    total_expenses = sum(data["total_expenses"] for data in pl_by_location.values())
-    total_net_income = total_income - total_expenses
+    query = {}
+    month_range = {}
+    if start_month:
+        month_range["$gte"] = parse_period(start_month)[0].strftime("%Y-%m")
+    if end_month:
+        month_range["$lte"] = parse_period(end_month)[0].strftime("%Y-%m")
+    if month_range:
+        query["month"] = month_range
+    if account_type:
+        account_ids = await db.accounts.distinct("id", {"account_type": account_type})
+        query["account_id"] = {"$in": account_ids}
+    
+    rows = await db.ledger_cube.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": {name: f"${PIVOT_DIMENSIONS[name][0]}" for name in dimension_names},
+            **{measure: {"$sum": f"${measure}"} for measure in CUBE_MEASURES}
+        }}
+    ]).to_list(None)
+    
+    names = {}
+    for name in dimension_names:
+        collection = PIVOT_DIMENSIONS[name][1]
+        if collection:
+            ids = list({row["_id"].get(name) for row in rows if row["_id"].get(name)})
+            names[name] = {
+                doc["id"]: doc["name"]
+                for doc in await db[collection].find({"id": {"$in": ids}}, projection(["id", "name"])).to_list(None)
+            }
     
+    result_rows = []
+    totals = {measure: 0 for measure in measure_names}
+    for row in rows:
+        if not any(row[measure] for measure in CUBE_MEASURES):
+            continue
+        result = {}
+        for name in dimension_names:
+            field, collection, label = PIVOT_DIMENSIONS[name]
+            value = row["_id"].get(name)
+            result[field] = value
+            if collection:
+                result[f"{name}_name"] = names[name].get(value, label)
+        row["net"] = row["debit"] - row["credit"]
+        for measure in measure_names:
+            result[measure] = round(row[measure], 2)
+            totals[measure] += row[measure]
+        result_rows.append(result)
+    
+    result_rows.sort(key=lambda r: [str(r.get(f"{name}_name", r.get(PIVOT_DIMENSIONS[name][0]))) for name in dimension_names])
     return {
-        "report_period": {
-            "start_date": start_date,
-            "end_date": end_date
-        },
-        "locations": pl_by_location,
-        "totals": {
-            "total_income": total_income,
-            "total_expenses": total_expenses,
-            "net_income": total_net_income
-        }
+        "dimensions": dimension_names,
+        "measures": measure_names,
+        "rows": result_rows,
+        "totals": {measure: round(total, 2) for measure, total in totals.items()}
     }
 
+@api_router.post("/ledger/rebuild-cube")
+async def rebuild_ledger_cube_endpoint():
+    """Recreate the ledger cube from transactions"""
+    return await rebuild_ledger_cube()
+
 # Dashboard Analytics API
 @api_router.get("/analytics/dashboard-metrics")
-async def get_dashboard_metrics():
-    """Get real-time dashboard metrics and KPIs"""
+async def get_dashboard_metrics(refresh: bool = False):
+    """Get dashboard metrics and KPIs, served from a snapshot cached until the ledger changes"""
+    _, body, cache_status, age = await get_dashboard_snapshot(refresh)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"X-Cache": cache_status, "X-Cache-Age": f"{age:.3f}"}
+    )
+
+@api_router.get("/analytics/dashboard-stream")
+async def stream_dashboard_metrics(request: Request):
+    """Server-Sent Events feed of dashboard metrics.
+    
+    Sends a full `metrics` event on connect, then a `metrics-delta` event with
+    only the changed values shortly after each ledger write.
+    """
+    queue = subscribe_ledger_changes()
+    
+    async def events():
+        try:
+            data, _, _, _ = await get_dashboard_snapshot()
+            yield format_sse("metrics", data)
+            while not await request.is_disconnected():
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=DASHBOARD_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                # Let a burst of writes settle into a single update
+                await asyncio.sleep(DASHBOARD_STREAM_DEBOUNCE_SECONDS)
+                while not queue.empty():
+                    queue.get_nowait()
+                
+                latest, _, _, _ = await get_dashboard_snapshot()
+                delta = dashboard_delta(data, latest)
+                data = latest
+                if delta:
+                    yield format_sse("metrics-delta", delta)
+        finally:
+            unsubscribe_ledger_changes(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/analytics/kpi-trends")
+async def get_kpi_trends(
+    period: str = "12months",
+    granularity: Optional[str] = Query(None, pattern="^(day|week|month|quarter)$"),
+    lookback: Optional[int] = Query(None, ge=1, le=366)
+):
+    """Get KPI trends over time for dashboard charts"""
+    # period is shorthand such as 12months or 8quarters; explicit parameters win
+    match = re.fullmatch(r"([1-9]\d*)(day|week|month|quarter)s?", period)
+    if not match and not (granularity and lookback):
+        raise HTTPException(status_code=400, detail="period must look like 12months, 30days, 8weeks or 4quarters")
+    granularity = granularity or match.group(2)
+    lookback = lookback or min(int(match.group(1)), 366)
+    
     today = datetime.utcnow()
-    month_start = today.replace(day=1)
-    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
-    last_month_end = month_start - timedelta(days=1)
+    starts = analytics_period_starts(today, granularity, lookback)
+    window_end = analytics_step(starts[-1], granularity, 1)
+    
+    # Closed months are answered from their period-close summary. Loading skips
+    # only the run of closed months at the start of the window: the first close
+    # may fall mid-window, leaving earlier months that must still be loaded.
+    closed_summaries = {}
+    load_from = starts[0]
+    if granularity == "month":
+        async for closed in db.closed_periods.find({
+            "status": "Closed",
+            "period": {"$in": [start.strftime("%Y-%m") for start in starts]}
+        }):
+            closed_summaries[closed["period"]] = closed
+        for start in starts:
+            closed = closed_summaries.get(start.strftime("%Y-%m"))
+            if not closed:
+                break
+            load_from = closed["period_end"]
     
-    # Get cash position
-    cash_accounts = await db.accounts.find({
-        "detail_type": {"$in": ["Checking", "Savings"]},
-        "active": True
-    }).to_list(100)
+    frame = await load_transaction_frame(load_from, window_end)
+    summary = summarize_frame_by_period(frame, starts, window_end)
     
-    total_cash = 0
-    for account in cash_accounts:
-        total_cash += await calculate_account_balance(account["id"])
+    trends = []
+    for index, start in enumerate(starts):
+        closed = closed_summaries.get(start.strftime("%Y-%m")) if granularity == "month" else None
+        income = closed["income"] if closed else float(summary["income"][index])
+        expenses = closed["expenses"] if closed else float(summary["expenses"][index])
+        trends.append({
+            "period": analytics_period_label(start, granularity),
+            "period_start": start,
+            "income": income,
+            "expenses": expenses,
+            "profit": income - expenses,
+            "transaction_count": closed["transaction_count"] if closed else int(summary["transaction_count"][index])
+        })
     
-    # Get A/R and A/P
-    ar_account = await db.accounts.find_one({"detail_type": "Accounts Receivable"})
-    ap_account = await db.accounts.find_one({"detail_type": "Accounts Payable"})
+    return {"granularity": granularity, "trends": trends}
+
+# Dashboard drill-down. Flow metrics (income, expenses) cover a period; position
+# metrics (cash, A/R, A/P, overdue invoices, one account) cover everything to date
+# unless a range is given. Rows are keyset-paged while totals come from one $group,
+# so the first page stays cheap and the grand total stays exact.
+DRILL_DOWN_SOURCES = {
+    "transactions": {
+        "collection": "transactions",
+        "amount": "$total",
+        "fields": ["id", "transaction_type", "transaction_number", "reference_number", "date", "total", "customer_id", "vendor_id"]
+    },
+    "open_items": {
+        "collection": "open_items",
+        "amount": "$balance",
+        "fields": [
+            "id", "transaction_type", "transaction_number", "reference_number",
+            "date", "due_date", "total", "balance", "customer_id", "vendor_id"
+        ]
+    },
+    "journal": {
+        "collection": "journal_entries",
+        "amount": {"$subtract": ["$debit", "$credit"]},
+        "fields": ["id", "transaction_id", "account_id", "description", "date", "debit", "credit"]
+    }
+}
+
+async def drill_down_scope(metric: str, account_id: Optional[str], today: datetime) -> tuple:
+    """Source, filter, sort key, row key and whether the metric is a flow over a period"""
+    if metric == "income":
+        return "transactions", {"transaction_type": {"$in": ANALYTICS_INCOME_TYPES}}, "date", "transactions", True
+    if metric == "expenses":
+        return "transactions", {"transaction_type": {"$in": ANALYTICS_EXPENSE_TYPES}}, "date", "transactions", True
+    if metric == "overdue_invoices":
+        return "open_items", {"transaction_type": "Invoice", "due_date": {"$lt": today}}, "due_date", "invoices", False
+    if metric == "ar":
+        return "open_items", {"transaction_type": "Invoice"}, "date", "invoices", False
+    if metric == "ap":
+        return "open_items", {"transaction_type": "Bill"}, "date", "bills", False
+    if metric == "cash":
+        cash_accounts = await db.accounts.find(
+            {"detail_type": {"$in": ["Checking", "Savings"]}, "active": True}, projection(["id"])
+        ).to_list(None)
+        return "journal", {"account_id": {"$in": [a["id"] for a in cash_accounts]}}, "date", "entries", False
+    if metric == "account":
+        if not account_id:
+            raise HTTPException(status_code=400, detail="account_id is required for the account metric")
+        if not await db.accounts.find_one({"id": account_id}, projection(["id"])):
+            raise HTTPException(status_code=404, detail="Account not found")
+        return "journal", {"account_id": account_id}, "date", "entries", False
+    raise HTTPException(status_code=400, detail="Invalid metric specified")
+
+def drill_down_row(source: str, doc: dict, today: datetime) -> Dict[str, Any]:
+    if source == "transactions":
+        return {
+            "id": doc["id"],
+            "type": doc.get("transaction_type"),
+            "transaction_number": doc.get("transaction_number"),
+            "amount": doc.get("total", 0),
+            "date": doc.get("date"),
+            "customer_id": doc.get("customer_id"),
+            "vendor_id": doc.get("vendor_id"),
+            "reference": doc.get("reference_number") or ""
+        }
+    if source == "open_items":
+        due_date = doc.get("due_date")
+        return {
+            "id": doc["id"],
+            "type": doc.get("transaction_type"),
+            "invoice_number": doc.get("transaction_number") or "",
+            "customer_id": doc.get("customer_id"),
+            "vendor_id": doc.get("vendor_id"),
+            "amount": doc.get("total", 0),
+            "balance": doc.get("balance", 0),
+            "date": doc.get("date"),
+            "due_date": due_date,
+            "days_overdue": max((today - due_date).days, 0) if due_date else 0
+        }
+    return {
+        "id": doc["id"],
+        "transaction_id": doc.get("transaction_id"),
+        "account_id": doc.get("account_id"),
+        "description": doc.get("description"),
+        "date": doc.get("date"),
+        "debit": doc.get("debit", 0),
+        "credit": doc.get("credit", 0),
+        "amount": doc.get("debit", 0) - doc.get("credit", 0)
+    }
+
+@api_router.get("/analytics/drill-down/{metric}")
+async def get_drill_down_data(
+    metric: str,
+    response: Response,
+    period: str = "current_month",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    account_id: Optional[str] = None,
+    page: PageParams = Depends()
+):
+    """Get drill-down data for dashboard metrics: one page of rows plus exact totals"""
+    today = datetime.utcnow()
+    source, query, sort_field, rows_key, is_flow = await drill_down_scope(metric, account_id, today)
+    
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        period = "custom"
+    elif is_flow:
+        month_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if period == "last_month":
+            date_range = {"$gte": add_months(month_start, -1), "$lt": month_start}
+        else:
+            period = "current_month"
+            date_range = {"$gte": month_start, "$lte": today}
+    else:
+        period = "current"
+    if date_range:
+        query["date"] = date_range
+    
+    collection = db[DRILL_DOWN_SOURCES[source]["collection"]]
+    totals_pipeline = [
+        {"$match": query},
+        {"$group": {"_id": None, "total": {"$sum": DRILL_DOWN_SOURCES[source]["amount"]}, "count": {"$sum": 1}}}
+    ]
+    docs, totals = await asyncio.gather(
+        find_page(
+            collection, query, page, response, sort_field=sort_field,
+            default_order="asc" if metric == "overdue_invoices" else "desc",
+            fields=DRILL_DOWN_SOURCES[source]["fields"]
+        ),
+        collection.aggregate(totals_pipeline).to_list(1)
+    )
+    totals = totals[0] if totals else {"total": 0, "count": 0}
     
-    total_ar = await calculate_account_balance(ar_account["id"]) if ar_account else 0
-    total_ap = await calculate_account_balance(ap_account["id"]) if ap_account else 0
-    
-    # Get monthly income and expenses
-    current_month_income = 0
-    current_month_expenses = 0
-    last_month_income = 0
-    last_month_expenses = 0
-    
-    # Current month transactions
-    current_month_transactions = await db.transactions.find({
-        "date": {"$gte": month_start, "$lte": today}
-    }).to_list(1000)
-    
-    for transaction in current_month_transactions:
-        if transaction["transaction_type"] in ["Invoice", "Sales Receipt"]:
-            current_month_income += transaction["total"]
-        elif transaction["transaction_type"] in ["Bill", "Check"]:
-            current_month_expenses += transaction["total"]
-    
-    # Last month transactions
-    last_month_transactions = await db.transactions.find({
-        "date": {"$gte": last_month_start, "$lte": last_month_end}
-    }).to_list(1000)
-    
-    for transaction in last_month_transactions:
-        if transaction["transaction_type"] in ["Invoice", "Sales Receipt"]:
-            last_month_income += transaction["total"]
-        elif transaction["transaction_type"] in ["Bill", "Check"]:
-            last_month_expenses += transaction["total"]
+    return {
+        "metric": metric,
+        "period": period,
+        "start_date": date_range.get("$gte"),
+        "end_date": date_range.get("$lt") or date_range.get("$lte"),
+        "total": totals["total"],
+        "count": totals["count"],
+        rows_key: [drill_down_row(source, doc, today) for doc in docs]
+    }
+
+# Period Close & Balance Snapshots
+@api_router.post("/period-close", response_model=PeriodClose)
+async def close_period(request: PeriodCloseCreate):
+    """Close a month and write immutable per-account closing snapshots"""
+    period_start, period_end = parse_period(request.period)
+    if period_end > datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Cannot close a period that has not ended")
+    
+    latest = await db.closed_periods.find_one({"status": "Closed"}, sort=[("period_end", -1)])
+    if latest and latest["period_end"] != period_start:
+        expected = latest["period_end"].strftime("%Y-%m")
+        if latest["period_end"] > period_start:
+            raise HTTPException(status_code=400, detail=f"Period {request.period} is already closed")
+        raise HTTPException(status_code=400, detail=f"Periods must be closed in order; close {expected} first")
+    
+    # Cumulative totals carry forward from the previous snapshot when there is one
+    period_totals = await get_account_totals({"date": {"$gte": period_start, "$lt": period_end}})
+    if latest:
+        cumulative = {}
+        async for snapshot in db.account_balance_snapshots.find({"period": latest["period"]}):
+            cumulative[snapshot["account_id"]] = {
+                "debit": snapshot["debit_total"],
+                "credit": snapshot["credit_total"]
+            }
+        for account_id, totals in period_totals.items():
+            account_totals = cumulative.setdefault(account_id, {"debit": 0, "credit": 0})
+            account_totals["debit"] += totals["debit"]
+            account_totals["credit"] += totals["credit"]
+    else:
+        cumulative = await get_account_totals({"date": {"$lt": period_end}})
+    
+    snapshots = []
+    for account_id, totals in cumulative.items():
+        activity = period_totals.get(account_id, {"debit": 0, "credit": 0})
+        snapshots.append(AccountBalanceSnapshot(
+            period=request.period,
+            account_id=account_id,
+            period_start=period_start,
+            period_end=period_end,
+            period_debit=activity["debit"],
+            period_credit=activity["credit"],
+            debit_total=totals["debit"],
+            credit_total=totals["credit"],
+            closing_balance=totals["debit"] - totals["credit"]
+        ).dict())
+    
+    summary = await summarize_period_transactions(period_start, period_end)
+    period_close = PeriodClose(
+        period=request.period,
+        period_start=period_start,
+        period_end=period_end,
+        closed_by=request.closed_by,
+        accounts_snapshotted=len(snapshots),
+        **summary
+    )
+    
+    # The close record claims the period first; the unique index on closed
+    # periods turns a concurrent close of the same month into a 409.
+    try:
+        await db.closed_periods.insert_one(period_close.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=f"Period {request.period} is already being closed")
+    try:
+        if snapshots:
+            await db.account_balance_snapshots.insert_many(snapshots)
+    except Exception:
+        await db.account_balance_snapshots.delete_many({"period": request.period})
+        await db.closed_periods.delete_one({"id": period_close.id})
+        raise
+    return period_close
+
+@api_router.get("/period-close", response_model=List[PeriodClose])
+async def get_closed_periods(include_reopened: bool = False):
+    """List period closes, most recent first"""
+    query = {} if include_reopened else {"status": "Closed"}
+    periods = await db.closed_periods.find(query, {"_id": 0}).sort("period_end", -1).to_list(None)
+    return model_list_response(PeriodClose, periods)
+
+@api_router.get("/period-close/{period}/snapshots", response_model=List[AccountBalanceSnapshot])
+async def get_period_snapshots(period: str):
+    """Get the closing balance snapshots written for a period"""
+    parse_period(period)
+    snapshots = await db.account_balance_snapshots.find({"period": period}, {"_id": 0}).to_list(None)
+    return model_list_response(AccountBalanceSnapshot, snapshots)
+
+@api_router.post("/period-close/{period}/reopen")
+async def reopen_period(period: str, request: PeriodReopenRequest):
+    """Reopen a closed period and every later one, logging the reopen as an audit event"""
+    period_start, _ = parse_period(period)
+    closed = await db.closed_periods.find(
+        {"status": "Closed", "period_start": {"$gte": period_start}}, {"_id": 0}
+    ).sort("period_start", 1).to_list(None)
+    if not closed or closed[0]["period"] != period:
+        raise HTTPException(status_code=404, detail=f"Period {period} is not closed")
+    
+    reopened = [p["period"] for p in closed]
+    await db.account_balance_snapshots.delete_many({"period": {"$in": reopened}})
+    await db.closed_periods.update_many(
+        {"status": "Closed", "period": {"$in": reopened}},
+        {"$set": {"status": "Reopened", "reopened_at": datetime.utcnow()}}
+    )
+    
+    audit_log = AuditLog(
+        user_id=request.user_id,
+        action="reopen",
+        resource_type="period_close",
+        resource_id=period,
+        old_values={"closed_periods": reopened},
+        new_values={"reason": request.reason}
+    )
+    await db.audit_logs.insert_one(audit_log.dict())
+    
+    return {"message": f"Reopened {len(reopened)} period(s)", "reopened_periods": reopened}
+
+
+# Helper functions
+async def calculate_account_balance(account_id: str):
+    """Calculate the current balance of an account from journal entries"""
+    totals = await get_account_totals({"account_id": account_id})
+    account_totals = totals.get(account_id, {"debit": 0, "credit": 0})
+    return account_totals["debit"] - account_totals["credit"]
+
+def parse_report_date(value: str, param: str = "date") -> datetime:
+    """Parse an ISO date/datetime query parameter into a naive UTC datetime"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {param}: {value}")
+    return naive_utc(parsed)
+
+def report_date_range(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, datetime]:
+    """Build a Mongo date range; a date-only end_date covers that whole day"""
+    date_range = {}
+    if start_date:
+        date_range["$gte"] = parse_report_date(start_date, "start_date")
+    if end_date:
+        end_dt = parse_report_date(end_date, "end_date")
+        if len(end_date) == 10:
+            date_range["$lt"] = end_dt + timedelta(days=1)
+        else:
+            date_range["$lte"] = end_dt
+    return date_range
+
+def parse_aging_params(as_of: Optional[str], buckets: str) -> tuple:
+    """Resolve the aging reference date and ascending bucket boundaries.
+    
+    Aging sums the current open balances, and payments do not record when
+    they were applied, so a past as_of cannot be rebuilt and is rejected
+    rather than reported with today's balances.
+    """
+    now = datetime.utcnow()
+    as_of_dt = parse_report_date(as_of, "as_of") if as_of else now
+    if as_of and len(as_of) == 10:
+        as_of_dt = as_of_dt + timedelta(days=1) - timedelta(microseconds=1)
+    if as_of_dt < now.replace(hour=0, minute=0, second=0, microsecond=0):
+        raise HTTPException(status_code=400, detail="as_of cannot be in the past; aging reflects current open balances")
+    try:
+        boundaries = [int(value) for value in buckets.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="buckets must be comma-separated whole days, e.g. 30,60,90")
+    if not boundaries or boundaries != sorted(set(boundaries)) or boundaries[0] < 0:
+        raise HTTPException(status_code=400, detail="buckets must be ascending, non-negative and unique")
+    return as_of_dt, boundaries
+
+def aging_bucket_keys(boundaries: List[int]) -> List[str]:
+    """Bucket names for the boundaries; 30,60,90 gives current, days_31_60, days_61_90, over_90"""
+    keys = ["current"]
+    for lower, upper in zip(boundaries, boundaries[1:]):
+        keys.append(f"days_{lower + 1}_{upper}")
+    keys.append(f"over_{boundaries[-1]}")
+    return keys
+
+async def build_aging_report(
+    transaction_type: str,
+    party_field: str,
+    party_collection: str,
+    as_of: datetime,
+    boundaries: List[int],
+    aging_basis: str = "date"
+) -> List[Dict[str, Any]]:
+    """Bucket open balances by age per customer or vendor in one aggregation.
+    
+    Documents dated after as_of are excluded and age is measured from the
+    document date (or due date, falling back to the document date) to as_of.
+    Balances are the current ones, so as_of is today or a later date.
+    """
+    keys = aging_bucket_keys(boundaries)
+    age_from = "$date" if aging_basis == "date" else {"$ifNull": ["$due_date", "$date"]}
+    
+    bucket_sums = {}
+    for index, key in enumerate(keys):
+        conditions = []
+        if index > 0:
+            conditions.append({"$gt": ["$age_days", boundaries[index - 1]]})
+        if index < len(boundaries):
+            conditions.append({"$lte": ["$age_days", boundaries[index]]})
+        bucket_sums[key] = {"$sum": {"$cond": [{"$and": conditions}, "$open_balance", 0]}}
+    
+    pipeline = [
+        {"$match": {"transaction_type": transaction_type, "date": {"$lte": as_of}}},
+        {"$project": {
+            "party_id": f"${party_field}",
+            "open_balance": "$balance",
+            "age_days": {"$floor": {"$divide": [{"$subtract": [as_of, age_from]}, 86400000]}}
+        }},
+        {"$group": {"_id": "$party_id", **bucket_sums, "total": {"$sum": "$open_balance"}}},
+        {"$lookup": {
+            "from": party_collection,
+            "localField": "_id",
+            "foreignField": "id",
+            "as": "party"
+        }}
+    ]
+    
+    rows = []
+    async for row in db.open_items.aggregate(pipeline):
+        party = row["party"][0] if row["party"] else {}
+        rows.append({
+            "party_id": row["_id"],
+            "party_name": party.get("name", "Unassigned"),
+            **{key: round(row[key], 2) for key in keys},
+            "total": round(row["total"], 2)
+        })
+    rows.sort(key=lambda row: row["party_name"].lower())
+    return rows
+
+def add_months(month_start: datetime, months: int) -> datetime:
+    """First instant of the month `months` away from the one containing month_start"""
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def parse_period(period: str) -> tuple:
+    """Parse a YYYY-MM period into its [start, end) datetimes"""
+    try:
+        period_start = datetime.strptime(period, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid period: {period} (expected YYYY-MM)")
+    return period_start, add_months(period_start, 1)
+
+def naive_utc(value: datetime) -> datetime:
+    """Normalize an aware datetime to the naive UTC form stored in MongoDB"""
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def get_latest_closed_period() -> Optional[Dict[str, Any]]:
+    """The most recent closed period; nothing dated before its end may be posted"""
+    return await db.closed_periods.find_one(
+        {"status": "Closed"},
+        projection(["period", "period_end"]),
+        sort=[("period_end", -1)]
+    )
+
+async def ensure_period_open(date: datetime):
+    """Reject postings dated on or before the end of the latest closed period"""
+    latest = await get_latest_closed_period()
+    if latest and naive_utc(date) < latest["period_end"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot post to a closed period (closed through {latest['period']}); reopen it first"
+        )
+
+async def summarize_period_transactions(start: datetime, end: datetime) -> Dict[str, Any]:
+    """Income, expense and count totals for transactions dated in [start, end)"""
+    pipeline = [
+        {"$match": {"date": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": None,
+            "income": {"$sum": {"$cond": [{"$in": ["$transaction_type", ["Invoice", "Sales Receipt"]]}, "$total", 0]}},
+            "expenses": {"$sum": {"$cond": [{"$in": ["$transaction_type", ["Bill", "Check"]]}, "$total", 0]}},
+            "transaction_count": {"$sum": 1}
+        }}
+    ]
+    async for row in db.transactions.aggregate(pipeline):
+        return {"income": row["income"], "expenses": row["expenses"], "transaction_count": row["transaction_count"]}
+    return {"income": 0, "expenses": 0, "transaction_count": 0}
+
+# Dashboard snapshot cache. The database holds a single company, so one rendered
+# snapshot per process serves every dashboard until a ledger write invalidates
+# it; the TTL bounds staleness from writes handled by other worker processes.
+DASHBOARD_CACHE_TTL_SECONDS = float(os.environ.get("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+_dashboard_cache = {"data": None, "body": None, "computed_at": 0.0, "generation": 0}
+_dashboard_lock = asyncio.Lock()
+
+# Ledger change bus: each live dashboard stream holds a one-slot queue that is
+# signalled after every ledger write in this process, or in any process when
+# MongoDB change streams are available.
+DASHBOARD_STREAM_HEARTBEAT_SECONDS = 15
+DASHBOARD_STREAM_DEBOUNCE_SECONDS = 0.25
+_ledger_subscribers = set()
+
+def subscribe_ledger_changes() -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=1)
+    _ledger_subscribers.add(queue)
+    return queue
+
+def unsubscribe_ledger_changes(queue: asyncio.Queue):
+    _ledger_subscribers.discard(queue)
+
+def notify_ledger_change():
+    """Drop caches derived from the ledger after a write and wake live dashboards"""
+    _dashboard_cache["generation"] += 1
+    _dashboard_cache["body"] = None
+    for queue in _ledger_subscribers:
+        if queue.empty():
+            queue.put_nowait(True)
+
+async def get_dashboard_snapshot(refresh: bool = False) -> tuple:
+    """The dashboard snapshot as (data, rendered body, HIT or MISS, age in seconds)"""
+    cache = _dashboard_cache
+    if not refresh and cache["body"] is not None:
+        age = time.monotonic() - cache["computed_at"]
+        if age < DASHBOARD_CACHE_TTL_SECONDS:
+            return cache["data"], cache["body"], "HIT", age
+    
+    async with _dashboard_lock:
+        # Another request may have rebuilt the snapshot while this one waited
+        age = time.monotonic() - cache["computed_at"]
+        if not refresh and cache["body"] is not None and age < DASHBOARD_CACHE_TTL_SECONDS:
+            return cache["data"], cache["body"], "HIT", age
+        
+        generation = cache["generation"]
+        computed_at = time.monotonic()
+        data = jsonable_encoder(await compute_dashboard_metrics())
+        body = json.dumps(data).encode()
+        if cache["generation"] == generation:
+            cache.update(data=data, body=body, computed_at=computed_at)
+    return data, body, "MISS", 0.0
+
+def dashboard_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """The sections and values that differ between two dashboard snapshots"""
+    delta = {}
+    for section in ("financial_metrics", "alerts"):
+        changed = {
+            key: value for key, value in current[section].items()
+            if previous[section].get(key) != value
+        }
+        if changed:
+            delta[section] = changed
+    if current["recent_activity"] != previous["recent_activity"]:
+        delta["recent_activity"] = current["recent_activity"]
+    return delta
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def watch_ledger_changes():
+    """Relay writes made by other processes to this process's ledger change bus"""
+    pipeline = [{"$match": {
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        "ns.coll": {"$in": ["journal_entries", "transactions", "accounts", "open_items"]}
+    }}]
+    while True:
+        try:
+            async with db.watch(pipeline) as stream:
+                async for _ in stream:
+                    notify_ledger_change()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Ledger change stream interrupted, retrying: {e}")
+            await asyncio.sleep(5)
+
+async def compute_dashboard_metrics() -> Dict[str, Any]:
+    """Build the dashboard snapshot: balances, month-over-month results, alerts and activity"""
+    today = datetime.utcnow()
+    month_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month_start = add_months(month_start, -1)
+    
+    # Cash, A/R and A/P from one journal aggregation over the relevant accounts
+    balance_accounts = await db.accounts.find(
+        {"detail_type": {"$in": ["Checking", "Savings", "Accounts Receivable", "Accounts Payable"]}},
+        projection(["id", "detail_type", "active"])
+    ).to_list(None)
+    cash_ids = [a["id"] for a in balance_accounts if a["detail_type"] in ("Checking", "Savings") and a.get("active", True)]
+    ar_account = next((a for a in balance_accounts if a["detail_type"] == "Accounts Receivable"), None)
+    ap_account = next((a for a in balance_accounts if a["detail_type"] == "Accounts Payable"), None)
+    totals = await get_account_totals({"account_id": {"$in": [a["id"] for a in balance_accounts]}})
+    
+    def balance_of(account_id):
+        account_totals = totals.get(account_id, {"debit": 0, "credit": 0})
+        return account_totals["debit"] - account_totals["credit"]
+    
+    total_cash = sum(balance_of(account_id) for account_id in cash_ids)
+    total_ar = balance_of(ar_account["id"]) if ar_account else 0
+    total_ap = balance_of(ap_account["id"]) if ap_account else 0
+    
+    current_month = await summarize_period_transactions(month_start, today + timedelta(microseconds=1))
+    last_month = await summarize_period_transactions(last_month_start, month_start)
+    current_month_income, current_month_expenses = current_month["income"], current_month["expenses"]
+    last_month_income, last_month_expenses = last_month["income"], last_month["expenses"]
     
     # Calculate growth rates
     income_growth = ((current_month_income - last_month_income) / last_month_income * 100) if last_month_income > 0 else 0
     expense_growth = ((current_month_expenses - last_month_expenses) / last_month_expenses * 100) if last_month_expenses > 0 else 0
     
-    # Get overdue invoices
-    overdue_invoices = await db.transactions.find({
-        "transaction_type": "Invoice",
-        "status": "Open",
-        "due_date": {"$lt": today}
-    }).to_list(1000)
-    
-    overdue_amount = sum(inv.get("balance", inv["total"]) for inv in overdue_invoices)
+    # Overdue invoices from the open-items set
+    overdue = {"count": 0, "amount": 0}
+    async for row in db.open_items.aggregate([
+        {"$match": {"transaction_type": "Invoice", "due_date": {"$lt": today}}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$balance"}}}
+    ]):
+        overdue = row
     
-    # Get recent transactions
-    recent_transactions = await db.transactions.find().sort("created_at", -1).limit(10).to_list(10)
+    recent_transactions = await db.transactions.find(
+        {},
+        projection(["id", "transaction_type", "total", "date", "memo", "customer_id", "vendor_id"])
+    ).sort("created_at", -1).limit(10).to_list(10)
     
     return {
         "financial_metrics": {
@@ -2483,8 +3691,8 @@ async def get_dashboard_metrics():
             "expense_growth_rate": expense_growth
         },
         "alerts": {
-            "overdue_invoices_count": len(overdue_invoices),
-            "overdue_amount": overdue_amount,
+            "overdue_invoices_count": overdue["count"],
+            "overdue_amount": overdue["amount"],
             "cash_flow_status": "positive" if total_cash > 0 else "negative",
             "low_cash_warning": total_cash < 10000  # Configurable threshold
         },
@@ -2501,156 +3709,414 @@ async def get_dashboard_metrics():
         ]
     }
 
-@api_router.get("/analytics/kpi-trends")
-async def get_kpi_trends(period: str = "12months"):
-    """Get KPI trends over time for dashboard charts"""
-    today = datetime.utcnow()
-    
-    if period == "12months":
-        periods = []
-        for i in range(12):
-            month_start = (today.replace(day=1) - timedelta(days=32*i)).replace(day=1)
-            month_end = month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
-            periods.append({
-                "start": month_start,
-                "end": month_end,
-                "label": month_start.strftime("%b %Y")
-            })
-        periods.reverse()
-    
-    trends = []
-    
-    for period_data in periods:
-        # Get transactions for this period
-        transactions = await db.transactions.find({
-            "date": {"$gte": period_data["start"], "$lte": period_data["end"]}
-        }).to_list(1000)
-        
-        income = sum(t["total"] for t in transactions if t["transaction_type"] in ["Invoice", "Sales Receipt"])
-        expenses = sum(t["total"] for t in transactions if t["transaction_type"] in ["Bill", "Check"])
-        profit = income - expenses
-        
-        trends.append({
-            "period": period_data["label"],
-            "income": income,
-            "expenses": expenses,
-            "profit": profit,
-            "transaction_count": len(transactions)
-        })
-    
-    return {"trends": trends}
+# Analytics engine: the needed transaction columns are loaded once into a frame
+# and bucketed into periods with searchsorted/bincount, so trends over any
+# granularity or lookback cost one query rather than one per period.
+ANALYTICS_INCOME_TYPES = ["Invoice", "Sales Receipt"]
+ANALYTICS_EXPENSE_TYPES = ["Bill", "Check"]
+
+def analytics_step(start: datetime, granularity: str, count: int) -> datetime:
+    """The period start `count` periods away from start"""
+    if granularity == "day":
+        return start + timedelta(days=count)
+    if granularity == "week":
+        return start + timedelta(weeks=count)
+    if granularity == "quarter":
+        return add_months(start, 3 * count)
+    return add_months(start, count)
+
+def analytics_period_starts(end: datetime, granularity: str, lookback: int) -> List[datetime]:
+    """Starts of the `lookback` periods ending with the one that contains end"""
+    day = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        current = day - timedelta(days=day.weekday())
+    elif granularity == "month":
+        current = day.replace(day=1)
+    elif granularity == "quarter":
+        current = datetime(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    else:
+        current = day
+    return [analytics_step(current, granularity, -offset) for offset in range(lookback - 1, -1, -1)]
+
+def analytics_period_label(start: datetime, granularity: str) -> str:
+    if granularity == "day":
+        return start.strftime("%b %d, %Y")
+    if granularity == "week":
+        return f"Week of {start.strftime('%b %d, %Y')}"
+    if granularity == "quarter":
+        return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+    return start.strftime("%b %Y")
+
+def bucket_by_period(dates: pd.Series, values: Optional[pd.Series], starts: List[datetime], end: datetime) -> np.ndarray:
+    """Sum values (or count rows when values is None) into [starts[i], starts[i+1]) buckets"""
+    edges = np.array(starts + [end], dtype="datetime64[us]")
+    stamps = pd.to_datetime(dates).to_numpy(dtype="datetime64[us]")
+    index = np.searchsorted(edges, stamps, side="right") - 1
+    in_window = ~np.isnat(stamps) & (index >= 0) & (index < len(starts))
+    weights = None if values is None else values.to_numpy(dtype=float)[in_window]
+    return np.bincount(index[in_window], weights=weights, minlength=len(starts))
+
+async def load_transaction_frame(start: datetime, end: datetime) -> pd.DataFrame:
+    """Date, type and total for every transaction dated in [start, end)"""
+    documents = await db.transactions.find(
+        {"date": {"$gte": start, "$lt": end}},
+        projection(["date", "transaction_type", "total"])
+    ).to_list(None)
+    frame = pd.DataFrame(documents, columns=["date", "transaction_type", "total"])
+    frame["total"] = frame["total"].fillna(0).astype(float)
+    return frame
+
+def summarize_frame_by_period(frame: pd.DataFrame, starts: List[datetime], end: datetime) -> Dict[str, np.ndarray]:
+    """Income, expense and count per period for a transaction frame"""
+    is_income = frame["transaction_type"].isin(ANALYTICS_INCOME_TYPES)
+    is_expense = frame["transaction_type"].isin(ANALYTICS_EXPENSE_TYPES)
+    return {
+        "income": bucket_by_period(frame["date"], frame["total"].where(is_income, 0), starts, end),
+        "expenses": bucket_by_period(frame["date"], frame["total"].where(is_expense, 0), starts, end),
+        "transaction_count": bucket_by_period(frame["date"], None, starts, end)
+    }
 
-@api_router.get("/analytics/drill-down/{metric}")
-async def get_drill_down_data(metric: str, period: str = "current_month"):
-    """Get drill-down data for dashboard metrics"""
-    today = datetime.utcnow()
+# Report engine: every statement is fed by one $group over the journal joined
+# in memory to the chart of accounts, rather than one query per account.
+async def get_account_totals(match: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, float]]:
+    """Sum debits and credits per account for the journal entries matching a filter"""
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$group": {
+        "_id": "$account_id",
+        "debit": {"$sum": "$debit"},
+        "credit": {"$sum": "$credit"}
+    }})
+    
+    totals = {}
+    async for row in db.journal_entries.aggregate(pipeline):
+        totals[row["_id"]] = {"debit": row["debit"], "credit": row["credit"]}
+    return totals
+
+async def get_account_totals_through(upper_bound: Optional[Dict[str, datetime]] = None) -> Dict[str, Dict[str, float]]:
+    """Cumulative per-account totals up to an optional {"$lt"/"$lte": date} bound.
+    
+    Starts from the latest closed-period snapshot inside the bound and only
+    aggregates the journal entries posted after it.
+    """
+    closed_query = {"status": "Closed"}
+    if upper_bound:
+        closed_query["period_end"] = {"$lte": next(iter(upper_bound.values()))}
+    closed_period = await db.closed_periods.find_one(closed_query, sort=[("period_end", -1)])
+    
+    totals = {}
+    date_range = dict(upper_bound or {})
+    if closed_period:
+        async for snapshot in db.account_balance_snapshots.find(
+            {"period": closed_period["period"]},
+            projection(["account_id", "debit_total", "credit_total"])
+        ):
+            totals[snapshot["account_id"]] = {
+                "debit": snapshot["debit_total"],
+                "credit": snapshot["credit_total"]
+            }
+        date_range["$gte"] = closed_period["period_end"]
+    
+    open_totals = await get_account_totals({"date": date_range} if date_range else None)
+    for account_id, account_totals in open_totals.items():
+        merged = totals.setdefault(account_id, {"debit": 0, "credit": 0})
+        merged["debit"] += account_totals["debit"]
+        merged["credit"] += account_totals["credit"]
+    return totals
+
+async def get_period_account_totals(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Per-account totals for a report period, served from snapshots where periods are closed"""
+    date_range = report_date_range(start_date, end_date)
+    upper_bound = {op: value for op, value in date_range.items() if op in ("$lt", "$lte")}
+    totals = await get_account_totals_through(upper_bound or None)
+    
+    if "$gte" in date_range:
+        opening = await get_account_totals_through({"$lt": date_range["$gte"]})
+        for account_id, opening_totals in opening.items():
+            account_totals = totals.setdefault(account_id, {"debit": 0, "credit": 0})
+            account_totals["debit"] -= opening_totals["debit"]
+            account_totals["credit"] -= opening_totals["credit"]
+    return totals
+
+async def get_report_accounts(start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Active accounts with debit, credit and balance totals for a report period"""
+    accounts = await db.accounts.find(
+        {"active": True},
+        projection(["id", "name", "account_type", "detail_type", "account_number"])
+    ).to_list(None)
+    totals = await get_period_account_totals(start_date, end_date)
     
-    if period == "current_month":
-        start_date = today.replace(day=1)
-        end_date = today
-    elif period == "last_month":
-        start_date = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
-        end_date = today.replace(day=1) - timedelta(days=1)
-    else:
-        # Default to current month
-        start_date = today.replace(day=1)
-        end_date = today
+    for account in accounts:
+        account_totals = totals.get(account["id"], {"debit": 0, "credit": 0})
+        account["debit_total"] = account_totals["debit"]
+        account["credit_total"] = account_totals["credit"]
+        account["balance"] = account_totals["debit"] - account_totals["credit"]
+    return accounts
+
+def build_transaction(transaction: TransactionCreate) -> Transaction:
+    """Compute totals, opening balance and number for a new transaction"""
+    transaction_dict = transaction.dict()
     
-    if metric == "income":
-        transactions = await db.transactions.find({
-            "transaction_type": {"$in": ["Invoice", "Sales Receipt"]},
-            "date": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
-        
-        return {
-            "metric": "income",
-            "period": period,
-            "total": sum(t["total"] for t in transactions),
-            "transactions": [
-                {
-                    "id": t["id"],
-                    "type": t["transaction_type"],
-                    "amount": t["total"],
-                    "date": t["date"],
-                    "customer_id": t.get("customer_id"),
-                    "reference": t.get("reference_number", "")
-                } for t in transactions
-            ]
-        }
+    # Calculate totals
+    subtotal = sum(item.amount for item in transaction.line_items)
+    tax_amount = subtotal * transaction.tax_rate / 100
+    total = subtotal + tax_amount
     
-    elif metric == "expenses":
-        transactions = await db.transactions.find({
-            "transaction_type": {"$in": ["Bill", "Check"]},
-            "date": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
-        
-        return {
-            "metric": "expenses",
-            "period": period,
-            "total": sum(t["total"] for t in transactions),
-            "transactions": [
-                {
-                    "id": t["id"],
-                    "type": t["transaction_type"],
-                    "amount": t["total"],
-                    "date": t["date"],
-                    "vendor_id": t.get("vendor_id"),
-                    "reference": t.get("reference_number", "")
-                } for t in transactions
-            ]
-        }
+    transaction_dict.update({
+        "subtotal": subtotal,
+        "tax_amount": tax_amount,
+        "total": total,
+        "balance": total,  # Initial balance equals total
+        "transaction_number": f"{transaction.transaction_type.value[:3].upper()}-{str(uuid.uuid4())[:8]}"
+    })
     
-    elif metric == "overdue_invoices":
-        overdue_invoices = await db.transactions.find({
-            "transaction_type": "Invoice",
-            "status": "Open",
-            "due_date": {"$lt": today}
-        }).to_list(1000)
-        
-        return {
-            "metric": "overdue_invoices",
-            "period": "current",
-            "total": sum(inv.get("balance", inv["total"]) for inv in overdue_invoices),
-            "count": len(overdue_invoices),
-            "invoices": [
-                {
-                    "id": inv["id"],
-                    "invoice_number": inv.get("transaction_number", ""),
-                    "customer_id": inv.get("customer_id"),
-                    "amount": inv["total"],
-                    "balance": inv.get("balance", inv["total"]),
-                    "due_date": inv.get("due_date"),
-                    "days_overdue": (today - inv.get("due_date", today)).days if inv.get("due_date") else 0
-                } for inv in overdue_invoices
-            ]
-        }
+    return Transaction(**transaction_dict)
+
+# Batch transaction import
+TRANSACTION_BATCH_CHUNK_SIZE = 1000
+
+async def iter_batch_rows(request: Request):
+    """Yield (index, row, error) for each row of an NDJSON stream or JSON array body"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        index = 0
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield (index, *parse_batch_line(line))
+                    index += 1
+        if buffer.strip():
+            yield (index, *parse_batch_line(buffer))
+        return
     
-    else:
-        raise HTTPException(status_code=400, detail="Invalid metric specified")
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    for index, row in enumerate(rows):
+        if isinstance(row, dict):
+            yield index, row, None
+        else:
+            yield index, None, "Row must be a JSON object"
 
+def parse_batch_line(line: bytes) -> tuple:
+    """Parse one NDJSON line into (row, error)"""
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(row, dict):
+        return None, "Row must be a JSON object"
+    return row, None
+
+FAILED_BATCH_KEY_ERROR = (
+    "An earlier attempt with this idempotency key was partly posted; "
+    "run verify-balances --rebuild and rebuild-cube to reconcile it"
+)
 
-# Helper functions
-async def calculate_account_balance(account_id: str):
-    """Calculate the current balance of an account from journal entries"""
-    journal_entries = await db.journal_entries.find({"account_id": account_id}).to_list(1000)
+def claimed_key_result(index: int, original: Dict[str, Any]) -> Dict[str, Any]:
+    """The result for a row whose idempotency key an earlier post already claimed"""
+    if original.get("status") == "failed":
+        return {"index": index, "status": "error", "errors": [FAILED_BATCH_KEY_ERROR]}
+    return {
+        "index": index,
+        "status": "duplicate",
+        "transaction_id": original["transaction_id"],
+        "transaction_number": original["transaction_number"]
+    }
+
+async def post_transaction_batch_chunk(
+    chunk: List[tuple],
+    control_accounts: Dict[str, str],
+    claimed_keys: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Post one chunk of validated batch rows, returning a result per row"""
+    results = []
+    
+    keys = [key for _, key, _ in chunk if key and key not in claimed_keys]
+    if keys:
+        async for key_doc in db.transaction_idempotency_keys.find({"key": {"$in": keys}}, {"_id": 0}):
+            claimed_keys[key_doc["key"]] = key_doc
+    
+    requested_deposit_ids = list({item.deposit_to_account_id for _, _, item in chunk if item.deposit_to_account_id})
+    deposit_account_ids = set()
+    if requested_deposit_ids:
+        async for account in db.accounts.find({"id": {"$in": requested_deposit_ids}}, projection(["id"])):
+            deposit_account_ids.add(account["id"])
+    
+    pending = []
+    for index, key, item in chunk:
+        if key and key in claimed_keys:
+            results.append(claimed_key_result(index, claimed_keys[key]))
+            continue
+        
+        transaction_obj = build_transaction(item)
+        key_doc = None
+        if key:
+            key_doc = {
+                "key": key,
+                "transaction_id": transaction_obj.id,
+                "transaction_number": transaction_obj.transaction_number,
+                "created_at": datetime.utcnow()
+            }
+            claimed_keys[key] = key_doc
+        pending.append((index, key_doc, transaction_obj))
+    
+    # Claim idempotency keys first; a unique-index collision means a concurrent
+    # request already took the key, so that row becomes a duplicate.
+    key_docs = [key_doc for _, key_doc, _ in pending if key_doc]
+    if key_docs:
+        try:
+            await db.transaction_idempotency_keys.insert_many(key_docs, ordered=False)
+        except BulkWriteError as e:
+            lost_keys = {key_docs[err["index"]]["key"] for err in e.details.get("writeErrors", []) if err.get("code") == 11000}
+            if len(lost_keys) < len(e.details.get("writeErrors", [])):
+                raise
+            async for key_doc in db.transaction_idempotency_keys.find({"key": {"$in": list(lost_keys)}}, {"_id": 0}):
+                claimed_keys[key_doc["key"]] = key_doc
+            for index, key_doc, _ in pending:
+                if key_doc and key_doc["key"] in lost_keys:
+                    results.append(claimed_key_result(index, claimed_keys[key_doc["key"]]))
+            pending = [p for p in pending if not (p[1] and p[1]["key"] in lost_keys)]
+    
+    if not pending:
+        return results
+    
+    transactions = [transaction_obj for _, _, transaction_obj in pending]
+    entries = []
+    for transaction_obj in transactions:
+        entries.extend(build_journal_entries(transaction_obj, control_accounts, deposit_account_ids))
+    
+    transaction_docs = [t.dict() for t in transactions]
+    
+    # Steps are recorded as they start so a failure on a standalone server,
+    # where nothing rolls back, can be undone before the keys are released.
+    steps = []
+    
+    async def post_chunk(session):
+        steps.clear()
+        steps.append("transactions")
+        await db.transactions.insert_many(transaction_docs, session=session)
+        steps.append("journal_entries")
+        await db.journal_entries.insert_many([entry.dict() for entry in entries], session=session)
+        steps.append("balances")
+        await apply_balance_deltas(entries, session=session)
+        steps.append("open_items")
+        await apply_open_items(transaction_docs, session=session)
+        steps.append("cube")
+        await apply_cube_deltas(build_cube_deltas(transaction_docs), session=session)
     
-    balance = 0
-    for entry in journal_entries:
-        balance += entry.get("debit", 0) - entry.get("credit", 0)
+    try:
+        await run_ledger_transaction(post_chunk)
+    except Exception as e:
+        logger.error(f"Batch chunk failed to post: {e}")
+        claimed = [key_doc["key"] for _, key_doc, _ in pending if key_doc]
+        undone = await supports_transactions() or await undo_batch_chunk(steps, transaction_docs, entries)
+        if undone:
+            error = f"Failed to post: {e}"
+            if claimed:
+                await db.transaction_idempotency_keys.delete_many({"key": {"$in": claimed}})
+                for key in claimed:
+                    claimed_keys.pop(key, None)
+        else:
+            # Partly posted and not reversible: keep the keys so a retry cannot
+            # post these rows a second time
+            error = f"Failed to post: {e}; the row was partly posted and its idempotency key is kept"
+            if claimed:
+                await db.transaction_idempotency_keys.update_many(
+                    {"key": {"$in": claimed}}, {"$set": {"status": "failed"}}
+                )
+                for key in claimed:
+                    claimed_keys[key]["status"] = "failed"
+        results.extend(
+            {"index": index, "status": "error", "errors": [error]}
+            for index, _, _ in pending
+        )
+        return results
     
-    return balance
-
-async def create_journal_entries(transaction: Transaction):
+    results.extend(
+        {
+            "index": index,
+            "status": "created",
+            "transaction_id": transaction_obj.id,
+            "transaction_number": transaction_obj.transaction_number
+        }
+        for index, _, transaction_obj in pending
+    )
+    return results
+
+async def undo_batch_chunk(steps: List[str], transaction_docs: List[Dict[str, Any]], entries: List[JournalEntry]) -> bool:
+    """Reverse a chunk that failed part way on a standalone server.
+    
+    Inserts and open items are removed by id, which is safe however far the
+    step got. A balance or cube step that failed midway has an unknown
+    partial effect, so that case returns False and nothing is touched.
+    """
+    if not steps:
+        return True
+    if steps[-1] in ("balances", "cube"):
+        return False
+    try:
+        transaction_ids = [doc["id"] for doc in transaction_docs]
+        if "cube" in steps[:-1]:
+            await apply_cube_deltas(build_cube_deltas(transaction_docs, sign=-1))
+        if "open_items" in steps:
+            await db.open_items.delete_many({"id": {"$in": transaction_ids}})
+        if "balances" in steps[:-1]:
+            await apply_balance_deltas(entries, sign=-1)
+        if "journal_entries" in steps:
+            await db.journal_entries.delete_many({"id": {"$in": [entry.id for entry in entries]}})
+        await db.transactions.delete_many({"id": {"$in": transaction_ids}})
+    except Exception as e:
+        logger.error(f"Could not undo failed batch chunk: {e}")
+        return False
+    return True
+
+async def resolve_control_accounts(session=None) -> Dict[str, str]:
+    """Map control account detail types (A/R, A/P) to the account that receives their postings"""
+    control_accounts = {}
+    async for account in db.accounts.find(
+        {"detail_type": {"$in": ["Accounts Receivable", "Accounts Payable"]}},
+        projection(["id", "detail_type"]),
+        session=session
+    ):
+        control_accounts.setdefault(account["detail_type"], account["id"])
+    return control_accounts
+
+async def create_journal_entries(transaction: Transaction, session=None):
     """Create journal entries for a transaction (double-entry bookkeeping)"""
+    control_accounts = await resolve_control_accounts(session=session)
+    deposit_account_ids = set()
+    if transaction.deposit_to_account_id:
+        if await db.accounts.find_one({"id": transaction.deposit_to_account_id}, {"_id": 1}, session=session):
+            deposit_account_ids.add(transaction.deposit_to_account_id)
+    
+    entries = build_journal_entries(transaction, control_accounts, deposit_account_ids)
+    
+    # Insert all journal entries and update account balances
+    await post_journal_entries(entries, session=session)
+
+def build_journal_entries(
+    transaction: Transaction,
+    control_accounts: Dict[str, str],
+    deposit_account_ids: set
+) -> List[JournalEntry]:
+    """Build the double-entry journal lines for a transaction from pre-resolved accounts"""
     entries = []
     
     if transaction.transaction_type == TransactionType.INVOICE:
         # Debit Accounts Receivable, Credit Income accounts
-        ar_account = await db.accounts.find_one({"detail_type": "Accounts Receivable"})
-        if ar_account:
+        ar_account_id = control_accounts.get("Accounts Receivable")
+        if ar_account_id:
             entries.append(JournalEntry(
                 transaction_id=transaction.id,
-                account_id=ar_account["id"],
+                account_id=ar_account_id,
                 debit=transaction.total,
                 credit=0,
                 description=f"Invoice - {transaction.transaction_number}",
@@ -2671,11 +4137,11 @@ async def create_journal_entries(transaction: Transaction):
     
     elif transaction.transaction_type == TransactionType.BILL:
         # Credit Accounts Payable, Debit Expense accounts
-        ap_account = await db.accounts.find_one({"detail_type": "Accounts Payable"})
-        if ap_account:
+        ap_account_id = control_accounts.get("Accounts Payable")
+        if ap_account_id:
             entries.append(JournalEntry(
                 transaction_id=transaction.id,
-                account_id=ap_account["id"],
+                account_id=ap_account_id,
                 debit=0,
                 credit=transaction.total,
                 description=f"Bill - {transaction.transaction_number}",
@@ -2696,11 +4162,10 @@ async def create_journal_entries(transaction: Transaction):
     
     elif transaction.transaction_type == TransactionType.SALES_RECEIPT:
         # Debit Bank/UF, Credit Income accounts
-        deposit_account = await db.accounts.find_one({"id": transaction.deposit_to_account_id})
-        if deposit_account:
+        if transaction.deposit_to_account_id in deposit_account_ids:
             entries.append(JournalEntry(
                 transaction_id=transaction.id,
-                account_id=deposit_account["id"],
+                account_id=transaction.deposit_to_account_id,
                 debit=transaction.total,
                 credit=0,
                 description=f"Sales Receipt - {transaction.transaction_number}",
@@ -2721,13 +4186,12 @@ async def create_journal_entries(transaction: Transaction):
     
     elif transaction.transaction_type == TransactionType.PAYMENT:
         # Debit Bank/UF, Credit AR
-        deposit_account = await db.accounts.find_one({"id": transaction.deposit_to_account_id})
-        ar_account = await db.accounts.find_one({"detail_type": "Accounts Receivable"})
+        ar_account_id = control_accounts.get("Accounts Receivable")
         
-        if deposit_account and ar_account:
+        if transaction.deposit_to_account_id in deposit_account_ids and ar_account_id:
             entries.append(JournalEntry(
                 transaction_id=transaction.id,
-                account_id=deposit_account["id"],
+                account_id=transaction.deposit_to_account_id,
                 debit=transaction.total,
                 credit=0,
                 description=f"Payment - {transaction.transaction_number}",
@@ -2736,7 +4200,7 @@ async def create_journal_entries(transaction: Transaction):
             
             entries.append(JournalEntry(
                 transaction_id=transaction.id,
-                account_id=ar_account["id"],
+                account_id=ar_account_id,
                 debit=0,
                 credit=transaction.total,
                 description=f"Payment - {transaction.transaction_number}",
@@ -2767,18 +4231,222 @@ async def create_journal_entries(transaction: Transaction):
                     date=transaction.date
                 ))
     
-    # Insert all journal entries
+    return entries
+
+# Balance ledger: stored account balances are kept in step with the journal by
+# applying each posting's net debit - credit as an atomic $inc, so posting cost
+# no longer depends on how many entries an account already has.
+async def apply_balance_deltas(entries: List[JournalEntry], session=None, sign: int = 1):
+    """Apply the net effect of posting (sign=1) or reversing (sign=-1) journal entries to account balances"""
+    deltas = {}
     for entry in entries:
-        await db.journal_entries.insert_one(entry.dict())
+        deltas[entry.account_id] = deltas.get(entry.account_id, 0) + (entry.debit - entry.credit) * sign
     
-    # Update account balances
-    for entry in entries:
-        await update_account_balance(entry.account_id)
+    operations = [
+        UpdateOne({"id": account_id}, {"$inc": {"balance": delta}})
+        for account_id, delta in deltas.items() if delta != 0
+    ]
+    if operations:
+        await db.accounts.bulk_write(operations, ordered=False, session=session)
+
+# Posting service: a document's entries go out in one insert_many and one
+# batched balance update, inside a multi-document transaction when the
+# deployment (replica set or mongos) supports it.
+_transactions_supported = None
+
+async def supports_transactions() -> bool:
+    """Whether the connected MongoDB deployment supports multi-document transactions"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            logger.warning(f"Could not detect transaction support: {e}")
+            _transactions_supported = False
+    return _transactions_supported
+
+async def run_ledger_transaction(callback):
+    """Run callback(session) inside a transaction, or callback(None) on a standalone server.
+    
+    with_transaction re-runs the callback on TransientTransactionError and
+    retries the commit on UnknownTransactionCommitResult, so postings racing on
+    the same control account are retried rather than failed with a write
+    conflict. Ledger-derived caches are invalidated once it finishes.
+    """
+    try:
+        if not await supports_transactions():
+            return await callback(None)
+        async with await client.start_session() as session:
+            return await session.with_transaction(callback)
+    finally:
+        notify_ledger_change()
+
+async def post_journal_entries(entries: List[JournalEntry], session=None):
+    """Insert a document's journal entries and apply their balance deltas"""
+    if not entries:
+        return
+    await db.journal_entries.insert_many([entry.dict() for entry in entries], session=session)
+    await apply_balance_deltas(entries, session=session)
+
+async def verify_account_balances(rebuild: bool = False) -> Dict[str, Any]:
+    """Compare stored account balances with the journal, optionally rewriting drifted ones"""
+    totals = await get_account_totals()
+    journal_balances = {account_id: t["debit"] - t["credit"] for account_id, t in totals.items()}
+    accounts = await db.accounts.find({}, projection(["id", "name", "balance"])).to_list(None)
+    
+    mismatches = []
+    for account in accounts:
+        stored = account.get("balance", 0.0)
+        expected = journal_balances.get(account["id"], 0.0)
+        if abs(expected - stored) >= 0.01:
+            mismatches.append({
+                "account_id": account["id"],
+                "account_name": account["name"],
+                "stored_balance": stored,
+                "journal_balance": expected,
+                "difference": expected - stored
+            })
+        if rebuild and expected != stored:
+            await db.accounts.update_one({"id": account["id"]}, {"$set": {"balance": expected}})
+    if rebuild:
+        notify_ledger_change()
+    
+    return {
+        "accounts_checked": len(accounts),
+        "mismatched_accounts": len(mismatches),
+        "rebuilt": rebuild,
+        "mismatches": mismatches
+    }
+
+# Open items: invoices and bills with a balance due, plus customer payments
+# still sitting in undeposited funds, denormalized so the payment screens, aging
+# and projections read the small open set instead of the whole transaction history.
+def open_item_from_transaction(transaction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The open item for a transaction, or None when nothing is outstanding on it"""
+    transaction_type = transaction.get("transaction_type")
+    status = transaction.get("status")
+    if transaction_type in ("Invoice", "Bill"):
+        balance = transaction.get("balance")
+        if balance is None:
+            balance = transaction.get("total", 0)
+        if status in ("Paid", "Voided") or balance <= 0:
+            return None
+    elif transaction_type == "Payment":
+        # Bill payments carry no customer and never pass through undeposited funds
+        if status in ("Deposited", "Voided") or not transaction.get("customer_id"):
+            return None
+        balance = transaction.get("total", 0)
+    else:
+        return None
+    return OpenItem(**{**transaction, "balance": balance, "updated_at": datetime.utcnow()}).dict()
 
-async def update_account_balance(account_id: str):
-    """Update account balance after journal entry"""
-    balance = await calculate_account_balance(account_id)
-    await db.accounts.update_one({"id": account_id}, {"$set": {"balance": balance}})
+async def apply_open_items(transactions: List[Dict[str, Any]], session=None):
+    """Upsert or remove the open items for these transaction documents"""
+    operations = []
+    for transaction in transactions:
+        item = open_item_from_transaction(transaction)
+        if item:
+            operations.append(ReplaceOne({"id": item["id"]}, item, upsert=True))
+        else:
+            operations.append(DeleteOne({"id": transaction["id"]}))
+    if operations:
+        await db.open_items.bulk_write(operations, ordered=False, session=session)
+
+async def sync_open_items(transaction_ids: List[str], session=None):
+    """Re-derive the open items for these transactions from their stored state"""
+    if not transaction_ids:
+        return
+    transactions = await db.transactions.find(
+        {"id": {"$in": list(set(transaction_ids))}}, {"_id": 0}, session=session
+    ).to_list(None)
+    await apply_open_items(transactions, session=session)
+
+async def rebuild_open_items() -> Dict[str, Any]:
+    """Recreate the open_items collection from transactions"""
+    await db.open_items.delete_many({})
+    batch, rebuilt = [], 0
+    async for transaction in db.transactions.find(
+        {"transaction_type": {"$in": ["Invoice", "Bill", "Payment"]}, "status": {"$nin": ["Paid", "Voided", "Deposited"]}},
+        {"_id": 0}
+    ).batch_size(EXPORT_BATCH_SIZE):
+        item = open_item_from_transaction(transaction)
+        if item:
+            batch.append(item)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            await db.open_items.insert_many(batch, ordered=False)
+            rebuilt += len(batch)
+            batch = []
+    if batch:
+        await db.open_items.insert_many(batch, ordered=False)
+        rebuilt += len(batch)
+    return {"open_items": rebuilt}
+
+# Ledger cube: line-item postings pre-aggregated by account, class, location,
+# customer, vendor, item and month, kept current with $inc upserts as documents
+# post so pivots read a few cube cells instead of every line item.
+CUBE_KEY_FIELDS = ["account_id", "class_id", "location_id", "customer_id", "vendor_id", "item_id", "month"]
+CUBE_MEASURES = ["debit", "credit", "qty", "line_count"]
+
+# Line items post as credits on sales documents and as debits on purchases,
+# mirroring build_journal_entries
+CUBE_CREDIT_TYPES = {"Invoice", "Sales Receipt"}
+CUBE_DEBIT_TYPES = {"Bill", "Check"}
+
+def build_cube_deltas(
+    transactions: List[Dict[str, Any]],
+    sign: int = 1,
+    into: Optional[Dict[tuple, Dict[str, float]]] = None
+) -> Dict[tuple, Dict[str, float]]:
+    """Net cube cell changes for posting (sign=1) or reversing (sign=-1) these documents"""
+    deltas = into if into is not None else {}
+    for transaction in transactions:
+        transaction_type = transaction.get("transaction_type")
+        if transaction_type not in CUBE_CREDIT_TYPES and transaction_type not in CUBE_DEBIT_TYPES:
+            continue
+        if transaction.get("status") == "Voided":
+            continue
+        month = transaction["date"].strftime("%Y-%m")
+        for line in transaction.get("line_items", []):
+            if not line.get("account_id"):
+                continue
+            key = (
+                line["account_id"], line.get("class_id"), line.get("location_id"),
+                transaction.get("customer_id"), transaction.get("vendor_id"), line.get("item_id"), month
+            )
+            cell = deltas.setdefault(key, {measure: 0 for measure in CUBE_MEASURES})
+            amount = line.get("amount", 0) * sign
+            if transaction_type in CUBE_CREDIT_TYPES:
+                cell["credit"] += amount
+            else:
+                cell["debit"] += amount
+            cell["qty"] += line.get("quantity", 0) * sign
+            cell["line_count"] += sign
+    return deltas
+
+async def apply_cube_deltas(deltas: Dict[tuple, Dict[str, float]], session=None):
+    """Add cell deltas to the ledger cube, creating cells on first use"""
+    operations = [
+        UpdateOne(dict(zip(CUBE_KEY_FIELDS, key)), {"$inc": measures}, upsert=True)
+        for key, measures in deltas.items() if any(measures.values())
+    ]
+    if operations:
+        await db.ledger_cube.bulk_write(operations, ordered=False, session=session)
+
+async def rebuild_ledger_cube() -> Dict[str, Any]:
+    """Recreate the ledger cube from transactions"""
+    deltas = {}
+    async for transaction in db.transactions.find(
+        {"transaction_type": {"$in": list(CUBE_CREDIT_TYPES | CUBE_DEBIT_TYPES)}, "status": {"$ne": "Voided"}},
+        projection(["transaction_type", "status", "date", "customer_id", "vendor_id", "line_items"])
+    ).batch_size(EXPORT_BATCH_SIZE):
+        build_cube_deltas([transaction], into=deltas)
+    
+    cells = [{**dict(zip(CUBE_KEY_FIELDS, key)), **measures} for key, measures in deltas.items()]
+    await db.ledger_cube.delete_many({})
+    for start in range(0, len(cells), EXPORT_BATCH_SIZE):
+        await db.ledger_cube.insert_many(cells[start:start + EXPORT_BATCH_SIZE], ordered=False)
+    return {"cube_cells": len(cells)}
 
 # Root endpoint
 @api_router.get("/")
@@ -2792,22 +4460,268 @@ async def root():
 async def create_bank_transaction(transaction: BankTransactionCreate):
     transaction_dict = transaction.dict()
     transaction_obj = BankTransaction(**transaction_dict)
+    transaction_obj.content_hash = bank_content_hash(transaction_obj.date, transaction_obj.amount, transaction_obj.description)
     await db.bank_transactions.insert_one(transaction_obj.dict())
     return transaction_obj
 
 @api_router.get("/bank-transactions", response_model=List[BankTransaction])
-async def get_bank_transactions(account_id: str = Query(None)):
+async def get_bank_transactions(
+    response: Response,
+    account_id: str = Query(None),
+    reconciled: Optional[bool] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page: PageParams = Depends()
+):
     query = {}
     if account_id:
         query["account_id"] = account_id
+    if reconciled is not None:
+        query["reconciled"] = reconciled
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        query["date"] = date_range
+    
+    transactions = await find_page(db.bank_transactions, query, page, response, sort_field="date", model=BankTransaction)
+    return model_list_response(BankTransaction, transactions, response, fields=page.fields)
+
+# Bank matching: pair unreconciled bank lines with journal lines on the same ledger
+# account. Ledger lines are bucketed by amount in cents and sorted by date, so each
+# bank line only scores the same-amount entries inside its date window.
+MATCH_WEIGHTS = {"amount": 45, "date": 25, "check_number": 15, "payee": 15}
+
+class BankMatch(BaseModel):
+    bank_transaction_id: str
+    journal_entry_id: str
+    transaction_id: Optional[str] = None
+
+def match_digits(value: Optional[str]) -> str:
+    return re.sub(r"\D", "", value or "").lstrip("0")
+
+def normalize_payee(value: Optional[str]) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", (value or "").lower()))
+
+def payee_similarity(bank_text: str, ledger_texts: List[str]) -> float:
+    """Best fuzzy similarity (0-1) between a bank description and any ledger text"""
+    if not bank_text:
+        return 0.0
+    bank_tokens = set(bank_text.split())
+    best = 0.0
+    for text in ledger_texts:
+        if not text:
+            continue
+        tokens = set(text.split())
+        overlap = len(bank_tokens & tokens) / len(bank_tokens | tokens)
+        best = max(best, overlap, difflib.SequenceMatcher(None, bank_text, text).ratio())
+    return best
+
+async def build_match_suggestions(
+    account_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    date_window: int = 5,
+    amount_tolerance: float = 0.0,
+    min_score: float = 60.0
+) -> Dict[str, Any]:
+    """Suggest one-to-one matches between unreconciled bank lines and ledger journal lines"""
+    bank_query = {"account_id": account_id, "reconciled": {"$ne": True}, "matched_journal_entry_id": None}
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        bank_query["date"] = date_range
+    bank_lines = await db.bank_transactions.find(
+        bank_query, projection(["id", "date", "amount", "description", "check_number"])
+    ).to_list(None)
+    if not bank_lines:
+        return {"bank_lines": 0, "ledger_candidates": 0, "matched": 0, "unmatched": 0, "suggestions": []}
+    
+    window = timedelta(days=date_window)
+    already_matched = set(await db.bank_transactions.distinct(
+        "matched_journal_entry_id", {"account_id": account_id, "matched_journal_entry_id": {"$ne": None}}
+    ))
+    entries = [
+        entry for entry in await db.journal_entries.find(
+            {
+                "account_id": account_id,
+                "date": {"$gte": min(b["date"] for b in bank_lines) - window, "$lte": max(b["date"] for b in bank_lines) + window}
+            },
+            projection(["id", "transaction_id", "date", "debit", "credit", "description"])
+        ).to_list(None)
+        if entry["id"] not in already_matched
+    ]
     
-    transactions = await db.bank_transactions.find(query).to_list(1000)
-    result = []
-    for transaction in transactions:
-        if "_id" in transaction:
-            del transaction["_id"]
-        result.append(BankTransaction(**transaction))
-    return result
+    # Source transactions supply check numbers, memos and payee names
+    transactions = {
+        t["id"]: t for t in await db.transactions.find(
+            {"id": {"$in": list({e["transaction_id"] for e in entries})}},
+            projection(["id", "transaction_number", "reference_number", "memo", "customer_id", "vendor_id"])
+        ).to_list(None)
+    }
+    payees = {}
+    for collection, field in (("customers", "customer_id"), ("vendors", "vendor_id")):
+        ids = list({t[field] for t in transactions.values() if t.get(field)})
+        if ids:
+            async for doc in db[collection].find({"id": {"$in": ids}}, projection(["id", "name"])):
+                payees[doc["id"]] = doc["name"]
+    
+    by_amount = {}
+    for entry in entries:
+        transaction = transactions.get(entry["transaction_id"], {})
+        entry["amount"] = round(entry.get("debit", 0) - entry.get("credit", 0), 2)
+        entry["transaction_number"] = transaction.get("transaction_number")
+        entry["payee"] = payees.get(transaction.get("customer_id") or transaction.get("vendor_id"))
+        entry["check_numbers"] = {
+            digits for digits in (match_digits(transaction.get("transaction_number")), match_digits(transaction.get("reference_number")))
+            if digits
+        }
+        entry["texts"] = [normalize_payee(text) for text in (entry.get("description"), transaction.get("memo"), entry["payee"])]
+        by_amount.setdefault(round(entry["amount"] * 100), []).append(entry)
+    for bucket in by_amount.values():
+        bucket.sort(key=lambda e: e["date"])
+    bucket_dates = {cents: [e["date"] for e in bucket] for cents, bucket in by_amount.items()}
+    # Amount buckets are looked up by bisecting their sorted keys, so a wide
+    # tolerance costs only the buckets that exist inside it
+    bucket_keys = sorted(by_amount)
+    
+    tolerance = round(amount_tolerance * 100)
+    scored = []
+    for bank in bank_lines:
+        cents = round(bank["amount"] * 100)
+        bank_text = normalize_payee(bank.get("description"))
+        check_number = match_digits(bank.get("check_number"))
+        low = bisect.bisect_left(bucket_keys, cents - tolerance)
+        high = bisect.bisect_right(bucket_keys, cents + tolerance)
+        for candidate_cents in bucket_keys[low:high]:
+            bucket = by_amount[candidate_cents]
+            dates = bucket_dates[candidate_cents]
+            for entry in bucket[bisect.bisect_left(dates, bank["date"] - window):bisect.bisect_right(dates, bank["date"] + window)]:
+                breakdown = {
+                    "amount": MATCH_WEIGHTS["amount"] * (1 - abs(candidate_cents - cents) / (tolerance + 1)),
+                    "date": MATCH_WEIGHTS["date"] * (1 - abs((entry["date"] - bank["date"]).days) / (date_window + 1)),
+                    "check_number": MATCH_WEIGHTS["check_number"] if check_number and check_number in entry["check_numbers"] else 0,
+                    "payee": MATCH_WEIGHTS["payee"] * payee_similarity(bank_text, entry["texts"])
+                }
+                score = sum(breakdown.values())
+                if score >= min_score:
+                    scored.append((score, bank, entry, breakdown))
+    
+    # Best pairs first; each bank line and journal line is used at most once
+    scored.sort(key=lambda item: -item[0])
+    used_bank, used_entries, suggestions = set(), set(), []
+    for score, bank, entry, breakdown in scored:
+        if bank["id"] in used_bank or entry["id"] in used_entries:
+            continue
+        used_bank.add(bank["id"])
+        used_entries.add(entry["id"])
+        suggestions.append({
+            "bank_transaction_id": bank["id"],
+            "journal_entry_id": entry["id"],
+            "transaction_id": entry["transaction_id"],
+            "score": round(score, 1),
+            "score_breakdown": {key: round(value, 1) for key, value in breakdown.items()},
+            "bank": {
+                "date": bank["date"],
+                "amount": bank["amount"],
+                "description": bank.get("description"),
+                "check_number": bank.get("check_number")
+            },
+            "ledger": {
+                "date": entry["date"],
+                "amount": entry["amount"],
+                "description": entry.get("description"),
+                "transaction_number": entry["transaction_number"],
+                "payee": entry["payee"]
+            }
+        })
+    suggestions.sort(key=lambda s: (s["bank"]["date"], s["bank_transaction_id"]))
+    
+    return {
+        "bank_lines": len(bank_lines),
+        "ledger_candidates": len(entries),
+        "matched": len(suggestions),
+        "unmatched": len(bank_lines) - len(suggestions),
+        "suggestions": suggestions
+    }
+
+@api_router.get("/bank-transactions/match-suggestions")
+async def get_bank_match_suggestions(
+    account_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    date_window: int = Query(5, ge=0, le=60, description="Days either side of the bank date to search"),
+    amount_tolerance: float = Query(0.0, ge=0, le=100, description="Largest amount difference still matched"),
+    min_score: float = Query(60.0, ge=0, le=100)
+):
+    """Suggested ledger matches for every unreconciled bank line of an account"""
+    return await build_match_suggestions(account_id, start_date, end_date, date_window, amount_tolerance, min_score)
+
+@api_router.post("/bank-transactions/apply-matches")
+async def apply_bank_matches(matches: List[BankMatch], reconciliation_id: Optional[str] = None):
+    """Link bank lines to their matched journal lines and mark them reconciled.
+    
+    A journal line already matched elsewhere, or a bank line already matched
+    or reconciled, is skipped; the unique index on matched journal lines
+    settles concurrent applies.
+    """
+    journal_ids = [match.journal_entry_id for match in matches]
+    if len(set(journal_ids)) != len(journal_ids):
+        raise HTTPException(status_code=400, detail="Each journal entry can be matched to only one bank transaction")
+    
+    entries = {
+        entry["id"]: entry for entry in await db.journal_entries.find(
+            {"id": {"$in": journal_ids}}, projection(["id", "account_id", "transaction_id"])
+        ).to_list(None)
+    }
+    bank_accounts = {
+        bank["id"]: bank["account_id"] for bank in await db.bank_transactions.find(
+            {"id": {"$in": [match.bank_transaction_id for match in matches]}}, projection(["id", "account_id"])
+        ).to_list(None)
+    }
+    for match in matches:
+        entry = entries.get(match.journal_entry_id)
+        if not entry:
+            raise HTTPException(status_code=404, detail=f"Journal entry {match.journal_entry_id} not found")
+        if match.bank_transaction_id not in bank_accounts:
+            raise HTTPException(status_code=404, detail=f"Bank transaction {match.bank_transaction_id} not found")
+        if entry["account_id"] != bank_accounts[match.bank_transaction_id]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Journal entry {match.journal_entry_id} is not on the bank transaction's account"
+            )
+        if match.transaction_id and match.transaction_id != entry["transaction_id"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Journal entry {match.journal_entry_id} does not belong to transaction {match.transaction_id}"
+            )
+    
+    operations = [
+        UpdateOne(
+            {"id": match.bank_transaction_id, "matched_journal_entry_id": None, "reconciled": {"$ne": True}},
+            {"$set": {
+                "matched_journal_entry_id": match.journal_entry_id,
+                "matched_transaction_id": entries[match.journal_entry_id]["transaction_id"],
+                "reconciled": True,
+                "reconciliation_id": reconciliation_id
+            }}
+        )
+        for match in matches
+    ]
+    applied = 0
+    if operations:
+        try:
+            result = await db.bank_transactions.bulk_write(operations, ordered=False)
+            applied = result.modified_count
+        except BulkWriteError as e:
+            # A journal line matched by a concurrent apply is skipped, not an error
+            write_errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in write_errors):
+                raise
+            applied = e.details.get("nModified", 0)
+    
+    return {
+        "applied": applied,
+        "skipped": len(matches) - applied,
+        "message": f"Matched {applied} bank transactions"
+    }
 
 @api_router.put("/bank-transactions/{transaction_id}/reconcile")
 async def reconcile_bank_transaction(transaction_id: str, reconciliation_id: str = None):
@@ -2841,13 +4755,8 @@ async def get_reconciliations(account_id: str = Query(None)):
     if account_id:
         query["account_id"] = account_id
     
-    reconciliations = await db.reconciliations.find(query).sort("created_at", -1).to_list(100)
-    result = []
-    for reconciliation in reconciliations:
-        if "_id" in reconciliation:
-            del reconciliation["_id"]
-        result.append(Reconciliation(**reconciliation))
-    return result
+    reconciliations = await db.reconciliations.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    return model_list_response(Reconciliation, reconciliations)
 
 @api_router.get("/reconciliations/{reconciliation_id}", response_model=Reconciliation)
 async def get_reconciliation(reconciliation_id: str):
@@ -2879,7 +4788,7 @@ async def complete_reconciliation(reconciliation_id: str):
     reconciled_transactions = await db.bank_transactions.find({
         "reconciliation_id": reconciliation_id,
         "reconciled": True
-    }).to_list(1000)
+    }, projection(["amount"])).to_list(1000)
     
     reconciled_balance = sum(t.get("amount", 0) for t in reconciled_transactions)
     difference = reconciliation["statement_ending_balance"] - reconciled_balance
@@ -2900,215 +4809,591 @@ async def complete_reconciliation(reconciliation_id: str):
     
     return {"message": "Reconciliation completed", "status": status, "difference": difference}
 
+# Bank statement parsing. Uploads are read a chunk at a time and rows are yielded
+# as they complete, so statement size does not bound memory.
+BANK_IMPORT_CHUNK_SIZE = 64 * 1024
+BANK_IMPORT_PREVIEW_SIZE = 10
+BANK_IMPORT_MAX_ERRORS = 100
+
+# Candidate headers per field, in priority order; a row falls back to the next
+# candidate column when the preferred one is blank
+BANK_CSV_COLUMNS = {
+    "date": ["Date", "Transaction Date", "date", "transaction_date"],
+    "description": ["Description", "Memo", "description", "memo", "payee"],
+    "amount": ["Amount", "amount", "debit", "credit"],
+    "reference_number": ["Reference"],
+    "check_number": ["Check Number"],
+    "category": ["Category"],
+    "balance": ["Balance"]
+}
+BANK_CSV_NEGATIVE_COLUMNS = {"debit"}
+
+BANK_DATE_PATTERNS = [
+    (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})"), ("month", "day", "year")),
+    (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"), ("year", "month", "day"))
+]
+
+class BankDateParser:
+    """Parse statement dates, sticking with whichever pattern matched last.
+    
+    Statements use one date format throughout, so after the first row each
+    value is tried against a single precompiled pattern.
+    """
+    def __init__(self):
+        self.patterns = list(BANK_DATE_PATTERNS)
+    
+    def __call__(self, value: str) -> datetime:
+        for index, (pattern, order) in enumerate(self.patterns):
+            match = pattern.fullmatch(value.strip())
+            if match:
+                if index:
+                    self.patterns.insert(0, self.patterns.pop(index))
+                try:
+                    return datetime(**{part: int(number) for part, number in zip(order, match.groups())})
+                except ValueError:
+                    break
+        raise ValueError("Invalid date format")
+
+def parse_bank_amount(value: str) -> float:
+    value = value.strip().replace('$', '').replace(',', '')
+    if value.startswith('(') and value.endswith(')'):
+        return -float(value[1:-1])
+    return float(value)
+
+async def iter_upload_text(file: UploadFile, chunk_size: int = BANK_IMPORT_CHUNK_SIZE):
+    """Yield decoded text from an upload one chunk at a time"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        chunk = await file.read(chunk_size)
+        try:
+            text = decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+        if text:
+            yield text
+        if not chunk:
+            return
+
+async def iter_csv_records(file: UploadFile):
+    """Yield the parsed CSV records of an upload in batches, one batch per chunk read.
+    
+    A quoted field may span lines, so physical lines are joined until their
+    quotes balance before the csv module sees them.
+    """
+    buffer, record, in_quotes = "", [], False
+    async for text in iter_upload_text(file):
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        complete = []
+        for line in lines:
+            record.append(line.rstrip("\r"))
+            if line.count('"') % 2:
+                in_quotes = not in_quotes
+            if not in_quotes:
+                complete.append("\n".join(record))
+                record = []
+        if complete:
+            yield list(csv.reader(complete))
+    if buffer.strip():
+        record.append(buffer.rstrip("\r"))
+    if record:
+        yield list(csv.reader(["\n".join(record)]))
+
+def resolve_bank_csv_columns(header: List[str]) -> Dict[str, List[tuple]]:
+    """Map each field to the (index, negate) of its candidate columns present in the header"""
+    positions = {name.strip(): index for index, name in enumerate(header)}
+    columns = {
+        field: [(positions[name], name in BANK_CSV_NEGATIVE_COLUMNS) for name in candidates if name in positions]
+        for field, candidates in BANK_CSV_COLUMNS.items()
+    }
+    missing = [field for field in ("date", "description", "amount") if not columns[field]]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"CSV header has no {', '.join(missing)} column")
+    return columns
+
+def first_value(row: List[str], candidates: List[tuple]) -> tuple:
+    """The first non-blank (value, negate) among a field's candidate columns"""
+    for index, negate in candidates:
+        if index < len(row) and row[index].strip():
+            return row[index].strip(), negate
+    return None, False
+
+async def iter_bank_csv(file: UploadFile):
+    """Yield (row_number, transaction, error) for each data row of a bank CSV"""
+    columns, parse_date, row_num = None, BankDateParser(), 0
+    async for records in iter_csv_records(file):
+        for row in records:
+            if columns is None:
+                columns = resolve_bank_csv_columns(row)
+                continue
+            if not any(value.strip() for value in row):
+                continue
+            row_num += 1
+            try:
+                date_str, _ = first_value(row, columns["date"])
+                description, _ = first_value(row, columns["description"])
+                amount_str, negate = first_value(row, columns["amount"])
+                if not (date_str and description and amount_str):
+                    yield row_num, None, "Missing required fields"
+                    continue
+                
+                amount = parse_bank_amount(amount_str)
+                if negate:
+                    # A debit column is an outflow whether or not the bank wraps it in parentheses
+                    amount = -abs(amount)
+                balance_str, _ = first_value(row, columns["balance"])
+                yield row_num, BankImportTransaction(
+                    date=parse_date(date_str),
+                    description=description,
+                    amount=amount,
+                    transaction_type="Credit" if amount > 0 else "Debit",
+                    reference_number=first_value(row, columns["reference_number"])[0] or '',
+                    check_number=first_value(row, columns["check_number"])[0] or '',
+                    category=first_value(row, columns["category"])[0] or '',
+                    balance=parse_bank_amount(balance_str) if balance_str else None
+                ), None
+            except ValueError as e:
+                yield row_num, None, str(e)
+
+# OFX/QFX parsing. One tokenizer covers OFX 1.x SGML, where leaf elements are
+# never closed, and OFX 2.x XML: a tag followed by text is a leaf value, any
+# other tag opens or closes an aggregate.
+OFX_TOKEN = re.compile(r"<([^<>]+)>([^<]*)")
+OFX_STATEMENT_AGGREGATES = {"STMTRS", "CCSTMTRS", "INVSTMTRS"}
+OFX_ACCOUNT_AGGREGATES = {"BANKACCTFROM", "CCACCTFROM", "INVACCTFROM"}
+OFX_BALANCE_AGGREGATES = {"LEDGERBAL": "ledger_balance", "AVAILBAL": "available_balance"}
+
+async def iter_ofx_tokens(file: UploadFile):
+    """Yield (kind, tag, value) tokens: kind is 'open', 'close' or 'value'"""
+    buffer = ""
+    async for text in iter_upload_text(file):
+        buffer += text
+        # Hold back the last tag: it or its value may continue in the next chunk
+        cut = buffer.rfind("<")
+        if cut <= 0:
+            continue
+        complete, buffer = buffer[:cut], buffer[cut:]
+        for token in ofx_tokens(complete):
+            yield token
+    for token in ofx_tokens(buffer):
+        yield token
+
+def ofx_tokens(text: str):
+    for match in OFX_TOKEN.finditer(text):
+        tag, value = match.group(1).strip(), match.group(2).strip()
+        if tag[:1] in ("?", "!") or tag.endswith("/"):
+            continue
+        if tag.startswith("/"):
+            yield "close", tag[1:].upper(), None
+        elif value:
+            yield "value", tag.upper(), html.unescape(value) if "&" in value else value
+        else:
+            yield "open", tag.upper(), None
+
+def parse_ofx_date(value: str) -> datetime:
+    """The calendar date of an OFX datetime such as 20240105120000.000[-5:EST]"""
+    if len(value) < 8 or not value[:8].isdigit():
+        raise ValueError(f"Invalid date: {value}")
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+def ofx_transaction(fields: Dict[str, str]) -> BankImportTransaction:
+    amount = float(fields.get("TRNAMT", "0").replace(",", "."))
+    return BankImportTransaction(
+        date=parse_ofx_date(fields.get("DTPOSTED", "")),
+        description=fields.get("NAME") or fields.get("MEMO", ""),
+        amount=amount,
+        transaction_type="Credit" if amount > 0 else "Debit",
+        reference_number=fields.get("REFNUM") or fields.get("FITID", ""),
+        check_number=fields.get("CHECKNUM", ""),
+        category=fields.get("MEMO", ""),
+        fitid=fields.get("FITID")
+    )
+
+def ofx_statement_info(fields: Dict[str, Any]) -> BankStatementInfo:
+    info = {
+        "bank_id": fields.get("BANKID") or fields.get("BROKERID"),
+        "account_number": fields.get("ACCTID"),
+        "account_type": fields.get("ACCTTYPE") or ("CREDITCARD" if fields["kind"] == "CCSTMTRS" else None),
+        "currency": fields.get("CURDEF"),
+        "start_date": parse_ofx_date(fields["DTSTART"]) if fields.get("DTSTART") else None,
+        "end_date": parse_ofx_date(fields["DTEND"]) if fields.get("DTEND") else None
+    }
+    for name in OFX_BALANCE_AGGREGATES.values():
+        balance = fields.get(name, {})
+        info[name] = float(balance["BALAMT"].replace(",", ".")) if balance.get("BALAMT") else None
+        info[f"{name}_date"] = parse_ofx_date(balance["DTASOF"]) if balance.get("DTASOF") else None
+    return BankStatementInfo(**info)
+
+async def iter_ofx_statement(file: UploadFile, statements: List[BankStatementInfo]):
+    """Yield (number, transaction, error) as each <STMTTRN> closes.
+    
+    Statement headers (account ids, period, balances) are appended to
+    statements as their aggregates close.
+    """
+    stack, transaction, nested, statement, number = [], None, None, None, 0
+    async for kind, tag, value in iter_ofx_tokens(file):
+        if kind == "open":
+            stack.append(tag)
+            if tag == "STMTTRN":
+                transaction, nested = {}, {}
+            elif tag in OFX_STATEMENT_AGGREGATES:
+                statement = {"kind": tag}
+        elif kind == "value":
+            parent = stack[-1] if stack else None
+            if transaction is not None:
+                # Nested aggregates (PAYEE, CURRENCY) only fill fields the transaction lacks
+                (transaction if parent == "STMTTRN" else nested).setdefault(tag, value)
+            elif statement is None:
+                continue
+            elif parent in OFX_BALANCE_AGGREGATES:
+                statement.setdefault(OFX_BALANCE_AGGREGATES[parent], {})[tag] = value
+            else:
+                statement.setdefault(tag, value)
+        elif tag in stack:
+            # SGML may leave aggregates unclosed; closing an outer one closes them too
+            while stack.pop() != tag:
+                pass
+            if tag == "STMTTRN" and transaction is not None:
+                number += 1
+                transaction = {**nested, **transaction}
+                try:
+                    yield number, ofx_transaction(transaction), None
+                except ValueError as e:
+                    yield number, None, f"Transaction {transaction.get('FITID', number)}: {e}"
+                transaction = None
+            elif tag in OFX_STATEMENT_AGGREGATES and statement is not None:
+                try:
+                    statements.append(ofx_statement_info(statement))
+                except ValueError as e:
+                    yield number, None, f"Statement {statement.get('ACCTID', '')}: {e}"
+                statement = None
+
 # Bank Import endpoints
 @api_router.post("/bank-import/csv/{account_id}")
 async def import_csv_bank_statement(account_id: str, file: UploadFile = File(...)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
-    try:
-        # Read CSV content
-        contents = await file.read()
-        content_str = contents.decode('utf-8')
-        
-        # Parse CSV
-        csv_reader = csv.DictReader(io.StringIO(content_str))
-        transactions = []
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, 1):
-            try:
-                # Common CSV field mappings - flexible field detection
-                date_fields = ['Date', 'Transaction Date', 'date', 'transaction_date']
-                desc_fields = ['Description', 'Memo', 'description', 'memo', 'payee']
-                amount_fields = ['Amount', 'amount', 'debit', 'credit']
-                
-                date_str = None
-                description = None
-                amount = None
-                
-                # Find date field
-                for field in date_fields:
-                    if field in row and row[field]:
-                        date_str = row[field]
-                        break
-                
-                # Find description field  
-                for field in desc_fields:
-                    if field in row and row[field]:
-                        description = row[field]
-                        break
-                
-                # Find amount field
-                for field in amount_fields:
-                    if field in row and row[field]:
-                        amount_str = row[field].replace('$', '').replace(',', '')
-                        amount = float(amount_str)
-                        break
-                
-                if not all([date_str, description, amount is not None]):
-                    errors.append(f"Row {row_num}: Missing required fields")
-                    continue
-                
-                # Parse date
-                try:
-                    transaction_date = datetime.strptime(date_str, '%m/%d/%Y')
-                except:
-                    try:
-                        transaction_date = datetime.strptime(date_str, '%Y-%m-%d')
-                    except:
-                        errors.append(f"Row {row_num}: Invalid date format")
-                        continue
-                
-                transaction_type = "Credit" if amount > 0 else "Debit"
-                
-                transactions.append(BankImportTransaction(
-                    date=transaction_date,
-                    description=description,
-                    amount=amount,
-                    transaction_type=transaction_type,
-                    reference_number=row.get('Reference', ''),
-                    check_number=row.get('Check Number', ''),
-                    category=row.get('Category', ''),
-                    balance=float(row.get('Balance', 0)) if row.get('Balance') else None
-                ))
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-        
-        # Preview mode - return first 10 transactions for user review
-        result = BankImportResult(
-            total_transactions=len(transactions),
-            imported_transactions=0,  # Will be set when actually imported
-            duplicate_transactions=0,
-            errors=errors,
-            preview_transactions=transactions[:10]
-        )
-        
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing CSV file: {str(e)}")
+    # Preview mode - rows are staged and the first ones returned for user review
+    rows = (
+        (row_num, transaction, f"Row {row_num}: {error}" if error else None)
+        async for row_num, transaction, error in iter_bank_csv(file)
+    )
+    return await stage_bank_import(account_id, file.filename, "csv", rows)
 
 @api_router.post("/bank-import/qfx/{account_id}")
 async def import_qfx_bank_statement(account_id: str, file: UploadFile = File(...)):
     if not file.filename.lower().endswith(('.qfx', '.ofx')):
         raise HTTPException(status_code=400, detail="File must be QFX or OFX format")
     
-    try:
-        # Read QFX/OFX content
-        contents = await file.read()
-        content_str = contents.decode('utf-8')
-        
-        transactions = []
-        errors = []
-        
-        # Parse OFX/QFX format (simplified parsing)
-        lines = content_str.split('\n')
-        current_transaction = {}
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('<STMTTRN>'):
-                current_transaction = {}
-            elif line.startswith('</STMTTRN>'):
-                if current_transaction:
-                    try:
-                        # Parse transaction date
-                        date_str = current_transaction.get('DTPOSTED', '')
-                        if len(date_str) >= 8:
-                            transaction_date = datetime.strptime(date_str[:8], '%Y%m%d')
-                        else:
-                            raise ValueError("Invalid date")
-                        
-                        amount = float(current_transaction.get('TRNAMT', 0))
-                        description = current_transaction.get('NAME', '') or current_transaction.get('MEMO', '')
-                        
-                        transaction_type = "Credit" if amount > 0 else "Debit"
-                        
-                        transactions.append(BankImportTransaction(
-                            date=transaction_date,
-                            description=description,
-                            amount=amount,
-                            transaction_type=transaction_type,
-                            reference_number=current_transaction.get('FITID', ''),
-                            check_number=current_transaction.get('CHECKNUM', ''),
-                            category=current_transaction.get('MEMO', '')
-                        ))
-                    except Exception as e:
-                        errors.append(f"Error parsing transaction: {str(e)}")
-            else:
-                # Parse individual fields
-                if '<' in line and '>' in line:
-                    start = line.find('<') + 1
-                    end = line.find('>')
-                    if start < end:
-                        field_name = line[start:end]
-                        field_value = line[end+1:].strip()
-                        if field_value and not field_value.startswith('<'):
-                            current_transaction[field_name] = field_value
+    statements = []
+    return await stage_bank_import(
+        account_id, file.filename, "ofx", iter_ofx_statement(file, statements), statements
+    )
+
+# Import dedupe: every imported row carries a fingerprint, unique per account,
+# and a content hash, so a whole batch is checked with one query instead of a
+# lookup per row. The content hash catches a statement imported once as CSV and
+# again as OFX/QFX, where only one of the two copies has the bank's FITID.
+BANK_IMPORT_BATCH_SIZE = 5000
+
+def bank_content_hash(date: datetime, amount: float, description: str) -> str:
+    """Hash of a bank row's normalized date, amount and description"""
+    content = f"{date:%Y-%m-%d}|{amount:.2f}|{' '.join((description or '').lower().split())}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def bank_import_fingerprint(date: datetime, amount: float, description: str, fitid: Optional[str] = None) -> str:
+    """The bank's FITID when it sent one, otherwise the row's content hash"""
+    if fitid:
+        return f"fitid:{fitid.strip()}"
+    return "hash:" + bank_content_hash(date, amount, description)
+
+async def import_bank_transactions(account_id: str, transactions: List[BankImportTransaction]) -> Dict[str, Any]:
+    """Insert the rows not already imported for this account; returns imported/duplicate counts and errors.
+    
+    A row is a duplicate when its fingerprint is taken, or when its content
+    matches a stored row and at most one of the two has a FITID. Two rows with
+    different FITIDs are distinct bank transactions, so each stored row
+    without a FITID absorbs at most one FITID row.
+    """
+    # Rows stored before content hashes existed would otherwise never match
+    if await db.bank_transactions.find_one({"account_id": account_id, "content_hash": None}, {"_id": 1}):
+        await backfill_bank_fingerprints(account_id)
+    
+    imported, duplicates, errors = 0, 0, []
+    for start in range(0, len(transactions), BANK_IMPORT_BATCH_SIZE):
+        rows = [
+            (
+                bank_import_fingerprint(transaction.date, transaction.amount, transaction.description, transaction.fitid),
+                bank_content_hash(transaction.date, transaction.amount, transaction.description),
+                transaction
+            )
+            for transaction in transactions[start:start + BANK_IMPORT_BATCH_SIZE]
+        ]
         
-        result = BankImportResult(
-            total_transactions=len(transactions),
-            imported_transactions=0,
-            duplicate_transactions=0,
-            errors=errors,
-            preview_transactions=transactions[:10]
-        )
+        fingerprints, all_hashes, hashes_without_fitid = set(), set(), {}
+        async for existing in db.bank_transactions.find(
+            {"account_id": account_id, "$or": [
+                {"fingerprint": {"$in": [fingerprint for fingerprint, _, _ in rows]}},
+                {"content_hash": {"$in": [content_hash for _, content_hash, _ in rows]}}
+            ]},
+            projection(["fingerprint", "content_hash", "bank_transaction_id"])
+        ):
+            fingerprints.add(existing.get("fingerprint"))
+            all_hashes.add(existing.get("content_hash"))
+            if not existing.get("bank_transaction_id"):
+                content_hash = existing.get("content_hash")
+                hashes_without_fitid[content_hash] = hashes_without_fitid.get(content_hash, 0) + 1
         
-        return result
+        documents = []
+        for fingerprint, content_hash, transaction in rows:
+            if fingerprint in fingerprints:
+                duplicates += 1
+                continue
+            if transaction.fitid:
+                if hashes_without_fitid.get(content_hash):
+                    hashes_without_fitid[content_hash] -= 1
+                    duplicates += 1
+                    continue
+            elif content_hash in all_hashes:
+                duplicates += 1
+                continue
+            fingerprints.add(fingerprint)
+            all_hashes.add(content_hash)
+            if not transaction.fitid:
+                hashes_without_fitid[content_hash] = hashes_without_fitid.get(content_hash, 0) + 1
+            documents.append(BankTransaction(
+                account_id=account_id,
+                date=transaction.date,
+                description=transaction.description,
+                amount=transaction.amount,
+                transaction_type=transaction.transaction_type,
+                reference_number=transaction.reference_number,
+                check_number=transaction.check_number,
+                memo=transaction.category,
+                bank_transaction_id=transaction.fitid,
+                fingerprint=fingerprint,
+                content_hash=content_hash
+            ).dict())
+        if not documents:
+            continue
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing QFX/OFX file: {str(e)}")
+        try:
+            result = await db.bank_transactions.insert_many(documents, ordered=False)
+            imported += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # A concurrent import of the same rows loses the race on the unique index
+            write_errors = e.details.get("writeErrors", [])
+            imported += e.details.get("nInserted", 0)
+            duplicates += sum(1 for error in write_errors if error.get("code") == 11000)
+            errors.extend(
+                f"Error importing transaction: {error.get('errmsg')}" for error in write_errors if error.get("code") != 11000
+            )
+    return {"imported_transactions": imported, "duplicate_transactions": duplicates, "errors": errors}
+
+async def backfill_bank_fingerprints(account_id: Optional[str] = None) -> Dict[str, Any]:
+    """Fingerprint and content-hash bank transactions stored before either existed.
+    
+    Rows that duplicate an already fingerprinted row keep no fingerprint, as
+    the unique index would reject a second copy; they still get a content
+    hash, so later imports recognise them.
+    """
+    hashed, fingerprinted, skipped, batch = 0, 0, 0, []
+    
+    async def flush():
+        nonlocal skipped
+        try:
+            await db.bank_transactions.bulk_write(batch, ordered=False)
+        except BulkWriteError as e:
+            # Only fingerprint updates can collide on the unique index
+            skipped += len(e.details.get("writeErrors", []))
+        batch.clear()
+    
+    query = {"content_hash": None}
+    if account_id:
+        query["account_id"] = account_id
+    async for doc in db.bank_transactions.find(
+        query, projection(["id", "date", "amount", "description", "bank_transaction_id", "fingerprint"])
+    ).batch_size(EXPORT_BATCH_SIZE):
+        content_hash = bank_content_hash(doc["date"], doc["amount"], doc["description"])
+        batch.append(UpdateOne({"id": doc["id"]}, {"$set": {"content_hash": content_hash}}))
+        hashed += 1
+        if not doc.get("fingerprint"):
+            fingerprint = bank_import_fingerprint(doc["date"], doc["amount"], doc["description"], doc.get("bank_transaction_id"))
+            batch.append(UpdateOne({"id": doc["id"]}, {"$set": {"fingerprint": fingerprint}}))
+            fingerprinted += 1
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return {
+        "content_hashed": hashed,
+        "fingerprinted": fingerprinted - skipped,
+        "duplicates_left_unfingerprinted": skipped
+    }
 
-@api_router.post("/bank-import/confirm/{account_id}")
-async def confirm_bank_import(account_id: str, transactions: List[BankImportTransaction]):
+# Import sessions: an upload is parsed once and its rows staged server-side, so
+# confirmation names the session instead of sending every row back. Staged rows
+# and sessions expire through TTL indexes.
+BANK_IMPORT_SESSION_TTL_HOURS = float(os.environ.get("BANK_IMPORT_SESSION_TTL_HOURS", "24"))
+# A confirmation refreshes its claim after every batch; one silent for this long
+# is presumed dead and the session can be confirmed again. Fingerprint dedupe
+# makes re-running the rows it already imported safe.
+BANK_IMPORT_CLAIM_TIMEOUT_SECONDS = float(os.environ.get("BANK_IMPORT_CLAIM_TIMEOUT_SECONDS", "300"))
+
+async def stage_bank_import(account_id: str, filename: str, file_format: str, rows, statements=None) -> BankImportResult:
+    """Stage parsed (number, transaction, error) rows under a new import session"""
+    session = BankImportSession(
+        account_id=account_id,
+        filename=filename,
+        file_format=file_format,
+        expires_at=datetime.utcnow() + timedelta(hours=BANK_IMPORT_SESSION_TTL_HOURS)
+    )
+    total, preview, errors, error_count, staged = 0, [], [], 0, []
+    
+    async def flush():
+        await db.bank_import_rows.insert_many(staged, ordered=False)
+        staged.clear()
+    
     try:
-        imported_count = 0
-        duplicate_count = 0
-        errors = []
-        
-        for transaction in transactions:
-            try:
-                # Check for duplicates based on date, amount, and description
-                existing = await db.bank_transactions.find_one({
-                    "account_id": account_id,
-                    "date": transaction.date,
-                    "amount": transaction.amount,
-                    "description": transaction.description
-                })
-                
-                if existing:
-                    duplicate_count += 1
-                    continue
-                
-                # Create bank transaction
-                bank_transaction = BankTransaction(
-                    account_id=account_id,
-                    date=transaction.date,
-                    description=transaction.description,
-                    amount=transaction.amount,
-                    transaction_type=transaction.transaction_type,
-                    reference_number=transaction.reference_number,
-                    check_number=transaction.check_number,
-                    memo=transaction.category
-                )
-                
-                await db.bank_transactions.insert_one(bank_transaction.dict())
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Error importing transaction: {str(e)}")
-        
-        return {
-            "imported_transactions": imported_count,
-            "duplicate_transactions": duplicate_count,
-            "errors": errors,
-            "message": f"Successfully imported {imported_count} transactions"
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error importing transactions: {str(e)}")
+        async for _, transaction, error in rows:
+            if error:
+                error_count += 1
+                if len(errors) < BANK_IMPORT_MAX_ERRORS:
+                    errors.append(error)
+                continue
+            if len(preview) < BANK_IMPORT_PREVIEW_SIZE:
+                preview.append(transaction)
+            staged.append({
+                **transaction.dict(),
+                "session_id": session.id,
+                "seq": total,
+                "expires_at": session.expires_at
+            })
+            total += 1
+            if len(staged) >= BANK_IMPORT_BATCH_SIZE:
+                await flush()
+        if staged:
+            await flush()
+    except BaseException:
+        await db.bank_import_rows.delete_many({"session_id": session.id})
+        raise
+    if error_count > len(errors):
+        errors.append(f"...and {error_count - len(errors)} more errors")
+    
+    session.total_transactions = total
+    session.errors = errors
+    session.statements = statements or []
+    await db.bank_import_sessions.insert_one(session.dict())
+    
+    return BankImportResult(
+        session_id=session.id,
+        total_transactions=total,
+        imported_transactions=0,  # Will be set when the session is confirmed
+        duplicate_transactions=0,
+        errors=errors,
+        preview_transactions=preview,
+        statements=session.statements
+    )
+
+async def confirm_import_session(account_id: str, session_id: str) -> Dict[str, Any]:
+    """Import a staged session's rows in batches and close the session"""
+    claimed_at = datetime.utcnow()
+    session = await db.bank_import_sessions.find_one_and_update(
+        {"id": session_id, "$or": [
+            {"status": "Staged"},
+            {"status": "Confirming", "claimed_at": {
+                "$lt": claimed_at - timedelta(seconds=BANK_IMPORT_CLAIM_TIMEOUT_SECONDS)
+            }}
+        ]},
+        {"$set": {"status": "Confirming", "claimed_at": claimed_at}},
+        projection=projection(["id", "account_id"])
+    )
+    if not session:
+        existing = await db.bank_import_sessions.find_one({"id": session_id}, projection(["status"]))
+        if not existing:
+            raise HTTPException(status_code=404, detail="Import session not found or expired")
+        raise HTTPException(status_code=409, detail=f"Import session is already {existing['status'].lower()}")
+    claim = {"id": session_id, "status": "Confirming", "claimed_at": claimed_at}
+    if session["account_id"] != account_id:
+        await db.bank_import_sessions.update_one(claim, {"$set": {"status": "Staged", "claimed_at": None}})
+        raise HTTPException(status_code=400, detail="Import session belongs to a different account")
+    
+    totals = {"imported_transactions": 0, "duplicate_transactions": 0, "errors": []}
+    
+    async def import_batch(batch):
+        nonlocal claim
+        result = await import_bank_transactions(account_id, batch)
+        totals["imported_transactions"] += result["imported_transactions"]
+        totals["duplicate_transactions"] += result["duplicate_transactions"]
+        totals["errors"].extend(result["errors"])
+        # Refresh the claim so a long import is not mistaken for a dead one
+        heartbeat = datetime.utcnow()
+        refreshed = await db.bank_import_sessions.update_one(claim, {"$set": {"claimed_at": heartbeat}})
+        if not refreshed.matched_count:
+            raise HTTPException(status_code=409, detail="Import session was taken over by another confirmation")
+        claim = {**claim, "claimed_at": heartbeat}
+    
+    try:
+        # Staged rows were validated when the file was parsed
+        batch = []
+        async for row in db.bank_import_rows.find(
+            {"session_id": session_id}, {"_id": 0, "session_id": 0, "seq": 0, "expires_at": 0}
+        ).sort("seq", 1).batch_size(BANK_IMPORT_BATCH_SIZE):
+            batch.append(BankImportTransaction.model_construct(**row))
+            if len(batch) >= BANK_IMPORT_BATCH_SIZE:
+                await import_batch(batch)
+                batch = []
+        if batch:
+            await import_batch(batch)
+    except BaseException:
+        await db.bank_import_sessions.update_one(claim, {"$set": {"status": "Staged", "claimed_at": None}})
+        raise
+    
+    confirmed = await db.bank_import_sessions.update_one(
+        claim,
+        {"$set": {
+            "status": "Confirmed",
+            "imported_transactions": totals["imported_transactions"],
+            "duplicate_transactions": totals["duplicate_transactions"],
+            "confirmed_at": datetime.utcnow()
+        }}
+    )
+    if not confirmed.matched_count:
+        raise HTTPException(status_code=409, detail="Import session was taken over by another confirmation")
+    await db.bank_import_rows.delete_many({"session_id": session_id})
+    return totals
+
+@api_router.post("/bank-import/confirm/{account_id}")
+async def confirm_bank_import(
+    account_id: str,
+    transactions: Optional[List[BankImportTransaction]] = None,
+    session_id: Optional[str] = Query(None, description="Import session returned by the CSV/QFX upload")
+):
+    """Import a staged session, or an explicit list of transactions"""
+    if session_id:
+        result = await confirm_import_session(account_id, session_id)
+    elif transactions is not None:
+        try:
+            result = await import_bank_transactions(account_id, transactions)
+        except OperationFailure as e:
+            raise HTTPException(status_code=500, detail=f"Error importing transactions: {str(e)}")
+    else:
+        raise HTTPException(status_code=400, detail="Provide a session_id or a list of transactions")
+    
+    return {
+        **result,
+        "message": f"Successfully imported {result['imported_transactions']} transactions"
+    }
+
+@api_router.delete("/bank-import/sessions/{session_id}")
+async def discard_import_session(session_id: str):
+    """Drop an unconfirmed import session and its staged rows"""
+    result = await db.bank_import_sessions.delete_one({"id": session_id, "status": "Staged"})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="No staged import session with that id")
+    await db.bank_import_rows.delete_many({"session_id": session_id})
+    return {"message": "Import session discarded"}
 
 # Reconciliation Reports
 @api_router.get("/reports/reconciliation/{account_id}")
@@ -3164,13 +5449,8 @@ async def get_form_templates(template_type: Optional[str] = None):
     if template_type:
         query["template_type"] = template_type
     
-    templates = await db.form_templates.find(query).to_list(100)
-    result = []
-    for template in templates:
-        if "_id" in template:
-            del template["_id"]
-        result.append(FormTemplate(**template))
-    return result
+    templates = await db.form_templates.find(query, {"_id": 0}).to_list(100)
+    return model_list_response(FormTemplate, templates)
 
 @api_router.get("/form-templates/{template_id}", response_model=FormTemplate)
 async def get_form_template(template_id: str):
@@ -3237,13 +5517,8 @@ async def create_custom_field(field: CustomFieldCreate):
 @api_router.get("/custom-fields", response_model=List[CustomField])
 async def get_custom_fields():
     """Get all custom fields"""
-    fields = await db.custom_fields.find({}).to_list(100)
-    result = []
-    for field in fields:
-        if "_id" in field:
-            del field["_id"]
-        result.append(CustomField(**field))
-    return result
+    fields = await db.custom_fields.find({}, {"_id": 0}).to_list(100)
+    return model_list_response(CustomField, fields)
 
 @api_router.get("/custom-fields/{field_id}", response_model=CustomField)
 async def get_custom_field(field_id: str):
@@ -3351,13 +5626,8 @@ async def create_permission(permission: PermissionCreate):
 @api_router.get("/permissions", response_model=List[Permission])
 async def get_permissions():
     """Get all permissions"""
-    permissions = await db.permissions.find({}).to_list(100)
-    result = []
-    for permission in permissions:
-        if "_id" in permission:
-            del permission["_id"]
-        result.append(Permission(**permission))
-    return result
+    permissions = await db.permissions.find({}, {"_id": 0}).to_list(100)
+    return model_list_response(Permission, permissions)
 
 @api_router.post("/user-roles", response_model=UserRole)
 async def create_user_role(role: UserRoleCreate):
@@ -3370,13 +5640,8 @@ async def create_user_role(role: UserRoleCreate):
 @api_router.get("/user-roles", response_model=List[UserRole])
 async def get_user_roles():
     """Get all user roles"""
-    roles = await db.user_roles.find({}).to_list(100)
-    result = []
-    for role in roles:
-        if "_id" in role:
-            del role["_id"]
-        result.append(UserRole(**role))
-    return result
+    roles = await db.user_roles.find({}, {"_id": 0}).to_list(100)
+    return model_list_response(UserRole, roles)
 
 @api_router.get("/user-roles/{role_id}", response_model=UserRole)
 async def get_user_role(role_id: str):
@@ -3430,13 +5695,8 @@ async def create_user(user: UserCreate):
 @api_router.get("/users", response_model=List[User])
 async def get_users():
     """Get all users"""
-    users = await db.users.find({"active": True}).to_list(100)
-    result = []
-    for user in users:
-        if "_id" in user:
-            del user["_id"]
-        result.append(User(**user))
-    return result
+    users = await db.users.find({"active": True}, {"_id": 0}).to_list(100)
+    return model_list_response(User, users)
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
@@ -3564,13 +5824,8 @@ async def get_audit_logs(
     if action:
         query["action"] = action
     
-    logs = await db.audit_logs.find(query).sort("timestamp", -1).limit(limit).to_list(limit)
-    result = []
-    for log in logs:
-        if "_id" in log:
-            del log["_id"]
-        result.append(AuditLog(**log))
-    return result
+    logs = await db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    return model_list_response(AuditLog, logs)
 
 @api_router.get("/audit-log/{resource_type}/{resource_id}", response_model=List[AuditLog])
 async def get_resource_audit_logs(resource_type: str, resource_id: str):
@@ -3578,14 +5833,9 @@ async def get_resource_audit_logs(resource_type: str, resource_id: str):
     logs = await db.audit_logs.find({
         "resource_type": resource_type,
         "resource_id": resource_id
-    }).sort("timestamp", -1).to_list(100)
+    }, {"_id": 0}).sort("timestamp", -1).to_list(100)
     
-    result = []
-    for log in logs:
-        if "_id" in log:
-            del log["_id"]
-        result.append(AuditLog(**log))
-    return result
+    return model_list_response(AuditLog, logs)
 
 # Default Permissions Setup
 @api_router.post("/setup/default-permissions")
@@ -3770,10 +6020,12 @@ async def create_inventory_transaction(transaction: InventoryTransactionCreate):
 
 @api_router.get("/inventory-transactions", response_model=List[InventoryTransaction])
 async def get_inventory_transactions(
+    response: Response,
     item_id: Optional[str] = None,
     transaction_type: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    page: PageParams = Depends()
 ):
     """Get inventory transactions with optional filters"""
     filters = {}
@@ -3782,16 +6034,12 @@ async def get_inventory_transactions(
         filters["item_id"] = item_id
     if transaction_type:
         filters["transaction_type"] = transaction_type
-    if start_date:
-        filters["transaction_date"] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        if "transaction_date" in filters:
-            filters["transaction_date"]["$lte"] = datetime.fromisoformat(end_date)
-        else:
-            filters["transaction_date"] = {"$lte": datetime.fromisoformat(end_date)}
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        filters["transaction_date"] = date_range
     
-    transactions = await db.inventory_transactions.find(filters).sort("transaction_date", -1).to_list(None)
-    return [InventoryTransaction(**transaction) for transaction in transactions]
+    transactions = await find_page(db.inventory_transactions, filters, page, response, sort_field="transaction_date", model=InventoryTransaction)
+    return model_list_response(InventoryTransaction, transactions, response, fields=page.fields)
 
 # Inventory Adjustments
 @api_router.post("/inventory-adjustments", response_model=InventoryAdjustment)
@@ -3867,16 +6115,16 @@ async def get_inventory_adjustments(
         else:
             filters["adjustment_date"] = {"$lte": datetime.fromisoformat(end_date)}
     
-    adjustments = await db.inventory_adjustments.find(filters).sort("adjustment_date", -1).to_list(None)
-    return [InventoryAdjustment(**adjustment) for adjustment in adjustments]
+    adjustments = await db.inventory_adjustments.find(filters, {"_id": 0}).sort("adjustment_date", -1).to_list(None)
+    return model_list_response(InventoryAdjustment, adjustments)
 
 # Inventory Alerts
 @api_router.get("/inventory-alerts", response_model=List[InventoryAlert])
 async def get_inventory_alerts(is_active: bool = True):
     """Get inventory alerts"""
     filters = {"is_active": is_active} if is_active else {}
-    alerts = await db.inventory_alerts.find(filters).sort("created_at", -1).to_list(None)
-    return [InventoryAlert(**alert) for alert in alerts]
+    alerts = await db.inventory_alerts.find(filters, {"_id": 0}).sort("created_at", -1).to_list(None)
+    return model_list_response(InventoryAlert, alerts)
 
 @api_router.put("/inventory-alerts/{alert_id}/acknowledge")
 async def acknowledge_inventory_alert(alert_id: str, user_id: str):
@@ -3901,7 +6149,10 @@ async def acknowledge_inventory_alert(alert_id: str, user_id: str):
 @api_router.get("/reports/inventory-valuation")
 async def get_inventory_valuation_report():
     """Get inventory valuation report with different costing methods"""
-    items = await db.items.find({"item_type": "Inventory", "active": True}).to_list(None)
+    items = await db.items.find(
+        {"item_type": "Inventory", "active": True},
+        projection(["id", "name", "qty_on_hand", "costing_method"])
+    ).to_list(None)
     
     report_data = []
     for item in items:
@@ -3992,8 +6243,8 @@ async def get_pay_periods(is_closed: Optional[bool] = None):
     if is_closed is not None:
         filters["is_closed"] = is_closed
     
-    periods = await db.pay_periods.find(filters).sort("start_date", -1).to_list(None)
-    return [PayPeriod(**period) for period in periods]
+    periods = await db.pay_periods.find(filters, {"_id": 0}).sort("start_date", -1).to_list(None)
+    return model_list_response(PayPeriod, periods)
 
 @api_router.get("/pay-periods/{period_id}", response_model=PayPeriod)
 async def get_pay_period(period_id: str):
@@ -4045,10 +6296,12 @@ async def create_time_entry(entry: TimeEntryCreate):
 
 @api_router.get("/time-entries", response_model=List[TimeEntry])
 async def get_time_entries(
+    response: Response,
     employee_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status: Optional[TimeEntryStatus] = None
+    status: Optional[TimeEntryStatus] = None,
+    page: PageParams = Depends()
 ):
     """Get time entries with optional filters"""
     filters = {}
@@ -4057,16 +6310,12 @@ async def get_time_entries(
         filters["employee_id"] = employee_id
     if status:
         filters["status"] = status
-    if start_date:
-        filters["date"] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        if "date" in filters:
-            filters["date"]["$lte"] = datetime.fromisoformat(end_date)
-        else:
-            filters["date"] = {"$lte": datetime.fromisoformat(end_date)}
+    date_range = report_date_range(start_date, end_date)
+    if date_range:
+        filters["date"] = date_range
     
-    entries = await db.time_entries.find(filters).sort("date", -1).to_list(None)
-    return [TimeEntry(**entry) for entry in entries]
+    entries = await find_page(db.time_entries, filters, page, response, sort_field="date", model=TimeEntry)
+    return model_list_response(TimeEntry, entries, response, fields=page.fields)
 
 @api_router.put("/time-entries/{entry_id}")
 async def update_time_entry(entry_id: str, entry: TimeEntryCreate):
@@ -4177,8 +6426,8 @@ async def get_payroll_items(
     if status:
         filters["status"] = status
     
-    payroll_items = await db.payroll_items.find(filters).sort("created_at", -1).to_list(None)
-    return [PayrollItem(**item) for item in payroll_items]
+    payroll_items = await db.payroll_items.find(filters, {"_id": 0}).sort("created_at", -1).to_list(None)
+    return model_list_response(PayrollItem, payroll_items)
 
 @api_router.put("/payroll-items/{payroll_id}/process")
 async def process_payroll_item(payroll_id: str):
@@ -4280,8 +6529,8 @@ async def get_pay_stubs(
     if pay_period_id:
         filters["pay_period_id"] = pay_period_id
     
-    pay_stubs = await db.pay_stubs.find(filters).sort("pay_date", -1).to_list(None)
-    return [PayStub(**stub) for stub in pay_stubs]
+    pay_stubs = await db.pay_stubs.find(filters, {"_id": 0}).sort("pay_date", -1).to_list(None)
+    return model_list_response(PayStub, pay_stubs)
 
 @api_router.get("/pay-stubs/{stub_id}", response_model=PayStub)
 async def get_pay_stub(stub_id: str):
@@ -4312,8 +6561,8 @@ async def get_tax_rates(
     if state:
         filters["state"] = state
     
-    rates = await db.tax_rates.find(filters).sort("effective_date", -1).to_list(None)
-    return [TaxRate(**rate) for rate in rates]
+    rates = await db.tax_rates.find(filters, {"_id": 0}).sort("effective_date", -1).to_list(None)
+    return model_list_response(TaxRate, rates)
 
 # Payroll Reports
 @api_router.get("/reports/payroll-summary")
@@ -4380,6 +6629,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache", "X-Cache-Age"],
 )
 
 # Include the router in the main app
@@ -4391,6 +6641,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache", "X-Cache-Age"],
 )
 
 # Configure logging
@@ -4400,6 +6651,204 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Index bootstrap: every index the query patterns above depend on
+ID_LOOKUP_COLLECTIONS = [
+    "accounts", "customers", "vendors", "employees", "items", "classes", "locations", "terms",
+    "price_levels", "transactions", "journal_entries", "memorized_transactions", "todos", "roles",
+    "companies", "bank_transactions", "reconciliations", "form_templates", "custom_fields",
+    "permissions", "user_roles", "users", "inventory_transactions", "inventory_adjustments",
+    "inventory_alerts", "pay_periods", "time_entries", "payroll_items", "pay_stubs", "tax_rates",
+    "closed_periods", "bank_import_sessions"
+]
+
+INDEX_SPECS = [(name, [("id", 1)], {"unique": True}) for name in ID_LOOKUP_COLLECTIONS] + [
+    # Ledger and statements
+    ("journal_entries", [("account_id", 1), ("date", 1)], {}),
+    ("journal_entries", [("date", 1), ("id", 1)], {}),
+    ("account_balance_snapshots", [("period", 1), ("account_id", 1)], {"unique": True}),
+    ("closed_periods", [("status", 1), ("period_end", -1)], {}),
+    ("closed_periods", [("period", 1)],
+     {"unique": True, "partialFilterExpression": {"status": "Closed"}}),
+    ("transaction_idempotency_keys", [("key", 1)], {"unique": True}),
+    ("open_items", [("id", 1)], {"unique": True}),
+    ("ledger_cube", [(field, 1) for field in CUBE_KEY_FIELDS], {"unique": True}),
+    ("ledger_cube", [("month", 1), ("account_id", 1)], {}),
+    ("open_items", [("customer_id", 1), ("transaction_type", 1), ("due_date", 1)], {}),
+    ("open_items", [("vendor_id", 1), ("transaction_type", 1), ("due_date", 1)], {}),
+    ("open_items", [("transaction_type", 1), ("date", 1)], {}),
+    ("open_items", [("transaction_type", 1), ("due_date", 1), ("id", 1)], {}),
+    # Transactions
+    ("transactions", [("date", 1), ("id", 1)], {}),
+    ("transactions", [("created_at", -1)], {}),
+    ("transactions", [("transaction_type", 1), ("status", 1), ("due_date", 1)], {}),
+    ("transactions", [("customer_id", 1), ("date", 1)], {}),
+    ("transactions", [("vendor_id", 1), ("date", 1)], {}),
+    # Master data listings
+    ("accounts", [("active", 1), ("created_at", 1), ("id", 1)], {}),
+    ("accounts", [("detail_type", 1)], {}),
+    ("customers", [("active", 1), ("created_at", 1), ("id", 1)], {}),
+    ("vendors", [("active", 1), ("created_at", 1), ("id", 1)], {}),
+    ("items", [("active", 1), ("created_at", 1), ("id", 1)], {}),
+    ("employees", [("created_at", 1), ("id", 1)], {}),
+    # Global search: one weighted text index per collection plus prefix lookups
+    *[
+        (source["collection"], [(field, "text") for field in source["text_weights"]],
+         {"weights": source["text_weights"], "default_language": "none"})
+        for source in SEARCH_SOURCES.values()
+    ],
+    *[
+        (source["collection"], [(field, 1)], {})
+        for source in SEARCH_SOURCES.values()
+        for field in source["prefix_fields"]
+    ],
+    # Banking
+    ("bank_transactions", [("account_id", 1), ("date", 1), ("id", 1)], {}),
+    ("bank_transactions", [("account_id", 1), ("fingerprint", 1)],
+     {"unique": True, "partialFilterExpression": {"fingerprint": {"$type": "string"}}}),
+    ("bank_transactions", [("account_id", 1), ("content_hash", 1)], {}),
+    ("bank_transactions", [("matched_journal_entry_id", 1)],
+     {"unique": True, "partialFilterExpression": {"matched_journal_entry_id": {"$type": "string"}}}),
+    ("bank_import_rows", [("session_id", 1), ("seq", 1)], {}),
+    ("bank_import_rows", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("bank_import_sessions", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    # Users and sessions; expired sessions are removed by the TTL monitor
+    ("users", [("username", 1)], {"unique": True}),
+    ("user_sessions", [("session_token", 1)], {"unique": True}),
+    ("user_sessions", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("audit_logs", [("resource_type", 1), ("resource_id", 1), ("timestamp", -1)], {}),
+    ("audit_logs", [("user_id", 1), ("timestamp", -1)], {}),
+    ("audit_logs", [("timestamp", -1)], {}),
+    # Inventory and payroll
+    ("inventory_transactions", [("item_id", 1), ("transaction_date", -1)], {}),
+    ("inventory_transactions", [("transaction_type", 1), ("transaction_date", -1)], {}),
+    ("inventory_transactions", [("transaction_date", 1), ("id", 1)], {}),
+    ("inventory_alerts", [("item_id", 1), ("alert_type", 1), ("is_active", 1)], {}),
+    ("time_entries", [("date", 1), ("id", 1)], {}),
+    ("time_entries", [("employee_id", 1), ("date", -1)], {}),
+    ("payroll_items", [("employee_id", 1), ("pay_period_id", 1)], {}),
+    ("pay_stubs", [("employee_id", 1), ("pay_date", -1)], {}),
+]
+
+def index_name(keys: List[tuple]) -> str:
+    """The default name MongoDB gives an index on these keys"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def ensure_index_specs() -> Dict[str, Any]:
+    """Create every declared index, logging rather than failing on conflicts with existing data"""
+    created, failed = [], []
+    for collection, keys, options in INDEX_SPECS:
+        try:
+            await db[collection].create_index(keys, **options)
+            created.append(f"{collection}.{index_name(keys)}")
+        except OperationFailure as e:
+            logger.warning(f"Could not create index {collection}.{index_name(keys)}: {e}")
+            failed.append({"index": f"{collection}.{index_name(keys)}", "error": str(e)})
+    return {"ensured": len(created), "failed": failed}
+
+async def build_index_report() -> Dict[str, Any]:
+    """Compare declared indexes with the database: missing, undeclared and never-used ones"""
+    declared = {}
+    for collection, keys, _ in INDEX_SPECS:
+        declared.setdefault(collection, set()).add(index_name(keys))
+    
+    existing_collections = set(await db.list_collection_names())
+    missing, undeclared, unused = [], [], []
+    for collection in sorted(set(declared) | existing_collections):
+        existing = set()
+        if collection in existing_collections:
+            async for index in db[collection].list_indexes():
+                existing.add(index["name"])
+        missing.extend(f"{collection}.{name}" for name in sorted(declared.get(collection, set()) - existing))
+        undeclared.extend(
+            f"{collection}.{name}" for name in sorted(existing - declared.get(collection, set()) - {"_id_"})
+        )
+        
+        if collection not in existing_collections:
+            continue
+        try:
+            async for stats in db[collection].aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    unused.append({
+                        "index": f"{collection}.{stats['name']}",
+                        "tracking_since": stats["accesses"]["since"]
+                    })
+        except OperationFailure as e:
+            logger.warning(f"$indexStats unavailable for {collection}: {e}")
+    
+    return {
+        "missing": missing,
+        "undeclared": undeclared,
+        "unused_since_restart": unused
+    }
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the declared indexes so hot lookups never fall back to collection scans"""
+    result = await ensure_index_specs()
+    logger.info(f"Ensured {result['ensured']} indexes, {len(result['failed'])} failed")
+
+_ledger_watch_task = None
+
+@app.on_event("startup")
+async def start_ledger_watch():
+    """Follow other processes' ledger writes through change streams when the deployment has them"""
+    global _ledger_watch_task
+    if await supports_transactions():
+        _ledger_watch_task = asyncio.create_task(watch_ledger_changes())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if _ledger_watch_task:
+        _ledger_watch_task.cancel()
+    client.close()
+
+# Maintenance CLI: python server.py --help
+cli = typer.Typer(help="QBClone maintenance commands")
+
+@cli.callback()
+def cli_main():
+    """QBClone maintenance commands"""
+
+def run_maintenance(coroutine):
+    """Run a maintenance coroutine and print its JSON result"""
+    try:
+        result = asyncio.run(coroutine)
+    finally:
+        client.close()
+    typer.echo(json.dumps(result, indent=2, default=str))
+
+@cli.command("verify-balances")
+def verify_balances_command(
+    rebuild: bool = typer.Option(False, "--rebuild", help="Rewrite drifted balances from the journal")
+):
+    """Check stored account balances against the journal"""
+    run_maintenance(verify_account_balances(rebuild=rebuild))
+
+@cli.command("index-report")
+def index_report_command(
+    create: bool = typer.Option(False, "--create", help="Create missing indexes before reporting")
+):
+    """Report declared indexes that are missing and existing ones that are unused or undeclared"""
+    async def report():
+        if create:
+            await ensure_index_specs()
+        return await build_index_report()
+    run_maintenance(report())
+
+@cli.command("rebuild-open-items")
+def rebuild_open_items_command():
+    """Recreate the open_items collection from transactions"""
+    run_maintenance(rebuild_open_items())
+
+@cli.command("backfill-bank-fingerprints")
+def backfill_bank_fingerprints_command():
+    """Fingerprint and content-hash bank transactions imported before duplicate detection used them"""
+    run_maintenance(backfill_bank_fingerprints())
+
+@cli.command("rebuild-cube")
+def rebuild_cube_command():
+    """Recreate the ledger cube from transactions"""
+    run_maintenance(rebuild_ledger_cube())
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import io
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server  # noqa: E402
+
+
+class ChunkedBytesIO(io.BytesIO):
+    """A file that never returns more than chunk_size bytes per read"""
+    def __init__(self, data: bytes, chunk_size: int):
+        super().__init__(data)
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        return super().read(size)
+
+
+def upload(text: str, chunk_size: int = 7, encoding: str = "utf-8") -> UploadFile:
+    return UploadFile(file=ChunkedBytesIO(text.encode(encoding), chunk_size), filename="statement.csv")
+
+
+async def collect_records(file: UploadFile):
+    records = []
+    async for batch in server.iter_csv_records(file):
+        records.extend(batch)
+    return records
+
+
+async def collect_rows(file: UploadFile):
+    return [row async for row in server.iter_bank_csv(file)]
+
+
+class BankCsvParserTest(unittest.IsolatedAsyncioTestCase):
+    """Streaming bank CSV parsing with uploads read a few bytes at a time"""
+
+    async def test_quoted_multiline_field(self):
+        records = await collect_records(upload('Date,Description,Amount\n01/05/2024,"Rent\nJanuary, unit 4",-900.00\n'))
+        self.assertEqual(records, [
+            ["Date", "Description", "Amount"],
+            ["01/05/2024", "Rent\nJanuary, unit 4", "-900.00"]
+        ])
+
+    async def test_crlf_and_escaped_quotes(self):
+        records = await collect_records(upload('a,b\r\n"say ""hi""",2\r\n'))
+        self.assertEqual(records, [["a", "b"], ['say "hi"', "2"]])
+
+    async def test_byte_order_mark_is_dropped(self):
+        rows = await collect_rows(upload("\ufeffDate,Description,Amount\n2024-01-05,Coffee,-4.50\n", chunk_size=1))
+        self.assertEqual(len(rows), 1)
+        _, transaction, error = rows[0]
+        self.assertIsNone(error)
+        self.assertEqual(transaction.date, datetime(2024, 1, 5))
+        self.assertEqual(transaction.amount, -4.5)
+
+    async def test_last_line_without_newline(self):
+        records = await collect_records(upload("a,b\n1,2"))
+        self.assertEqual(records, [["a", "b"], ["1", "2"]])
+
+    async def test_blank_rows_are_skipped_without_numbering(self):
+        rows = await collect_rows(upload("Date,Description,Amount\n\n2024-01-05,Coffee,-4.50\n,,\n2024-01-06,Refund,2.00\n"))
+        self.assertEqual([(number, transaction.description) for number, transaction, _ in rows], [(1, "Coffee"), (2, "Refund")])
+
+    async def test_missing_header_column_is_rejected(self):
+        with self.assertRaises(HTTPException) as raised:
+            await collect_rows(upload("Date,Description\n2024-01-05,Coffee\n"))
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertIn("amount", raised.exception.detail)
+
+    async def test_missing_values_are_row_errors(self):
+        rows = await collect_rows(upload("Date,Description,Amount\n2024-01-05,,-4.50\n2024-01-06,Short\n2024-01-07,Ok,1\n"))
+        self.assertEqual([error for _, _, error in rows], ["Missing required fields", "Missing required fields", None])
+
+    async def test_debit_and_credit_columns(self):
+        rows = await collect_rows(upload(
+            "Date,Description,debit,credit\n"
+            "2024-01-05,Coffee,4.50,\n"
+            "2024-01-06,Fee,(3.00),\n"
+            "2024-01-07,Deposit,,100\n"
+        ))
+        self.assertEqual([transaction.amount for _, transaction, _ in rows], [-4.5, -3.0, 100.0])
+        self.assertEqual([transaction.transaction_type for _, transaction, _ in rows], ["Debit", "Debit", "Credit"])
+
+    async def test_non_utf8_upload_is_rejected(self):
+        with self.assertRaises(HTTPException) as raised:
+            await collect_records(upload("Date,Description,Amount\n2024-01-05,Café,1\n", encoding="latin-1"))
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+import io
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import UploadFile
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server  # noqa: E402
+
+
+class ChunkedBytesIO(io.BytesIO):
+    """A file that never returns more than chunk_size bytes per read"""
+    def __init__(self, data: bytes, chunk_size: int):
+        super().__init__(data)
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        return super().read(size)
+
+
+def upload(text: str, chunk_size: int = 5) -> UploadFile:
+    return UploadFile(file=ChunkedBytesIO(text.encode("utf-8"), chunk_size), filename="statement.qfx")
+
+
+async def parse(text: str, chunk_size: int = 5):
+    statements = []
+    rows = [row async for row in server.iter_ofx_statement(upload(text, chunk_size), statements)]
+    return rows, statements
+
+
+SGML_HEADER = "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nENCODING:USASCII\n\n"
+
+SGML_STATEMENT = SGML_HEADER + """<OFX>
+<BANKMSGSRSV1>
+<STMTTRNRS>
+<STMTRS>
+<CURDEF>USD
+<BANKACCTFROM>
+<BANKID>121000248
+<ACCTID>987654321
+<ACCTTYPE>CHECKING
+</BANKACCTFROM>
+<BANKTRANLIST>
+<DTSTART>20240101
+<DTEND>20240131
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240105120000.000[-5:EST]
+<TRNAMT>-4.50
+<FITID>A1
+<NAME>Coffee &amp; Co
+<MEMO>Card 1234
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CHECK
+<DTPOSTED>20240110
+<TRNAMT>-900.00
+<FITID>A2
+<CHECKNUM>1042
+<NAME>Landlord
+</STMTTRN>
+</BANKTRANLIST>
+<LEDGERBAL>
+<BALAMT>1234.56
+<DTASOF>20240131
+</LEDGERBAL>
+<AVAILBAL>
+<BALAMT>1200.00
+<DTASOF>20240131
+</AVAILBAL>
+</STMTRS>
+</STMTTRNRS>
+</BANKMSGSRSV1>
+</OFX>
+"""
+
+
+class BankOfxParserTest(unittest.IsolatedAsyncioTestCase):
+    """Streaming OFX/QFX parsing with uploads read a few bytes at a time"""
+
+    async def test_sgml_statement(self):
+        rows, statements = await parse(SGML_STATEMENT)
+        self.assertEqual([(number, error) for number, _, error in rows], [(1, None), (2, None)])
+        coffee, rent = rows[0][1], rows[1][1]
+        self.assertEqual(coffee.date, datetime(2024, 1, 5))
+        self.assertEqual(coffee.amount, -4.5)
+        self.assertEqual(coffee.description, "Coffee & Co")
+        self.assertEqual(coffee.fitid, "A1")
+        self.assertEqual(rent.check_number, "1042")
+        self.assertEqual(len(statements), 1)
+        statement = statements[0]
+        self.assertEqual(statement.bank_id, "121000248")
+        self.assertEqual(statement.account_number, "987654321")
+        self.assertEqual(statement.currency, "USD")
+        self.assertEqual(statement.end_date, datetime(2024, 1, 31))
+        self.assertEqual(statement.ledger_balance, 1234.56)
+        self.assertEqual(statement.available_balance, 1200.0)
+
+    async def test_single_line_sgml(self):
+        one_line = SGML_HEADER + "".join(line.strip() for line in SGML_STATEMENT[len(SGML_HEADER):].splitlines())
+        rows, statements = await parse(one_line)
+        self.assertEqual([transaction.fitid for _, transaction, _ in rows], ["A1", "A2"])
+        self.assertEqual(statements[0].ledger_balance, 1234.56)
+
+    async def test_tag_split_across_every_chunk_boundary(self):
+        expected, _ = await parse(SGML_STATEMENT, chunk_size=len(SGML_STATEMENT))
+        for chunk_size in (1, 2, 3, 7, 13):
+            rows, statements = await parse(SGML_STATEMENT, chunk_size=chunk_size)
+            self.assertEqual([t.dict() for _, t, _ in rows], [t.dict() for _, t, _ in expected], chunk_size)
+            self.assertEqual(statements[0].account_number, "987654321")
+
+    async def test_xml_statement(self):
+        xml = """<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="220"?>
+<OFX><CREDITCARDMSGSRSV1><CCSTMTTRNRS><CCSTMTRS>
+  <CURDEF>USD</CURDEF>
+  <CCACCTFROM><ACCTID>4111111111111111</ACCTID></CCACCTFROM>
+  <BANKTRANLIST>
+    <STMTTRN>
+      <TRNTYPE>DEBIT</TRNTYPE>
+      <DTPOSTED>20240203</DTPOSTED>
+      <TRNAMT>-25.00</TRNAMT>
+      <FITID>X1</FITID>
+      <NAME>Bookshop</NAME>
+    </STMTTRN>
+    <STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20240204</DTPOSTED><TRNAMT>10.00</TRNAMT><FITID>X2</FITID><NAME>Refund</NAME></STMTTRN>
+  </BANKTRANLIST>
+  <LEDGERBAL><BALAMT>-15.00</BALAMT><DTASOF>20240229</DTASOF></LEDGERBAL>
+</CCSTMTRS></CCSTMTTRNRS></CREDITCARDMSGSRSV1></OFX>
+"""
+        rows, statements = await parse(xml)
+        self.assertEqual([(t.fitid, t.amount, t.transaction_type) for _, t, _ in rows], [("X1", -25.0, "Debit"), ("X2", 10.0, "Credit")])
+        self.assertEqual(statements[0].account_number, "4111111111111111")
+        self.assertEqual(statements[0].account_type, "CREDITCARD")
+        self.assertEqual(statements[0].ledger_balance, -15.0)
+
+    async def test_payee_aggregate_does_not_override_transaction_fields(self):
+        text = SGML_HEADER + """<OFX><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<DTPOSTED>20240301
+<TRNAMT>-60.00
+<FITID>P1
+<PAYEE>
+<NAME>Electric Utility
+<ADDR1>1 Power St
+</PAYEE>
+<NAME>Utility bill
+</STMTTRN>
+</BANKTRANLIST></STMTRS></OFX>
+"""
+        rows, _ = await parse(text)
+        self.assertEqual(len(rows), 1)
+        _, transaction, error = rows[0]
+        self.assertIsNone(error)
+        self.assertEqual(transaction.description, "Utility bill")
+        self.assertEqual(transaction.fitid, "P1")
+
+    async def test_payee_aggregate_fills_a_missing_name(self):
+        text = SGML_HEADER + """<OFX><STMTRS><BANKTRANLIST>
+<STMTTRN><DTPOSTED>20240302<TRNAMT>-5.00<FITID>P2<PAYEE><NAME>Corner Shop<CITY>Springfield</PAYEE></STMTTRN>
+</BANKTRANLIST></STMTRS></OFX>
+"""
+        rows, _ = await parse(text)
+        self.assertEqual(rows[0][1].description, "Corner Shop")
+
+    async def test_unclosed_sgml_aggregate(self):
+        text = SGML_HEADER + """<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<BANKACCTFROM>
+<ACCTID>555
+<BANKTRANLIST>
+<STMTTRN>
+<DTPOSTED>20240401
+<TRNAMT>1.00
+<FITID>U1
+<NAME>Interest
+</STMTTRN>
+</BANKTRANLIST>
+</STMTRS>
+</STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+        rows, statements = await parse(text)
+        self.assertEqual([transaction.fitid for _, transaction, _ in rows], ["U1"])
+        self.assertEqual(statements[0].account_number, "555")
+
+    async def test_bad_transaction_is_reported_and_parsing_continues(self):
+        text = SGML_HEADER + """<OFX><STMTRS><BANKTRANLIST>
+<STMTTRN><DTPOSTED>garbage<TRNAMT>1.00<FITID>B1<NAME>Bad</STMTTRN>
+<STMTTRN><DTPOSTED>20240402<TRNAMT>2.00<FITID>B2<NAME>Good</STMTTRN>
+</BANKTRANLIST></STMTRS></OFX>
+"""
+        rows, _ = await parse(text)
+        self.assertIsNone(rows[0][1])
+        self.assertIn("B1", rows[0][2])
+        self.assertEqual(rows[1][1].fitid, "B2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,6 +16,8 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
   const [importFile, setImportFile] = useState(null);
   const [importPreview, setImportPreview] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [matchSuggestions, setMatchSuggestions] = useState(null);
+  const [selectedMatches, setSelectedMatches] = useState(new Set());
 
   const bankAccounts = accounts.filter(acc => 
     acc.detail_type === 'Checking' || 
@@ -24,6 +26,7 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
   );
 
   useEffect(() => {
+    setMatchSuggestions(null);
     if (selectedAccount) {
       fetchBankTransactions();
       fetchReconciliations();
@@ -78,8 +81,10 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
 
     setLoading(true);
     try {
-      await axios.post(`${API}/bank-import/confirm/${selectedAccount.id}`, 
-        importPreview.preview_transactions);
+      // The upload staged every parsed row server-side; confirm by session id
+      await axios.post(`${API}/bank-import/confirm/${selectedAccount.id}`, null, {
+        params: { session_id: importPreview.session_id }
+      });
       
       setImportPreview(null);
       setImportFile(null);
@@ -94,6 +99,15 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
     }
   };
 
+  const discardImport = () => {
+    if (importPreview?.session_id) {
+      axios.delete(`${API}/bank-import/sessions/${importPreview.session_id}`)
+        .catch(error => console.error('Error discarding import session:', error));
+    }
+    setImportPreview(null);
+    setImportFile(null);
+  };
+
   const startReconciliation = async (formData) => {
     setLoading(true);
     try {
@@ -133,6 +147,62 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
     }
   };
 
+  const findMatches = async () => {
+    setLoading(true);
+    try {
+      const response = await axios.get(`${API}/bank-transactions/match-suggestions`, {
+        params: { account_id: selectedAccount.id }
+      });
+      setMatchSuggestions(response.data);
+      // Pre-select the confident matches; weaker ones wait for review
+      setSelectedMatches(new Set(
+        response.data.suggestions.filter(s => s.score >= 80).map(s => s.bank_transaction_id)
+      ));
+    } catch (error) {
+      console.error('Error finding matches:', error);
+      alert('Error finding matches: ' + (error.response?.data?.detail || error.message));
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const toggleMatch = (bankTransactionId) => {
+    setSelectedMatches(prev => {
+      const next = new Set(prev);
+      if (next.has(bankTransactionId)) {
+        next.delete(bankTransactionId);
+      } else {
+        next.add(bankTransactionId);
+      }
+      return next;
+    });
+  };
+
+  const applyMatches = async () => {
+    const matches = matchSuggestions.suggestions
+      .filter(s => selectedMatches.has(s.bank_transaction_id))
+      .map(({ bank_transaction_id, journal_entry_id, transaction_id }) => ({
+        bank_transaction_id, journal_entry_id, transaction_id
+      }));
+    if (matches.length === 0) return;
+
+    setLoading(true);
+    try {
+      const response = await axios.post(`${API}/bank-transactions/apply-matches`, matches, {
+        params: { reconciliation_id: currentReconciliation?.id }
+      });
+      setMatchSuggestions(null);
+      setSelectedMatches(new Set());
+      fetchBankTransactions();
+      alert(response.data.message);
+    } catch (error) {
+      console.error('Error applying matches:', error);
+      alert('Error applying matches: ' + (error.response?.data?.detail || error.message));
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const completeReconciliation = async () => {
     if (!currentReconciliation) return;
 
@@ -455,6 +525,82 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
               </div>
             )}
 
+            <div>
+              <div className="flex justify-between items-center mb-3">
+                <h4 className="text-lg font-semibold text-gray-900">Auto-Match</h4>
+                <div className="space-x-2">
+                  <button
+                    onClick={findMatches}
+                    disabled={loading || !selectedAccount}
+                    className="px-4 py-2 bg-blue-600 text-white rounded-lg hover:bg-blue-700 transition-colors disabled:opacity-50"
+                  >
+                    Find Matches
+                  </button>
+                  {matchSuggestions && (
+                    <button
+                      onClick={applyMatches}
+                      disabled={loading || selectedMatches.size === 0}
+                      className="px-4 py-2 bg-green-600 text-white rounded-lg hover:bg-green-700 transition-colors disabled:opacity-50"
+                    >
+                      Apply {selectedMatches.size} Matches
+                    </button>
+                  )}
+                </div>
+              </div>
+
+              {matchSuggestions && (
+                <div className="space-y-2">
+                  <p className="text-sm text-gray-600">
+                    {matchSuggestions.matched} of {matchSuggestions.bank_lines} unreconciled bank lines have a suggested match
+                  </p>
+                  <div className="max-h-96 overflow-y-auto border border-gray-200 rounded-lg">
+                    <table className="w-full text-sm">
+                      <thead className="bg-gray-50">
+                        <tr>
+                          <th className="px-3 py-2"></th>
+                          <th className="px-3 py-2 text-left">Bank Line</th>
+                          <th className="px-3 py-2 text-left">Ledger Entry</th>
+                          <th className="px-3 py-2 text-right">Amount</th>
+                          <th className="px-3 py-2 text-right">Score</th>
+                        </tr>
+                      </thead>
+                      <tbody>
+                        {matchSuggestions.suggestions.map((suggestion) => (
+                          <tr key={suggestion.bank_transaction_id} className="border-t">
+                            <td className="px-3 py-2">
+                              <input
+                                type="checkbox"
+                                checked={selectedMatches.has(suggestion.bank_transaction_id)}
+                                onChange={() => toggleMatch(suggestion.bank_transaction_id)}
+                                className="h-4 w-4 text-blue-600"
+                              />
+                            </td>
+                            <td className="px-3 py-2">
+                              <div>{suggestion.bank.description}</div>
+                              <div className="text-xs text-gray-500">{new Date(suggestion.bank.date).toLocaleDateString()}</div>
+                            </td>
+                            <td className="px-3 py-2">
+                              <div>{suggestion.ledger.payee || suggestion.ledger.description}</div>
+                              <div className="text-xs text-gray-500">
+                                {new Date(suggestion.ledger.date).toLocaleDateString()}
+                                {suggestion.ledger.transaction_number && ` - #${suggestion.ledger.transaction_number}`}
+                              </div>
+                            </td>
+                            <td className={`px-3 py-2 text-right ${
+                              suggestion.bank.amount > 0 ? 'text-green-600' : 'text-red-600'
+                            }`}>
+                              ${Math.abs(suggestion.bank.amount).toLocaleString()}
+                            </td>
+                            <td className="px-3 py-2 text-right">{suggestion.score}</td>
+                          </tr>
+                        ))}
+                      </tbody>
+                    </table>
+                  </div>
+                </div>
+              )}
+            </div>
+
             <div>
               <h4 className="text-lg font-semibold text-gray-900 mb-3">Reconciliation History</h4>
               <div className="space-y-2">
@@ -648,10 +794,7 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
                 
                 <div className="flex justify-end space-x-3">
                   <button
-                    onClick={() => {
-                      setImportPreview(null);
-                      setImportFile(null);
-                    }}
+                    onClick={discardImport}
                     className="px-4 py-2 text-gray-700 border border-gray-300 rounded-lg hover:bg-gray-50"
                   >
                     Back
@@ -659,8 +802,7 @@ const BankingCenter = ({ accounts, transactions, onRefresh }) => {
                   <button
                     onClick={() => {
                       setShowImportModal(false);
-                      setImportPreview(null);
-                      setImportFile(null);
+                      discardImport();
                     }}
                     className="px-4 py-2 text-gray-700 border border-gray-300 rounded-lg hover:bg-gray-50"
                   >
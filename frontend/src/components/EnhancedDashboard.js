@@ -15,23 +15,49 @@ const EnhancedDashboard = ({ accounts, transactions, customers, vendors }) => {
   });
   const [isDragging, setIsDragging] = useState(false);
   const [draggedTile, setDraggedTile] = useState(null);
+  const [liveMetrics, setLiveMetrics] = useState(null);
 
   useEffect(() => {
     calculateDashboardMetrics();
-  }, [accounts, transactions]);
+  }, [accounts, transactions, liveMetrics]);
+
+  // Cash, A/R and A/P follow the server's live metrics feed once it is connected
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+
+    const source = new EventSource(`${API}/analytics/dashboard-stream`);
+    source.addEventListener('metrics', (event) => {
+      setLiveMetrics(JSON.parse(event.data).financial_metrics);
+    });
+    source.addEventListener('metrics-delta', (event) => {
+      const delta = JSON.parse(event.data);
+      if (delta.financial_metrics) {
+        // A delta only patches a full snapshot; ignore any that arrive before the first one
+        setLiveMetrics(prev => (prev ? { ...prev, ...delta.financial_metrics } : prev));
+      }
+    });
+
+    return () => source.close();
+  }, []);
 
   const calculateDashboardMetrics = () => {
     // Calculate various metrics from accounts and transactions
     const cashAccounts = accounts.filter(acc => 
       acc.detail_type === 'Checking' || acc.detail_type === 'Savings'
     );
-    const cashOnHand = cashAccounts.reduce((sum, acc) => sum + acc.balance, 0);
+    const cashOnHand = liveMetrics
+      ? liveMetrics.total_cash
+      : cashAccounts.reduce((sum, acc) => sum + acc.balance, 0);
 
     const arAccounts = accounts.filter(acc => acc.detail_type === 'Accounts Receivable');
-    const accountsReceivable = arAccounts.reduce((sum, acc) => sum + acc.balance, 0);
+    const accountsReceivable = liveMetrics
+      ? liveMetrics.total_ar
+      : arAccounts.reduce((sum, acc) => sum + acc.balance, 0);
 
     const apAccounts = accounts.filter(acc => acc.detail_type === 'Accounts Payable');
-    const accountsPayable = apAccounts.reduce((sum, acc) => sum + acc.balance, 0);
+    const accountsPayable = liveMetrics
+      ? liveMetrics.total_ap
+      : apAccounts.reduce((sum, acc) => sum + acc.balance, 0);
 
     const incomeAccounts = accounts.filter(acc => acc.account_type === 'Income');
     const totalIncome = incomeAccounts.reduce((sum, acc) => sum + acc.balance, 0);
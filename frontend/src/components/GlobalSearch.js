@@ -18,116 +18,64 @@ const GlobalSearch = ({ isOpen, onClose, onNavigate }) => {
   }, [isOpen]);
 
   useEffect(() => {
-    if (query.length >= 2) {
-      performSearch();
-    } else {
+    if (query.trim().length < 2) {
       setResults([]);
+      setLoading(false);
+      setSelectedIndex(-1);
+      return;
     }
+
+    // Debounce keystrokes and drop responses for queries the user has already typed past
+    const controller = new AbortController();
+    const timer = setTimeout(() => performSearch(query.trim(), controller.signal), 200);
     setSelectedIndex(-1);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
   }, [query]);
 
-  const performSearch = async () => {
-    setLoading(true);
-    try {
-      // Simulate search across different entities
-      const searchResults = [];
-
-      // Search customers
-      const customersResponse = await axios.get(`${API}/customers`);
-      const customers = customersResponse.data.filter(customer =>
-        customer.name.toLowerCase().includes(query.toLowerCase()) ||
-        (customer.company && customer.company.toLowerCase().includes(query.toLowerCase())) ||
-        (customer.email && customer.email.toLowerCase().includes(query.toLowerCase()))
-      );
-      
-      customers.forEach(customer => {
-        searchResults.push({
-          type: 'customer',
-          icon: '👥',
-          title: customer.name,
-          subtitle: customer.company || customer.email || 'Customer',
-          action: () => onNavigate('customers', customer.id),
-          data: customer
-        });
-      });
-
-      // Search vendors
-      const vendorsResponse = await axios.get(`${API}/vendors`);
-      const vendors = vendorsResponse.data.filter(vendor =>
-        vendor.name.toLowerCase().includes(query.toLowerCase()) ||
-        (vendor.company && vendor.company.toLowerCase().includes(query.toLowerCase()))
-      );
-      
-      vendors.forEach(vendor => {
-        searchResults.push({
-          type: 'vendor',
-          icon: '🏢',
-          title: vendor.name,
-          subtitle: vendor.company || 'Vendor',
-          action: () => onNavigate('vendors', vendor.id),
-          data: vendor
-        });
-      });
-
-      // Search accounts
-      const accountsResponse = await axios.get(`${API}/accounts`);
-      const accounts = accountsResponse.data.filter(account =>
-        account.name.toLowerCase().includes(query.toLowerCase()) ||
-        account.account_number?.includes(query)
-      );
-      
-      accounts.forEach(account => {
-        searchResults.push({
-          type: 'account',
-          icon: '💼',
-          title: account.name,
-          subtitle: `${account.account_type} - ${account.detail_type}`,
-          action: () => onNavigate('accounts', account.id),
-          data: account
-        });
-      });
+  const getResultIcon = (result) => {
+    switch (result.type) {
+      case 'customer': return '👥';
+      case 'vendor': return '🏢';
+      case 'account': return '💼';
+      case 'item': return '📦';
+      case 'transaction': return getTransactionIcon(result.transaction_type);
+      default: return '📄';
+    }
+  };
 
-      // Search transactions
-      const transactionsResponse = await axios.get(`${API}/transactions`);
-      const transactions = transactionsResponse.data.filter(transaction =>
-        transaction.reference_number?.toLowerCase().includes(query.toLowerCase()) ||
-        transaction.memo?.toLowerCase().includes(query.toLowerCase())
-      );
-      
-      transactions.forEach(transaction => {
-        searchResults.push({
-          type: 'transaction',
-          icon: getTransactionIcon(transaction.transaction_type),
-          title: `${transaction.transaction_type} #${transaction.reference_number}`,
-          subtitle: `$${transaction.total?.toLocaleString()} - ${new Date(transaction.date).toLocaleDateString()}`,
-          action: () => onNavigate(getTransactionPage(transaction.transaction_type), transaction.id),
-          data: transaction
-        });
-      });
+  const getResultPage = (result) => {
+    switch (result.type) {
+      case 'customer': return 'customers';
+      case 'vendor': return 'vendors';
+      case 'account': return 'accounts';
+      case 'item': return 'items';
+      case 'transaction': return getTransactionPage(result.transaction_type);
+      default: return 'dashboard';
+    }
+  };
 
-      // Search items
-      const itemsResponse = await axios.get(`${API}/items`);
-      const items = itemsResponse.data.filter(item =>
-        item.name.toLowerCase().includes(query.toLowerCase()) ||
-        (item.description && item.description.toLowerCase().includes(query.toLowerCase()))
-      );
-      
-      items.forEach(item => {
-        searchResults.push({
-          type: 'item',
-          icon: '📦',
-          title: item.name,
-          subtitle: item.description || `${item.item_type} - $${item.price}`,
-          action: () => onNavigate('items', item.id),
-          data: item
-        });
+  const performSearch = async (searchQuery, signal) => {
+    setLoading(true);
+    try {
+      const response = await axios.get(`${API}/search`, {
+        params: { q: searchQuery, limit: 10 },
+        signal
       });
 
-      setResults(searchResults.slice(0, 10)); // Limit to 10 results
+      setResults(response.data.results.map(result => ({
+        ...result,
+        icon: getResultIcon(result),
+        action: () => onNavigate(getResultPage(result), result.id),
+        data: result
+      })));
+      setLoading(false);
     } catch (error) {
+      if (axios.isCancel(error)) return;
       console.error('Search error:', error);
       setResults([]);
-    } finally {
       setLoading(false);
     }
   };
@@ -229,7 +177,7 @@ const GlobalSearch = ({ isOpen, onClose, onNavigate }) => {
             <div className="py-2">
               {results.map((result, index) => (
                 <div
-                  key={`${result.type}-${index}`}
+                  key={`${result.type}-${result.id}`}
                   onClick={() => handleResultClick(result)}
                   className={`px-4 py-3 cursor-pointer transition-colors ${
                     index === selectedIndex ? 'bg-blue-50' : 'hover:bg-gray-50'
@@ -10,6 +10,7 @@ const InteractiveDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [selectedWidget, setSelectedWidget] = useState(null);
   const [drillDownData, setDrillDownData] = useState(null);
+  const [drillDownCursor, setDrillDownCursor] = useState(null);
   const [customLayout, setCustomLayout] = useState([
     'financial-overview',
     'kpi-cards',
@@ -23,6 +24,30 @@ const InteractiveDashboard = () => {
     fetchDashboardData();
   }, []);
 
+  // Live updates: the server pushes metric deltas shortly after each ledger posting
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+
+    const source = new EventSource(`${API}/analytics/dashboard-stream`);
+    source.addEventListener('metrics', (event) => {
+      setDashboardMetrics(JSON.parse(event.data));
+    });
+    source.addEventListener('metrics-delta', (event) => {
+      const delta = JSON.parse(event.data);
+      setDashboardMetrics(prev => prev && {
+        ...prev,
+        financial_metrics: { ...prev.financial_metrics, ...delta.financial_metrics },
+        alerts: { ...prev.alerts, ...delta.alerts },
+        recent_activity: delta.recent_activity || prev.recent_activity
+      });
+      if (delta.financial_metrics) {
+        refreshKpiTrends();
+      }
+    });
+
+    return () => source.close();
+  }, []);
+
   const fetchDashboardData = async () => {
     setLoading(true);
     try {
@@ -40,38 +65,79 @@ const InteractiveDashboard = () => {
     }
   };
 
+  const refreshKpiTrends = async () => {
+    try {
+      const response = await axios.get(`${API}/analytics/kpi-trends?period=12months`);
+      setKpiTrends(response.data);
+    } catch (error) {
+      console.error('Error refreshing KPI trends:', error);
+    }
+  };
+
+  const DRILL_DOWN_PAGE_SIZE = 50;
+
+  const drillDownRows = (data) =>
+    (data && (data.transactions || data.invoices || data.bills || data.entries)) || [];
+
   const handleDrillDown = async (metric, period = 'current_month') => {
     try {
-      const response = await axios.get(`${API}/analytics/drill-down/${metric}?period=${period}`);
+      const response = await axios.get(`${API}/analytics/drill-down/${metric}`, {
+        params: { period, limit: DRILL_DOWN_PAGE_SIZE }
+      });
       setDrillDownData(response.data);
+      setDrillDownCursor(response.headers['x-next-cursor'] || null);
       setSelectedWidget(metric);
     } catch (error) {
       console.error('Error fetching drill-down data:', error);
     }
   };
 
+  // Totals arrive with the first page; further pages only append rows
+  const loadMoreDrillDown = async () => {
+    try {
+      const response = await axios.get(`${API}/analytics/drill-down/${selectedWidget}`, {
+        params: { period: drillDownData.period, limit: DRILL_DOWN_PAGE_SIZE, cursor: drillDownCursor }
+      });
+      const rowsKey = ['transactions', 'invoices', 'bills', 'entries'].find(key => response.data[key]);
+      setDrillDownData(prev => ({ ...prev, [rowsKey]: [...(prev[rowsKey] || []), ...response.data[rowsKey]] }));
+      setDrillDownCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching more drill-down data:', error);
+    }
+  };
+
   const closeDrillDown = () => {
     setSelectedWidget(null);
     setDrillDownData(null);
+    setDrillDownCursor(null);
   };
 
   const FinancialOverviewWidget = () => (
     <div className="bg-white rounded-lg shadow-sm border border-gray-200 p-6">
       <h3 className="text-lg font-semibold text-gray-900 mb-4">Financial Overview</h3>
       <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
-        <div className="text-center">
+        <div
+          className="text-center cursor-pointer hover:bg-gray-50 rounded-lg"
+          onClick={() => handleDrillDown('cash')}
+        >
           <div className="text-2xl font-bold text-blue-600">
             ${dashboardMetrics?.financial_metrics?.total_cash?.toLocaleString() || 0}
           </div>
           <div className="text-sm text-gray-600">Cash Position</div>
         </div>
-        <div className="text-center">
+        <div
+          className="text-center cursor-pointer hover:bg-gray-50 rounded-lg"
+          onClick={() => handleDrillDown('ar')}
+        >
           <div className="text-2xl font-bold text-green-600">
             ${dashboardMetrics?.financial_metrics?.total_ar?.toLocaleString() || 0}
           </div>
           <div className="text-sm text-gray-600">Accounts Receivable</div>
         </div>
-        <div className="text-center">
+        <div
+          className="text-center cursor-pointer hover:bg-gray-50 rounded-lg"
+          onClick={() => handleDrillDown('ap')}
+        >
           <div className="text-2xl font-bold text-red-600">
             ${dashboardMetrics?.financial_metrics?.total_ap?.toLocaleString() || 0}
           </div>
@@ -304,7 +370,10 @@ const InteractiveDashboard = () => {
           <h3 className="text-lg font-semibold text-gray-900">
             {selectedWidget === 'income' ? 'Income Details' :
              selectedWidget === 'expenses' ? 'Expense Details' :
-             selectedWidget === 'overdue_invoices' ? 'Overdue Invoices' : 'Details'}
+             selectedWidget === 'overdue_invoices' ? 'Overdue Invoices' :
+             selectedWidget === 'cash' ? 'Cash Activity' :
+             selectedWidget === 'ar' ? 'Open Invoices' :
+             selectedWidget === 'ap' ? 'Open Bills' : 'Details'}
           </h3>
           <button
             onClick={closeDrillDown}
@@ -323,7 +392,7 @@ const InteractiveDashboard = () => {
               <div className="text-sm text-gray-600">
                 Total {selectedWidget} for {drillDownData.period}
               </div>
-              {drillDownData.count && (
+              {drillDownData.count > 0 && (
                 <div className="text-sm text-gray-600">
                   {drillDownData.count} transactions
                 </div>
@@ -351,16 +420,16 @@ const InteractiveDashboard = () => {
                   </tr>
                 </thead>
                 <tbody className="bg-white divide-y divide-gray-200">
-                  {(drillDownData.transactions || drillDownData.invoices || []).map((item, index) => (
+                  {drillDownRows(drillDownData).map((item, index) => (
                     <tr key={index} className="hover:bg-gray-50">
                       <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">
-                        {item.type || item.invoice_number}
+                        {item.invoice_number || item.type || item.description}
                       </td>
                       <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-600">
                         {new Date(item.date || item.due_date).toLocaleDateString()}
                       </td>
                       <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900 text-right">
-                        ${(item.amount || item.balance).toLocaleString()}
+                        ${(item.balance ?? item.amount).toLocaleString()}
                       </td>
                       {selectedWidget === 'overdue_invoices' && (
                         <td className="px-6 py-4 whitespace-nowrap text-sm text-red-600 text-right">
@@ -372,6 +441,17 @@ const InteractiveDashboard = () => {
                 </tbody>
               </table>
             </div>
+
+            {drillDownCursor && (
+              <div className="text-center">
+                <button
+                  onClick={loadMoreDrillDown}
+                  className="px-4 py-2 text-sm text-blue-600 hover:text-blue-800"
+                >
+                  Showing {drillDownRows(drillDownData).length} of {drillDownData.count} - Load more
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>